@@ -0,0 +1,686 @@
+import os
+import re
+import sys
+import json
+import math
+import gzip
+import time
+import glob
+import zlib
+import random
+import logging
+import argparse
+import platform
+import threading
+import multiprocessing
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+import concurrent.futures
+from queue import Empty
+from urllib.parse import urljoin, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bs4 import BeautifulSoup
+from MyWebCrowler import parse_page, LXML_AVAILABLE, make_seen_set, SEEN_SETS, SearchIndex, ShardedSearch, ResultStore
+from MyWebCrowler import LinkGraph, NUMPY_AVAILABLE, WebCrawler, AsyncWebCrawler, AIOHTTP_AVAILABLE, sniff_charset
+from MyWebCrowler import PageBudget, StripedSeenSet, RESULT_BATCH_SIZE
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def make_page(links=300, headings=20, paragraphs=200):
+    parts = ["<html><head><title>Benchmark page</title></head><body>"]
+    for i in range(headings):
+        parts.append(f"<h1>Heading {i}</h1><h2>Sub heading {i}</h2>")
+    for i in range(paragraphs):
+        parts.append(f"<p>Paragraph {i} with some <b>bold</b> and <i>italic</i> news text.</p>")
+    for i in range(links):
+        parts.append(f'<a href="/article/{i}?ref=home">Article {i}</a>')
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def two_parse(html_content, url):
+    # The pipeline before parse_page: one tree for page info, another for links
+    soup = BeautifulSoup(html_content, 'html.parser')
+    page_info = {
+        'url': url,
+        'title': soup.title.string if soup.title else 'No Title',
+        'headings': {
+            'h1': [h.get_text(strip=True) for h in soup.find_all('h1')],
+            'h2': [h.get_text(strip=True) for h in soup.find_all('h2')]
+        },
+        'text_length': len(soup.get_text()),
+        'links_count': len(soup.find_all('a', href=True))
+    }
+    soup = BeautifulSoup(html_content, 'html.parser')
+    links = [urljoin(url, link['href']) for link in soup.find_all('a', href=True)]
+    return page_info, links
+
+
+def benchmark_parsers(rounds=50):
+    html_content = make_page()
+    url = "http://example.com/"
+    candidates = [('two-parse (old)', lambda: two_parse(html_content, url)),
+                  ('html.parser', lambda: parse_page(html_content, url, 'html.parser')),
+                  ('stream', lambda: parse_page(html_content, url, 'stream'))]
+    if LXML_AVAILABLE:
+        candidates.append(('lxml', lambda: parse_page(html_content, url, 'lxml')))
+
+    print(f"Page size: {len(html_content)} chars, rounds: {rounds}")
+    for name, run in candidates:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>16}: {rounds / elapsed:8.1f} pages/s")
+
+
+def peak_allocation(run, rounds):
+    # Mean peak of memory traced while one call runs, above what was allocated before it
+    peaks = []
+    tracemalloc.start()
+    for _ in range(rounds):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = run()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        del result
+    tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+def benchmark_page_allocations(rounds=20):
+    # Per-page allocations of the text path (response.text, then parse) against raw bytes with a sniffed charset
+    url = "http://example.com/"
+    page = make_page()
+    czech = page.replace("news text", "zprávy, Žluťoučký kůň úpěl ďábelské ódy")
+    bodies = [('ascii', page.encode('utf-8'), {'Content-Type': 'text/html; charset=utf-8'}),
+              ('utf-8', czech.encode('utf-8'), {'Content-Type': 'text/html'}),
+              ('windows-1250', czech.replace('<head>', '<head><meta charset="windows-1250">').encode('cp1250'),
+               {'Content-Type': 'text/html'})]
+    parsers = ['html.parser', 'stream'] + (['lxml'] if LXML_AVAILABLE else [])
+
+    for label, body, headers in bodies:
+        print(f"{label} page: {len(body)} bytes, rounds: {rounds}")
+        encoding = sniff_charset(headers, body)
+        for parser in parsers:
+            text = peak_allocation(lambda: parse_page(body.decode(encoding), url, parser), rounds)
+            raw = peak_allocation(lambda: parse_page(body, url, parser, encoding=encoding), rounds)
+            print(f"{parser:>16}: text {text / 1024:8.1f} KiB/page, bytes {raw / 1024:8.1f} KiB/page")
+    soup = BeautifulSoup(page, 'html.parser')
+    joined = peak_allocation(lambda: len(soup.get_text()), rounds)
+    counted = peak_allocation(lambda: sum(map(len, soup.strings)), rounds)
+    print(f"{'text_length':>16}: get_text {joined / 1024:8.1f} KiB/page, strings {counted / 1024:8.1f} KiB/page")
+
+
+def benchmark_seen_sets(sizes=(1000000, 10000000)):
+    for size in sizes:
+        urls = [f"https://www.site{i % 5000}.cz/clanek/{i}-titulek-clanku-o-necem" for i in range(size)]
+        unseen = [f"https://www.site{i % 5000}.cz/jiny/{i}" for i in range(100000)]
+        for kind in SEEN_SETS:
+            seen = make_seen_set(kind, capacity=size)
+            start = time.perf_counter()
+            seen.update(urls)
+            insert_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = sum(1 for url in urls if url in seen)
+            lookup_time = time.perf_counter() - start
+            false_positives = sum(1 for url in unseen if url in seen) / len(unseen)
+
+            print(f"{size:>9} URLs {kind:>7}: {seen.memory_usage() / 2 ** 20:8.1f} MiB, "
+                  f"{size / insert_time:10.0f} inserts/s, {size / lookup_time:10.0f} lookups/s, "
+                  f"found {found}, false positives {false_positives:.4%}")
+        del urls
+
+
+def locked_accounting(workers, limit, pages):
+    # The accounting before page budgets: one lock for the page count, taken by the loop guard, for the id and
+    # for the increment, one for the visited set, taken once per link, and one for the results, once per page
+    page_count_lock, visited_lock, results_lock = threading.Lock(), threading.Lock(), threading.Lock()
+    state = {'count': 0}
+    visited, results = make_seen_set('exact'), {}
+
+    def work(pages):
+        for url, links in pages:
+            with page_count_lock:
+                if state['count'] + workers / 4 >= limit:
+                    break
+            with visited_lock:
+                if url in visited:
+                    continue
+                visited.add(url)
+            new_links = []
+            for link in links:
+                with visited_lock:
+                    if link not in visited:
+                        new_links.append(link)
+            with page_count_lock:
+                page_info = {'id': state['count'], 'url': url, 'links_count': len(new_links)}
+            with page_count_lock:
+                state['count'] += 1
+            with results_lock:
+                results[url] = page_info
+    return work, results
+
+
+def budgeted_accounting(workers, limit, pages):
+    # PageBudget reservations, a striped visited set and per-worker result buffers merged in batches
+    budget, visited, results_lock = PageBudget(limit), StripedSeenSet('exact', limit * 4), threading.Lock()
+    results = {}
+
+    def merge(buffer):
+        with results_lock:
+            results.update(buffer)
+        buffer.clear()
+
+    def work(pages):
+        buffer = []
+        for url, links in pages:
+            if not budget.reserve(0):
+                break
+            try:
+                if not visited.add_new(url):
+                    continue
+                new_links = [link for link in links if link not in visited]
+                buffer.append((url, {'id': budget.next_id(), 'url': url, 'links_count': len(new_links)}))
+                budget.count()
+                if len(buffer) >= RESULT_BATCH_SIZE:
+                    merge(buffer)
+            finally:
+                budget.release()
+        merge(buffer)
+    return work, results
+
+
+def benchmark_accounting(thread_counts=(8, 64, 128), pages_per_thread=300, links=50):
+    # Lock contention of per-page bookkeeping alone: no fetching or parsing, so only the accounting is timed
+    print(f"{pages_per_thread} pages per thread, {links} links per page, limit 90% of the pages")
+    for threads in thread_counts:
+        limit = threads * pages_per_thread * 9 // 10
+        pages = [[(f"https://site{thread}.cz/page/{number}",
+                   [f"https://site{thread}.cz/page/{(number * 7 + link) % 1000}" for link in range(links)])
+                  for number in range(pages_per_thread)] for thread in range(threads)]
+        for name, accounting in (('locks (old)', locked_accounting), ('budget+stripes', budgeted_accounting)):
+            work, results = accounting(threads, limit, pages)
+            workers = [threading.Thread(target=work, args=(pages[thread],)) for thread in range(threads)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            ids = len({page_info['id'] for page_info in results.values()})
+            print(f"{threads:>4} threads {name:>15}: {len(results) / elapsed:9.0f} pages/s, "
+                  f"stored {len(results)} of {limit}, {ids} distinct ids")
+
+
+def load_corpus(pages=200):
+    # A recorded corpus is a directory of saved .html pages, set with CRAWLER_CORPUS
+    corpus_dir = os.environ.get('CRAWLER_CORPUS')
+    if corpus_dir:
+        corpus = []
+        for path in sorted(glob.glob(os.path.join(corpus_dir, '*.html')))[:pages]:
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                corpus.append(file.read())
+        return corpus
+    return [make_page(links=200 + i % 100, paragraphs=150 + i % 50) for i in range(pages)]
+
+
+def benchmark_parser_pool(fetch_threads=16):
+    corpus = load_corpus()
+    url = "http://example.com/"
+    print(f"Corpus: {len(corpus)} pages, {fetch_threads} fetch threads, {os.cpu_count()} cores")
+
+    def run(parse):
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=fetch_threads) as fetchers:
+            list(fetchers.map(parse, corpus))
+        return len(corpus) / (time.perf_counter() - start)
+
+    print(f"{'threads only':>16}: {run(lambda html: parse_page(html, url)):8.1f} pages/s")
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            pool.submit(parse_page, corpus[0], url).result()
+            speed = run(lambda html: pool.submit(parse_page, html, url).result())
+        print(f"{workers:>9} process: {speed:8.1f} pages/s")
+
+
+WORDS = ["python", "crawler", "news", "weather", "sport", "market", "science", "travel", "music", "health",
+         "election", "football", "recipe", "review", "guide", "report", "update", "history", "energy", "space"]
+
+
+def make_results(size):
+    results = {}
+    for i in range(size):
+        url = f"https://www.site{i % 5000}.cz/clanek/{i}"
+        results[url] = {'id': i, 'url': url,
+                        'title': f"{WORDS[i % 20].title()} {WORDS[i // 20 % 20]} article {i}",
+                        'headings': {'h1': [f"{WORDS[i // 400 % 20].title()} today"],
+                                     'h2': [f"More {WORDS[i // 8000 % 20]} {i % 1000}"]}}
+    return results
+
+
+def benchmark_search_index(size=1000000, queries=(("article 123456", ""), ("", "space today"),
+                                                  ("python crawler", "more music"), ("zzz", "")),
+                           rounds=5, goal=0.001, selective=1000):
+    # Best query time of several rounds against the latency goal. Queries with at most `selective` matches must
+    # meet it; larger answers are bounded by collecting the matches and are only reported
+    results = make_results(size)
+    index = SearchIndex()
+    start = time.perf_counter()
+    for page_info in results.values():
+        index.add(page_info)
+    print(f"Indexed {size} pages in {time.perf_counter() - start:.1f} s")
+
+    for title, header in queries:
+        start = time.perf_counter()
+        scan = [data['id'] for data in results.values()
+                if title.lower() in data['title'].lower()
+                and any(header.lower() in h.lower() for h in data['headings']['h1'] + data['headings']['h2'])]
+        scan_time = time.perf_counter() - start
+
+        index_time = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            matches = index.search(title, header)
+            index_time = min(index_time, time.perf_counter() - start)
+        assert [match[0] for match in matches] == scan
+        verdict = "ok" if index_time < goal else "over goal" if len(matches) > selective else "FAILED"
+        print(f"{title!r:>18} {header!r:>14}: {len(matches):7} matches, scan {scan_time * 1000:8.1f} ms, "
+              f"index {index_time * 1000:8.3f} ms ({verdict})")
+        assert verdict != "FAILED", f"{title!r} {header!r} took {index_time * 1000:.3f} ms, goal {goal * 1000:g} ms"
+
+
+def benchmark_sharded_search(size=1000000, rounds=5, queries=(("article 12345", ""), ("", "space today"),
+                                                                ("python", "more music"))):
+    results = make_results(size)
+    cores = os.cpu_count() or 1
+    print(f"{size} results, {cores} cores")
+    expected = [ShardedSearch(results).search(*query) for query in queries]
+    baseline = None
+    for workers in range(1, cores + 1):
+        search = ShardedSearch(results, num_shards=workers, workers=workers)
+        search.search(*queries[0])
+        start = time.perf_counter()
+        for _ in range(rounds):
+            found = [search.search(*query) for query in queries]
+        elapsed = (time.perf_counter() - start) / (rounds * len(queries))
+        search.close()
+        assert found == expected
+        baseline = baseline or elapsed
+        print(f"{workers:>3} workers: {elapsed * 1000:8.1f} ms/query, speedup {baseline / elapsed:4.1f}x")
+
+
+def crawled_pages(size):
+    # Fresh page-info dicts shaped like parse_page output, with realistic repetition across a site
+    for i in range(size):
+        url = f"https://www.site{i % 500}.cz/clanek/{i}-titulek-clanku"
+        yield url, {'id': i, 'url': url, 'title': f"{WORDS[i % 20].title()} {WORDS[i // 20 % 20]} article {i}",
+                    'headings': {'h1': [f"Site {i % 500} news"], 'h2': [f"{WORDS[j]} section" for j in range(i % 8)]},
+                    'text_length': 5000 + i % 3000, 'links_count': 100 + i % 200}
+
+
+def benchmark_result_store(size=200000):
+    for name, make in (('dict', dict), ('ResultStore', ResultStore)):
+        tracemalloc.start()
+        results = make()
+        for url, page_info in crawled_pages(size):
+            results[url] = page_info
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del results
+
+        # Timed again without tracemalloc, which slows allocation down
+        pages = list(crawled_pages(size))
+        results = make()
+        start = time.perf_counter()
+        for url, page_info in pages:
+            results[url] = page_info
+        insert_time = time.perf_counter() - start
+        start = time.perf_counter()
+        total = sum(page_info.get('text_length', 0) for page_info in results.values())
+        read_time = time.perf_counter() - start
+        print(f"{name:>12}: {memory / size:7.1f} bytes/page, {size / insert_time:9.0f} inserts/s, "
+              f"{size / read_time:9.0f} reads/s (total {total})")
+        del results, pages
+
+
+def benchmark_link_graph(pages=200000, links=50, iterations=20):
+    generator = random.Random(1)
+    urls = [f"https://www.site{i % 5000}.cz/clanek/{i}" for i in range(pages)]
+    graph = LinkGraph()
+    start = time.perf_counter()
+    for url in urls:
+        graph.add_page(url, [urls[generator.randrange(pages)] for _ in range(links)])
+    print(f"Recorded {graph.node_count} URLs, {graph.edge_count} links in {time.perf_counter() - start:.1f} s "
+          f"({(graph.targets.itemsize * graph.edge_count + 12 * len(graph.sources)) / 2 ** 20:.0f} MiB of CSR arrays)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("graph.bin", "graph.tsv"):
+            start = time.perf_counter()
+            graph.export(os.path.join(directory, name))
+            size = os.path.getsize(os.path.join(directory, name))
+            print(f"{name:>10} export: {time.perf_counter() - start:6.1f} s, {size / 2 ** 20:.0f} MiB")
+
+    backends = [True, False] if NUMPY_AVAILABLE else [False]
+    for use_numpy in backends:
+        with patch('MyWebCrowler.NUMPY_AVAILABLE', use_numpy):
+            start = time.perf_counter()
+            graph.in_degree()
+            degree_time = time.perf_counter() - start
+            start = time.perf_counter()
+            graph.pagerank(iterations=iterations, tolerance=0)
+            rank_time = time.perf_counter() - start
+        print(f"{'numpy' if use_numpy else 'pure Python':>11}: in-degree {degree_time:6.2f} s, "
+              f"PageRank {rank_time / iterations:6.2f} s/iteration")
+
+
+CRAWL_DEFAULTS = {
+    'pages': 2000,          # size of the synthetic site
+    'fanout': 10,           # links per page
+    'page_kb': 30,          # approximate page weight
+    'latency_ms': 20,       # median server latency (log-normal)
+    'latency_sigma': 0.5,
+    'error_rate': 0.01,     # share of pages answered with 500
+    'warc': '',             # serve a recorded WARC file instead of the synthetic site
+    'modes': '',            # comma-separated ENGINE_MODES, all by default
+    'output': 'crawl_benchmark.json',
+}
+
+
+def read_warc(path):
+    # HTML bodies of the 200 responses in a .warc or .warc.gz file, by target URL
+    pages = {}
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                break
+            if not line.startswith(b'WARC/'):
+                continue
+            headers = {}
+            for line in iter(file.readline, b''):
+                if not line.strip():
+                    break
+                name, _, value = line.decode('utf-8', 'replace').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            block = file.read(int(headers.get('content-length', 0)))
+            if headers.get('warc-type') != 'response' or 'warc-target-uri' not in headers:
+                continue
+            head, _, body = block.partition(b'\r\n\r\n')
+            status_line, _, response_headers = head.partition(b'\r\n')
+            if b' 200' in status_line and b'text/html' in response_headers.lower():
+                pages[headers['warc-target-uri']] = body
+    return pages
+
+
+class SyntheticSite:
+    # Local HTTP server for crawl benchmarks. Page i at /p/i links to the next fanout pages of a
+    # breadth-first tree and pads to page_kb; latency is log-normal and errors hit the same pages every run
+    def __init__(self, pages=2000, fanout=10, page_kb=30, latency_ms=20, latency_sigma=0.5, error_rate=0.01,
+                 warc='', **_):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_kb = page_kb
+        self.latency = latency_ms / 1000
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.recorded = {}
+        self.start_path = "/p/0"
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                site.serve(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        if warc:
+            self.load_warc(warc)
+
+    def load_warc(self, path):
+        # Pages of the first recorded host are served by path. Absolute links to it point here, and links
+        # to any other host point at /__external__/, which answers 404, so a benchmark never leaves the machine
+        recorded = read_warc(path)
+        if not recorded:
+            raise ValueError(f"No HTML responses in {path}")
+        first = urlsplit(next(iter(recorded)))
+        self.start_path = first.path or "/"
+        base = self.base_url.encode()
+
+        def rewrite(match):
+            host = match.group(1)
+            return base if host.decode('latin-1').lower() == first.netloc.lower() else base + b"/__external__/" + host
+
+        for url, body in recorded.items():
+            parts = urlsplit(url)
+            if parts.netloc.lower() == first.netloc.lower():
+                path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+                self.recorded[path] = re.sub(rb'https?://([^/"\'\s<>]+)', rewrite, body)
+        self.pages = len(self.recorded)
+
+    def page(self, number):
+        links = "".join(f'<a href="/p/{(number * self.fanout + j + 1) % self.pages}">Page {j}</a>'
+                        for j in range(self.fanout))
+        head = f"<html><head><title>Page {number}</title></head><body><h1>Page {number}</h1>{links}"
+        filler = "<p>Synthetic benchmark text for the crawler under test.</p>"
+        return (head + filler * max((self.page_kb * 1024 - len(head)) // len(filler), 0) + "</body></html>").encode()
+
+    def serve(self, handler):
+        seed = zlib.crc32(handler.path.encode())
+        generator = random.Random(seed)
+        if self.latency > 0:
+            time.sleep(generator.lognormvariate(math.log(self.latency), self.latency_sigma))
+
+        body = None
+        if self.recorded:
+            body = self.recorded.get(handler.path)
+        elif handler.path.startswith("/p/") and handler.path[3:].isdigit() and int(handler.path[3:]) < self.pages:
+            body = self.page(int(handler.path[3:]))
+        if body is None:
+            handler.send_response(404)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        if generator.random() < self.error_rate:
+            handler.send_response(500)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url + self.start_path
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def timed(crawler_class):
+    # Records each page's latency from the request to the stored page info
+    class TimedCrawler(crawler_class):
+        def request(self, url, headers=None):
+            self.page_started[url] = time.perf_counter()
+            return super().request(url, headers)
+
+        async def fetch(self, session, url, headers=None):
+            self.page_started[url] = time.perf_counter()
+            return await super().fetch(session, url, headers)
+
+        def store_page(self, current_url, depth, page_info, discovered_links):
+            started = self.page_started.pop(current_url, None)
+            super().store_page(current_url, depth, page_info, discovered_links)
+            if started is not None:
+                self.page_latencies.append(time.perf_counter() - started)
+    return TimedCrawler
+
+
+ENGINE_MODES = {
+    'threads': (WebCrawler, {}),
+    'threads+stream': (WebCrawler, {'parser': 'stream', 'stream_downloads': True}),
+    'threads+parser_pool': (WebCrawler, {'parser_workers': os.cpu_count() or 1}),
+    'async': (AsyncWebCrawler, {'max_connections': 64}),
+    'async+parser_pool': (AsyncWebCrawler, {'max_connections': 64, 'parser_workers': os.cpu_count() or 1}),
+}
+
+
+def cpu_and_rss():
+    # CPU seconds and peak RSS in MiB of this process and its parser processes
+    if resource is None:
+        return time.process_time(), None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) * scale / 2 ** 20
+
+
+def run_engine(mode, start_url, pages, results):
+    # Runs in its own process, so CPU time and peak RSS belong to this engine mode only. A failure is reported
+    # in place of the run, so the parent does not wait for a result that never comes
+    try:
+        results.put(measure_engine(mode, start_url, pages))
+    except Exception as e:
+        results.put({'mode': mode, 'error': f"{type(e).__name__}: {e}"})
+
+
+def wait_for_run(mode, process, results, poll_interval=1.0):
+    # A child that dies without reporting, for example killed for using too much memory, is noticed too
+    while True:
+        try:
+            return results.get(timeout=poll_interval)
+        except Empty:
+            if not process.is_alive():
+                break
+    # The result may have been put just before the child exited
+    try:
+        return results.get(timeout=poll_interval)
+    except Empty:
+        return {'mode': mode, 'error': f"exited with code {process.exitcode} without a result"}
+
+
+def measure_engine(mode, start_url, pages):
+    logging.getLogger('MyWebCrowler').setLevel(logging.WARNING)
+    crawler_class, options = ENGINE_MODES[mode]
+    crawler = timed(crawler_class)([start_url], pages, 1000, 16, 10, politeness_delay=0,
+                                   frontier_capacity=0, **options)
+    crawler.page_started = {}
+    crawler.page_latencies = []
+
+    cpu_before, _ = cpu_and_rss()
+    start = time.perf_counter()
+    crawler.crawl()
+    elapsed = time.perf_counter() - start
+    cpu_after, peak_rss = cpu_and_rss()
+
+    latencies = sorted(crawler.page_latencies)
+
+    def percentile(q):
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if latencies else None
+
+    return {'mode': mode, 'pages': crawler.total_pages_crawled, 'seconds': round(elapsed, 3),
+            'pages_per_sec': round(crawler.total_pages_crawled / elapsed, 1),
+            'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99),
+            'cpu_seconds': round(cpu_after - cpu_before, 3),
+            'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+            'errors': crawler.metrics.total('host_errors')}
+
+
+def benchmark_crawl(**options):
+    options = {**CRAWL_DEFAULTS, **options}
+    modes = [mode for mode in (options['modes'].split(',') if options['modes'] else ENGINE_MODES)
+             if AIOHTTP_AVAILABLE or not mode.startswith('async')]
+    site = SyntheticSite(**options)
+    start_url = site.start()
+    print(f"Site: {site.pages} pages at {start_url}, fan-out {options['fanout']}, {options['page_kb']} KiB, "
+          f"latency {options['latency_ms']} ms, errors {options['error_rate']:.1%}")
+
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for mode in modes:
+            results = context.Queue()
+            process = context.Process(target=run_engine, args=(mode, start_url, site.pages, results))
+            process.start()
+            run = wait_for_run(mode, process, results)
+            process.join()
+            runs.append(run)
+            if 'error' in run:
+                print(f"{mode:>20}: failed, {run['error']}")
+                continue
+            print(f"{mode:>20}: {run['pages']:6} pages, {run['pages_per_sec']:8.1f} pages/s, "
+                  f"p50 {run['p50_ms'] or 0:7.1f} ms, p99 {run['p99_ms'] or 0:7.1f} ms, "
+                  f"CPU {run['cpu_seconds']:6.1f} s, peak RSS {run['peak_rss_mb']} MiB")
+    finally:
+        site.stop()
+
+    if options['output']:
+        # Every run is appended, so the file is a history to compare regressions against
+        history = []
+        if os.path.exists(options['output']):
+            with open(options['output'], 'r', encoding='utf-8') as file:
+                history = json.load(file)
+        history.append({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                        'cores': os.cpu_count(), 'site': {key: options[key] for key in
+                                                          ('pages', 'fanout', 'page_kb', 'latency_ms',
+                                                           'latency_sigma', 'error_rate', 'warc')},
+                        'runs': runs})
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(history, file, indent=2)
+        print(f"Saved to {options['output']}")
+
+
+BENCHMARKS = {
+    'parsers': benchmark_parsers,
+    'page_allocations': benchmark_page_allocations,
+    'seen_sets': benchmark_seen_sets,
+    'accounting': benchmark_accounting,
+    'parser_pool': benchmark_parser_pool,
+    'search_index': benchmark_search_index,
+    'sharded_search': benchmark_sharded_search,
+    'result_store': benchmark_result_store,
+    'link_graph': benchmark_link_graph,
+    'crawl': benchmark_crawl,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the crawler")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    for key, default in CRAWL_DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default,
+                            help="crawl benchmark option")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    crawl_options = {key: getattr(args, key) for key in CRAWL_DEFAULTS}
+
+    for name in args.names or list(BENCHMARKS):
+        print(f"== {name} ==")
+        if name == 'crawl':
+            benchmark_crawl(**crawl_options)
+        else:
+            BENCHMARKS[name]()
@@ -1,372 +1,4165 @@
-from dataclasses import dataclass
-from wsgiref import headers
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import concurrent.futures
-import threading
-from queue import Queue, Empty
-import time
-import logging
-from threading import Thread
-from typing import List
-import json
-from coverage import results
-
-
-class WebCrawler:
-    def __init__(self, start_urls, max_pages, max_depth, max_workers,timeout):
-        if start_urls is None:
-            raise TypeError("start_urls cannot be None")
-        if max_pages is None:
-            raise TypeError("max_pages cannot be None")
-        if max_depth is None:
-            raise TypeError("max_depth cannot be None")
-        if max_workers is None:
-            raise TypeError("max_workers cannot be None")
-        if timeout is None:
-            raise TypeError("timeout cannot be None")
-
-        if not isinstance(max_pages, int):
-            raise TypeError("max_pages must be a number bigger or even than 1")
-        if not isinstance(max_depth, int):
-            raise TypeError("max_depth must be a number bigger than 1")
-        if not isinstance(max_workers, int):
-            raise TypeError("max_workers must be a 2 or bigger")
-        if not isinstance(timeout, int):
-            raise TypeError
-
-        if max_pages is True or max_pages is False:
-            raise TypeError("max_pages cannot be True or False")
-        if max_depth is True or max_depth is False:
-            raise TypeError("max_depth cannot be True or False")
-        if max_workers is True or max_workers is False:
-            raise TypeError("max_workers cannot be True or False")
-        if timeout is True:
-            #I set default time out on one because mot mustch pages have slower response than 1 but there are some exceptions
-            self.timeout = 1
-        elif timeout is False:
-            #There is possibility that program will fail somewhere because som pages have slower response
-            self.timeout = 0
-
-        if max_pages < max_depth:
-            self.max_pages = max_depth *2
-        else:
-            self.max_depth = max_depth
-
-        self.start_urls = start_urls if isinstance(start_urls, list) else [start_urls]
-        self.max_pages = max_pages
-        self.max_depth = max_depth
-        self.max_workers = max_workers
-        self.timeout = timeout
-
-        if max_depth <= 0:
-            self.max_depth = 10
-        if max_depth >= 1000:
-            self.max_depth = 100
-        if max_workers <= 0:
-            self.max_workers = 2
-        if timeout < 0:
-            self.timeout = 1
-
-        self.url_queue = Queue()
-        self.visited_urls = set()
-        self.crawl_results = {}
-
-        self.visited_lock = threading.Lock()
-        self.results_lock = threading.Lock()
-        self.page_count_lock = threading.Lock()
-
-        self.total_pages_crawled = 0
-
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s: %(message)s'
-        )
-        self.logger = logging.getLogger(__name__)
-
-        for start_url in self.start_urls:
-            self.url_queue.put((start_url, 0))
-
-    def is_valid_url(self, url):
-
-        try:
-            parsed = urlparse(url)
-
-            checks = [
-                parsed.scheme in ['http', 'https'],
-                url not in self.visited_urls,
-                not url.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webm', '.pdf', '.mp4')),
-                len(url) < 300,
-            ]
-
-            return all(checks)
-
-        except Exception as e:
-            self.logger.warning(f"URL validation error for {url}: {e}")
-            return False
-
-    def extract_links(self, html_content, current_url):
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            links = []
-
-            for link in soup.find_all('a', href=True):
-                absolute_url = urljoin(current_url, link['href'])
-
-                if self.is_valid_url(absolute_url):
-                    links.append(absolute_url)
-
-            return links
-
-        except Exception as e:
-            self.logger.error(f"Link extraction error: {e}")
-            return []
-
-    def extract_page_info(self, html_content, url):
-
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            self.page_count_lock.acquire()
-            page_info = {
-                'id': self.total_pages_crawled,
-                'url': url,
-                'title': soup.title.string if soup.title else 'No Title',
-                'headings': {
-                    'h1': [h.get_text(strip=True) for h in soup.find_all('h1')],
-                    'h2': [h.get_text(strip=True) for h in soup.find_all('h2')]
-                },
-                'text_length': len(soup.get_text()),
-                'links_count': len(soup.find_all('a', href=True))
-            }
-            self.page_count_lock.release()
-
-            return page_info
-
-        except Exception as e:
-            self.logger.error(f"Page info extraction error for {url}: {e}")
-            return {'url': url, 'error': str(e)}
-
-    def worker(self):
-        while True:
-            # Check if crawl limit reached
-            with self.page_count_lock:
-                if self.total_pages_crawled + (self.max_workers /4) >= self.max_pages:
-                    break
-
-            try:
-                current_url, depth = self.url_queue.get(timeout=self.timeout)
-
-                if depth > self.max_depth:
-                    self.url_queue.task_done()
-                    continue
-
-                with self.visited_lock:
-                    if current_url in self.visited_urls:
-                        self.url_queue.task_done()
-                        continue
-                    self.visited_urls.add(current_url)
-
-                try:
-                    response = requests.get(current_url, timeout=self.timeout)
-
-                    if response.status_code == 200:
-                        page_info = self.extract_page_info(response.text, current_url)
-
-                        self.page_count_lock.acquire()
-                        self.total_pages_crawled += 1
-                        self.logger.info(f"Crawled: {current_url}")
-                        self.page_count_lock.release()
-
-                        self.results_lock.acquire()
-                        self.crawl_results[current_url] = page_info
-                        self.results_lock.release()
-
-                        discovered_links = self.extract_links(response.text, current_url)
-
-                        for link in discovered_links:
-                            self.url_queue.put((link, depth + 1))
-
-                        time.sleep(0.5)
-
-                except requests.RequestException as e:
-                    self.logger.warning(f"Request failed for {current_url}: {e}")
-                finally:
-                    self.url_queue.task_done()
-            except Empty:
-                # No more URLs to process
-                break
-
-            except Exception as e:
-                self.logger.error(f"Unexpected worker error: {e}")
-                break
-        time.sleep(1)
-
-
-    def crawl(self):
-        self.logger.info(f"Starting crawl for {self.start_urls}")
-
-        # Create thread pool
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = [
-                executor.submit(self.worker)
-                for _ in range(self.max_workers)
-            ]
-
-            # Wait for all threads to complete
-            concurrent.futures.wait(futures)
-
-        self.logger.info(f"Crawl completed. Total pages: {self.total_pages_crawled}")
-        return self.crawl_results
-
-class findMatchingTitle(Thread):
-    def __init__(self, from_id, to_id, wanted_word):
-        Thread.__init__(self)
-        self.from_id = from_id
-        self.to_id = to_id
-        self.wanted_word = wanted_word
-
-    def find_word(self, title, wanted_word):
-            title_low = title.lower()
-            wanted_word_low = wanted_word.lower()
-
-            if wanted_word_low in title_low:
-                return True
-            return False
-
-    def find(self):
-        found = 0
-        i = 0
-        for url, data in results.items():
-            if self.from_id < i < self.to_id and self.find_word(data.get('title'), self.wanted_word):
-                print("Wanted word is on row {} with title {} and url address {}.".format(i, data.get('title'), data.get('url')))
-                found += 1
-            i = i + 1
-        if found == 0:
-            print("This thread have not found title you are looking for.")
-
-    def run(self):
-        self.find()
-
-class findMatchingHeader(Thread):
-    def __init__(self, from_id, to_id, wanted_header):
-        Thread.__init__(self)
-        self.from_id = from_id
-        self.to_id = to_id
-        self.wanted_header = wanted_header
-
-    def find_header(self, headers, wanted_header):
-            wanted_header_low = wanted_header.lower()
-
-            for header in headers:
-                if wanted_header_low in header.lower():
-                    return True
-                return False
-
-    def find(self):
-        found = 0
-        i = 0
-        for url, data in results.items():
-            if self.from_id < i < self.to_id and self.find_header(data.get('headers'), self.wanted_header):
-                print("Wanted word is on row {} with title {} and url address {}.".format(i, data.get('title'), data.get('url')))
-                found += 1
-            i = i + 1
-        if found == 0:
-            print("This thread have not found title you are looking for.")
-
-    def run(self):
-        self.find()
-
-
-class findMatchingTitleAndHeader(Thread):
-    def __init__(self, from_id, to_id, wanted_title, wanted_header):
-        Thread.__init__(self)
-        self.from_id = from_id
-        self.to_id = to_id
-        self.wanted_title = wanted_title
-        self.wanted_header = wanted_header
-
-def search_specific(total_pages, num_workers, wanted_title, wanted_header):
-    if total_pages % num_workers != 0:
-        total_pages = num_workers * 10
-    if not isinstance(total_pages, int):
-        raise TypeError
-    if not isinstance(num_workers, int):
-        raise TypeError
-    if not isinstance(wanted_title, str):
-        raise TypeError
-    if not isinstance(wanted_header, str):
-        raise TypeError
-
-    if total_pages < num_workers or total_pages < 0:
-        total_pages = num_workers * 2
-    if num_workers <= 0:
-        num_workers = 2
-
-    if total_pages is True or total_pages is False:
-        total_pages = 100
-    if num_workers is False or num_workers is True:
-        num_workers = 2
-
-
-    chunk_size = total_pages // num_workers
-    threads = []
-
-    for i in range(num_workers):
-        from_id = i * chunk_size
-        to_id = from_id + chunk_size if i < num_workers - 1 else total_pages
-        if wanted_title == "":
-            thread = findMatchingHeader(from_id, to_id, wanted_header)
-            threads.append(thread)
-            thread.start()
-        if wanted_header == "":
-            thread = findMatchingTitle(from_id, to_id, wanted_title)
-            threads.append(thread)
-            thread.start()
-        else:
-            thread = findMatchingTitleAndHeader(from_id, to_id,wanted_title, wanted_header)
-            threads.append(thread)
-            thread.start()
-
-    for thread in threads:
-        thread.join()
-
-
-@dataclass
-class CrawlerConfig:
-    start_urls: List[str]
-    max_pages: int
-    max_depth: int
-    max_workers: int
-    timeout: int
-    wanted_title: str
-    wanted_header:str
-
-    @classmethod
-    def from_json(cls, json_file: str) -> 'Crawler':
-        with open(json_file, 'r') as file:
-            data = json.load(file)
-            return cls(**data)
-
-    def to_json(self, json_file: str) -> None:
-        with open(json_file, 'w') as file:
-            json.dump(self.__dict__, file, indent=4)
-
-
-if __name__ == "__main__":
-    loaded_config = CrawlerConfig.from_json('Crawler.json')
-    crawler = WebCrawler(start_urls=loaded_config.start_urls,max_pages=loaded_config.max_pages,max_depth=loaded_config.max_depth,max_workers=loaded_config.max_workers, timeout=loaded_config.timeout)
-
-    results = crawler.crawl()
-
-    if not(loaded_config.wanted_title == "" and loaded_config.wanted_header == ""):
-        search_specific(loaded_config.max_pages, loaded_config.max_workers, loaded_config.wanted_title, loaded_config.wanted_header)
-    else:
-        for url, data in results.items():
-         print(f"id: {data.get('id')}")
-         print(f"URL: {url}")
-         print(f"Title: {data.get('title', 'No Title')}")
-         print(f"Text Length: {data.get('text_length', 0)}")
-         print(f"H1 Headings: {data.get('headings', {}).get('h1', [])}")
+from dataclasses import dataclass, field
+from wsgiref import headers
+import requests
+from bs4 import BeautifulSoup
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, urldefrag, unquote_plus
+from fnmatch import fnmatchcase
+import concurrent.futures
+import threading
+from queue import Queue, Empty, Full
+import time
+import logging
+from threading import Thread
+from typing import List, Dict
+import json
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import hashlib
+import bisect
+import math
+import sys
+import csv
+import codecs
+import gzip
+import struct
+import os
+import re
+import socket
+import socketserver
+import ipaddress
+from array import array
+from collections import deque, Counter
+from collections.abc import Mapping, MutableMapping
+from urllib.robotparser import RobotFileParser
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from datetime import datetime, timezone, timedelta
+from email.utils import parsedate_to_datetime
+from coverage import results
+
+try:
+    import lxml
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+try:
+    import numpy
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+PARSERS = ('html.parser', 'lxml', 'stream')
+
+
+class StreamingPageParser(HTMLParser):
+    # Emits only what the crawler keeps: title, h1/h2 text, <a href> targets and text length
+    def __init__(self, base_url, fingerprint=False):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.base_url = base_url
+        self.text_parts = [] if fingerprint else None
+        self.title = None
+        self.headings = {'h1': [], 'h2': []}
+        self.links = []
+        self.text_length = 0
+        self._title_parts = None
+        self._heading_tag = None
+        self._heading_parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href':
+                    self.links.append(urljoin(self.base_url, value or ''))
+                    break
+        elif tag == 'title' and self.title is None:
+            self._title_parts = []
+        elif tag in ('h1', 'h2') and self._heading_tag is None:
+            self._heading_tag = tag
+            self._heading_parts = []
+        elif tag in ('script', 'style'):
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts)
+            self._title_parts = None
+        elif tag == self._heading_tag:
+            self.headings[tag].append(''.join(part.strip() for part in self._heading_parts))
+            self._heading_tag = None
+        elif tag in ('script', 'style') and self._skip_depth > 0:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        # Whitespace-only strings count as one character, as in BeautifulSoup's tree
+        self.text_length += len(data) if data.strip() else 1
+        if self.text_parts is not None:
+            self.text_parts.append(data)
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+        if self._heading_tag is not None:
+            self._heading_parts.append(data)
+
+    def page_info(self, url):
+        page_info = {
+            'url': url,
+            'title': self.title if self.title is not None else 'No Title',
+            'headings': self.headings,
+            'text_length': self.text_length,
+            'links_count': len(self.links)
+        }
+        if self.text_parts is not None:
+            page_info['simhash'] = format(simhash(' '.join(self.text_parts)), '016x')
+        return page_info
+
+
+WORD_PATTERN = re.compile(r'\w+')
+SIMHASH_BITS = 64
+SIMHASH_SHINGLE = 3
+# BIT_VALUES[bit] lists the byte values that have that bit set
+BIT_VALUES = [[value for value in range(256) if value >> bit & 1] for bit in range(8)]
+
+
+def simhash(text, shingle=SIMHASH_SHINGLE):
+    # 64-bit SimHash of the lowercased word shingles of text. Pages that differ in a few words differ in a few bits.
+    # Feature weights are summed per byte value of each hash position first, so each feature costs 8 additions
+    words = WORD_PATTERN.findall(text.lower())
+    features = Counter(' '.join(words[start:start + shingle]) for start in range(max(len(words) - shingle + 1, 1)))
+    features.pop('', None)
+    if not features:
+        return 0
+    tables = [[0] * 256 for _ in range(SIMHASH_BITS // 8)]
+    total = 0
+    for feature, weight in features.items():
+        for position, value in enumerate(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()):
+            tables[position][value] += weight
+        total += weight
+    fingerprint = 0
+    for position, table in enumerate(tables):
+        for bit, values in enumerate(BIT_VALUES):
+            if 2 * sum(table[value] for value in values) > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+class SimHashIndex:
+    # Finds fingerprints within max_distance bits. They are split into max_distance + 1 bands, and two fingerprints
+    # that close must agree on at least one whole band, so only pages sharing a band are compared
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self.bands = [(start * SIMHASH_BITS // bands, (start + 1) * SIMHASH_BITS // bands) for start in range(bands)]
+        self.tables = [{} for _ in self.bands]
+        self.clusters = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def keys(self, fingerprint):
+        return [fingerprint >> low & ((1 << (high - low)) - 1) for low, high in self.bands]
+
+    def find(self, fingerprint):
+        # Cluster of the closest stored fingerprint within max_distance, or None
+        best = None
+        for table, key in zip(self.tables, self.keys(fingerprint)):
+            for candidate in table.get(key, ()):
+                distance = bin(candidate ^ fingerprint).count('1')
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, self.clusters[candidate])
+        return best[1] if best is not None else None
+
+    def add(self, fingerprint, page_id):
+        # Returns the page's duplicate cluster: the id of the first page with a near-identical text
+        with self.lock:
+            cluster = self.find(fingerprint)
+            if cluster is not None:
+                return cluster
+            self.clusters[fingerprint] = page_id
+            for table, key in zip(self.tables, self.keys(fingerprint)):
+                table.setdefault(key, []).append(fingerprint)
+            return page_id
+
+
+BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be'))
+HEADER_CHARSET_PATTERN = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+PRESCAN_BYTES = 1024
+DECODE_CHUNK_SIZE = 8 * 1024
+
+
+def known_charset(name):
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def sniff_charset(headers, body):
+    # Charset of an HTML body, in the order of the HTML5 encoding sniffing algorithm: a byte order mark, the
+    # Content-Type header, a <meta> charset in the first 1024 bytes, else UTF-8. Unknown names are skipped
+    view = memoryview(body)
+    for bom, charset in BOMS:
+        if view[:len(bom)] == bom:
+            return charset
+    match = HEADER_CHARSET_PATTERN.search((headers or {}).get('Content-Type', '') or '')
+    charset = known_charset(match.group(1)) if match else None
+    if charset is None:
+        match = META_CHARSET_PATTERN.search(view[:PRESCAN_BYTES])
+        charset = known_charset(match.group(1).decode('ascii')) if match else None
+        # A <meta> tag that could be read as ASCII cannot be UTF-16
+        if charset is not None and charset.startswith('utf-16'):
+            charset = 'utf-8'
+    return charset or 'utf-8'
+
+
+def parse_page(html_content, url, parser='html.parser', fingerprint=False, encoding=None):
+    # Parses the document once and returns (page_info without id, absolute links).
+    # html_content is the raw body as bytes, decoded with encoding (sniffed when not given), or already a str.
+    # With fingerprint, page_info also has the SimHash of the page text as 16 hex digits
+    if isinstance(html_content, (bytes, bytearray, memoryview)) and encoding is None:
+        encoding = sniff_charset(None, html_content)
+
+    if parser == 'stream':
+        page_parser = StreamingPageParser(url, fingerprint)
+        if isinstance(html_content, str):
+            page_parser.feed(html_content)
+        else:
+            # Decoded in chunks, so the whole page never exists as one str
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            view = memoryview(html_content)
+            for start in range(0, len(view), DECODE_CHUNK_SIZE):
+                page_parser.feed(decoder.decode(view[start:start + DECODE_CHUNK_SIZE]))
+            page_parser.feed(decoder.decode(b'', final=True))
+        page_parser.close()
+        return page_parser.page_info(url), page_parser.links
+
+    if isinstance(html_content, str):
+        soup = BeautifulSoup(html_content, parser)
+    elif parser == 'html.parser':
+        # html.parser only takes text, and BeautifulSoup's own detection costs more than decoding once here
+        soup = BeautifulSoup(str(html_content, encoding, 'replace'), parser)
+    else:
+        # lxml decodes the bytes itself
+        if not isinstance(html_content, bytes):
+            html_content = bytes(html_content)
+        soup = BeautifulSoup(html_content, parser, from_encoding=encoding)
+    headings = {'h1': [], 'h2': []}
+    links = []
+    for tag in soup.find_all(['a', 'h1', 'h2']):
+        if tag.name == 'a':
+            if tag.has_attr('href'):
+                links.append(urljoin(url, tag['href']))
+        else:
+            headings[tag.name].append(tag.get_text(strip=True))
+
+    # .string is a NavigableString that keeps the whole tree alive, so only its text is stored
+    title = soup.title.string if soup.title else 'No Title'
+    # The same strings get_text() joins, counted without building the text unless the fingerprint needs it
+    text = soup.get_text() if fingerprint else None
+    page_info = {
+        'url': url,
+        'title': str(title) if title is not None else None,
+        'headings': headings,
+        'text_length': len(text) if fingerprint else sum(map(len, soup.strings)),
+        'links_count': len(links)
+    }
+    if fingerprint:
+        page_info['simhash'] = format(simhash(text), '016x')
+    return page_info, links
+
+
+class CrawlFrontier(Queue):
+    # Bounded priority frontier with one heap per host. Each host also has a next allowed fetch time.
+    # get() hands out the best URL (lowest depth, then highest score) among hosts that may be fetched now,
+    # preferring the host served least recently on ties. URLs are queued as found and deduplicated by key(url),
+    # for example their canonical form
+    def __init__(self, delay=0.5, host_delays=None, capacity=0, max_depth=None, budget=None, key=None):
+        self.delay = delay
+        self.host_delays = {host.lower(): host_delay for host, host_delay in (host_delays or {}).items()}
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.budget = budget
+        self.key = key if key is not None else (lambda url: url)
+        # Called without the mutex, from the thread that changed the frontier, after a URL is queued or marked done
+        self.on_change = None
+        Queue.__init__(self)
+
+    def _init(self, maxsize):
+        self.hosts = {}
+        self.host_state = {}
+        self.next_fetch = {}
+        self.last_served = {}
+        self.cooling = []
+        self.eligible = []
+        self.worst = []
+        self.queued = {}
+        self.depth_counts = {}
+        self.count = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.sequence = itertools.count(1)
+        # URLs held back by the budget rule, best first, and the depth each is held at
+        self.overflow = []
+        self.overflowed = {}
+
+    def _qsize(self):
+        return self.count
+
+    def host_delay(self, host):
+        return self.host_delays.get(host, self.delay)
+
+    def set_host_delay(self, host, delay):
+        with self.mutex:
+            self.host_delays[host.lower()] = delay
+
+    def defer_host(self, host, seconds):
+        # Holds a host back for at least seconds, for example after a 429 with Retry-After
+        host = host.lower()
+        with self.mutex:
+            self.next_fetch[host] = max(self.next_fetch.get(host, 0.0), time.monotonic() + seconds)
+            if self.host_state.get(host) == 'eligible':
+                # Its entry in the eligible heap is dropped lazily by _has_eligible
+                self.host_state[host] = 'cooling'
+                heapq.heappush(self.cooling, (self.next_fetch[host], next(self.sequence), host))
+
+    def _prune(self, heap):
+        while heap and not heap[0][4]:
+            heapq.heappop(heap)
+
+    def _remove(self, entry):
+        # Marks a queued entry dead; it is dropped from the heaps lazily
+        entry[4] = False
+        del self.queued[entry[5]]
+        self.count -= 1
+        self.depth_counts[entry[0]] -= 1
+
+    def _discard(self, entry):
+        # Removes an entry that will never be handed to a worker
+        self._remove(entry)
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
+
+    def _push_eligible(self, host):
+        heap = self.hosts.get(host)
+        self._prune(heap)
+        if not heap:
+            self.hosts.pop(host, None)
+            self.host_state.pop(host, None)
+            return
+        self.host_state[host] = 'eligible'
+        heapq.heappush(self.eligible, (heap[0][0], heap[0][1], self.last_served.get(host, 0), host))
+
+    def _over_budget(self, depth):
+        # URLs at lower depths are fetched first; while they alone fill the remaining budget this one waits
+        if self.budget is None:
+            return False
+        ahead = sum(count for queued_depth, count in self.depth_counts.items() if queued_depth < depth)
+        return ahead >= self.budget()
+
+    def _defer(self, item, score, key):
+        # Queued URLs ahead may still fail or be skipped, so a URL over budget is kept aside, not dropped
+        depth = item[1]
+        held = self.overflowed.get(key)
+        if held is not None and held <= depth:
+            return
+        if self.capacity and held is None and len(self.overflowed) >= self.capacity:
+            self.rejected += 1
+            return
+        self.overflowed[key] = depth
+        heapq.heappush(self.overflow, (depth, -score, next(self.sequence), item, key))
+
+    def _readmit(self):
+        # Moves held-back URLs into the frontier once the URLs ahead of them no longer fill the budget
+        readmitted = 0
+        while self.overflow:
+            depth, negative_score, _, item, key = self.overflow[0]
+            if self.overflowed.get(key) != depth:
+                heapq.heappop(self.overflow)
+                continue
+            if self._over_budget(depth):
+                break
+            heapq.heappop(self.overflow)
+            del self.overflowed[key]
+            if self._put(item, -negative_score):
+                readmitted += 1
+        if readmitted:
+            self.unfinished_tasks += readmitted
+            self.not_empty.notify(readmitted)
+
+    def _rejects(self, depth, score):
+        if self.max_depth is not None and depth > self.max_depth:
+            return True
+        if self.capacity and self.count >= self.capacity:
+            while self.worst and not self.worst[0][3][4]:
+                heapq.heappop(self.worst)
+            worst_depth, worst_score = -self.worst[0][0], self.worst[0][1]
+            if (depth, -score) >= (worst_depth, -worst_score):
+                return True
+            self._discard(heapq.heappop(self.worst)[3])
+            self.evicted += 1
+        return False
+
+    def _put(self, item, score=0.0):
+        url, depth = item[0], item[1]
+        key = self.key(url)
+        existing = self.queued.get(key)
+        if existing is not None:
+            if existing[0] <= depth:
+                return False
+            self._discard(existing)
+
+        if self._rejects(depth, score):
+            self.rejected += 1
+            return False
+        if self._over_budget(depth):
+            self._defer(item, score, key)
+            return False
+        if key in self.overflowed and self.overflowed[key] >= depth:
+            del self.overflowed[key]
+
+        sequence = next(self.sequence)
+        entry = [depth, -score, sequence, (url, depth), True, key]
+        host = urlparse(url).netloc.lower()
+        heap = self.hosts.get(host)
+        if heap is None:
+            heap = self.hosts[host] = []
+        heapq.heappush(heap, entry)
+
+        state = self.host_state.get(host)
+        if state is None:
+            next_fetch = self.next_fetch.get(host, 0.0)
+            if next_fetch <= time.monotonic():
+                self._push_eligible(host)
+            else:
+                self.host_state[host] = 'cooling'
+                heapq.heappush(self.cooling, (next_fetch, sequence, host))
+        elif state == 'eligible' and heap[0] is entry:
+            self._push_eligible(host)
+
+        heapq.heappush(self.worst, (-depth, score, -sequence, entry))
+        if len(self.worst) > 2 * self.count + 1024:
+            self.worst = [worst for worst in self.worst if worst[3][4]]
+            heapq.heapify(self.worst)
+
+        self.queued[key] = entry
+        self.count += 1
+        self.depth_counts[depth] = self.depth_counts.get(depth, 0) + 1
+        return True
+
+    def _has_eligible(self):
+        # Moves hosts whose delay has passed to the eligible heap and drops outdated heap entries
+        now = time.monotonic()
+        while self.cooling and self.cooling[0][0] <= now:
+            host = heapq.heappop(self.cooling)[2]
+            self._push_eligible(host)
+
+        while self.eligible:
+            depth, negative_score, _, host = self.eligible[0]
+            heap = self.hosts.get(host)
+            if self.host_state.get(host) != 'eligible' or heap is None:
+                heapq.heappop(self.eligible)
+                continue
+            self._prune(heap)
+            if not heap or (heap[0][0], heap[0][1]) != (depth, negative_score):
+                heapq.heappop(self.eligible)
+                self._push_eligible(host)
+                continue
+            return True
+        return False
+
+    def _get(self):
+        host = heapq.heappop(self.eligible)[3]
+        heap = self.hosts[host]
+        entry = heapq.heappop(heap)
+        self._remove(entry)
+
+        sequence = next(self.sequence)
+        self.last_served[host] = sequence
+        self.next_fetch[host] = time.monotonic() + self.host_delay(host)
+        self._prune(heap)
+        if heap:
+            self.host_state[host] = 'cooling'
+            heapq.heappush(self.cooling, (self.next_fetch[host], sequence, host))
+        else:
+            del self.hosts[host]
+            del self.host_state[host]
+        return entry[3]
+
+    def is_queued(self, url):
+        key = self.key(url)
+        with self.mutex:
+            return key in self.queued
+
+    def cooldown(self):
+        # Seconds until the next cooling host may be fetched, None when no host is cooling down
+        with self.mutex:
+            return max(self.cooling[0][0] - time.monotonic(), 0.0) if self.cooling else None
+
+    def put(self, item, block=True, timeout=None, score=0.0):
+        # Never blocks: when full, the lowest-priority URL is evicted or the new one is rejected
+        with self.mutex:
+            accepted = self._put(item, score)
+            if accepted:
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+        if accepted and self.on_change is not None:
+            self.on_change()
+        return accepted
+
+    def task_done(self):
+        # A finished URL may not have used its share of the budget, so held-back URLs are checked first.
+        # They are counted before this task is marked done, so the frontier is never seen drained in between
+        with self.mutex:
+            self._readmit()
+        Queue.task_done(self)
+        with self.mutex:
+            if self.unfinished_tasks == 0:
+                # Wakes workers waiting with until_drained: no URL is queued or being worked on any more
+                self.not_empty.notify_all()
+        if self.on_change is not None:
+            self.on_change()
+
+    def get(self, block=True, timeout=None, until_drained=False):
+        # The timeout only applies while the frontier is empty, hosts that are cooling down are waited for.
+        # With until_drained, Empty is raised at once when every URL put was also marked done
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._has_eligible():
+                if not block or (until_drained and self.unfinished_tasks == 0):
+                    raise Empty
+                if self.cooling:
+                    self.not_empty.wait(self.cooling[0][0] - time.monotonic())
+                elif deadline is None:
+                    self.not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self.not_empty.wait(remaining)
+
+            return self._get()
+
+
+class RobotsCache:
+    # robots.txt is fetched once per host and fetched again after ttl seconds. As RFC 9309 asks, a robots.txt
+    # that cannot be reached (a 5xx or 429, a timeout or a connection error) disallows the whole host until it is
+    # tried again after retry_interval seconds, unless an earlier copy of the host's rules is known
+    def __init__(self, timeout, ttl=86400, user_agent='*', retry_interval=600):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.user_agent = user_agent
+        self.retry_interval = retry_interval
+        self.parsers = {}
+        self.expires = {}
+        # Hosts whose parser disallows everything only because robots.txt could not be reached
+        self.unreachable = set()
+        self.lock = threading.Lock()
+
+    def fresh(self, host):
+        with self.lock:
+            expires = self.expires.get(host)
+        return expires is not None and time.monotonic() < expires
+
+    def get(self, url):
+        parsed = urlparse(url)
+        host = parsed.netloc.lower()
+        if self.fresh(host):
+            with self.lock:
+                return self.parsers[host]
+
+        robots = RobotFileParser()
+        try:
+            response = requests.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt", timeout=self.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+
+        with self.lock:
+            if status is None or status >= 500 or status == 429:
+                known = self.parsers.get(host)
+                if known is not None and host not in self.unreachable:
+                    robots = known
+                else:
+                    robots.disallow_all = True
+                    self.unreachable.add(host)
+                ttl = self.retry_interval
+            else:
+                if status in (401, 403):
+                    # Same rule as RobotFileParser.read(): an access-restricted robots.txt disallows everything
+                    robots.disallow_all = True
+                else:
+                    # Any other 4xx means there is no robots.txt, so nothing is disallowed
+                    robots.parse(response.text.splitlines() if status == 200 else [])
+                self.unreachable.discard(host)
+                ttl = self.ttl
+            self.parsers[host] = robots
+            self.expires[host] = time.monotonic() + ttl
+        return robots
+
+    def can_fetch(self, url):
+        return self.get(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url):
+        return self.get(url).crawl_delay(self.user_agent)
+
+    def sitemaps(self, url):
+        return self.get(url).site_maps() or []
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class DnsCache:
+    # Resolved host names, kept for ttl seconds, and failed ones, kept for negative_ttl seconds; getaddrinfo does
+    # not report record TTLs, so both are fixed. Resolutions run in a pool of max_concurrency threads and concurrent
+    # lookups of one host share one resolution. prefetch() starts one without waiting, so it is usually finished
+    # when a worker connects. install() routes socket.getaddrinfo, which requests uses, through the cache.
+    # The hook is shared by all installed caches in the process, so crawlers may install and uninstall in any order
+    hook_lock = threading.Lock()
+    # Installed caches, latest last, and socket.getaddrinfo from before the first install
+    installed = []
+    system_getaddrinfo = None
+
+    def __init__(self, ttl=300, negative_ttl=60, max_concurrency=8, metrics=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.metrics = metrics
+        self.max_concurrency = max(max_concurrency, 1)
+        self.resolver = None
+        # host -> (expires, getaddrinfo results with port 0, or the error)
+        self.entries = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.pool = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.resolutions = 0
+        self.failures = 0
+        self.resolve_time = 0.0
+
+    def resolve(self, host):
+        start = time.perf_counter()
+        try:
+            addresses = (self.resolver or self.system_resolver())(host, None, 0, socket.SOCK_STREAM)
+            ttl = self.ttl
+        except (OSError, UnicodeError) as e:
+            addresses = e
+            ttl = self.negative_ttl
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.entries[host] = (time.monotonic() + ttl, addresses)
+            del self.pending[host]
+            self.resolutions += 1
+            self.failures += isinstance(addresses, Exception)
+            self.resolve_time += elapsed
+        if self.metrics is not None:
+            self.metrics.observe('resolve', elapsed)
+        return addresses
+
+    def begin(self, host, prefetch=False):
+        # (cached addresses, None) for a fresh entry, else (None, future of the resolution), started if needed
+        with self.lock:
+            entry = self.entries.get(host)
+            if entry is not None and entry[0] > time.monotonic():
+                if not prefetch:
+                    failed = isinstance(entry[1], Exception)
+                    self.hits += not failed
+                    self.negative_hits += failed
+                return entry[1], None
+            future = self.pending.get(host)
+            if future is None:
+                if self.pool is None:
+                    self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                                      thread_name_prefix='dns')
+                future = self.pending[host] = self.pool.submit(self.resolve, host)
+                self.prefetches += prefetch
+            if not prefetch:
+                self.misses += 1
+            return None, future
+
+    def prefetch(self, host):
+        if host and not is_ip_address(host):
+            self.begin(host.lower(), prefetch=True)
+
+    def lookup(self, host):
+        # getaddrinfo results for host with port 0; a failure, cached or not, is raised again
+        addresses, future = self.begin(host.lower())
+        if future is not None:
+            addresses = future.result()
+        if isinstance(addresses, Exception):
+            raise addresses
+        return addresses
+
+    async def lookup_async(self, host):
+        addresses, future = self.begin(host.lower())
+        if future is not None:
+            addresses = await asyncio.wrap_future(future)
+        if isinstance(addresses, Exception):
+            raise addresses
+        return addresses
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        # Drop-in for socket.getaddrinfo. Only TCP lookups of host names without flags are cached
+        if not isinstance(host, str) or not (port is None or isinstance(port, int)) or flags or proto or \
+                type not in (0, socket.SOCK_STREAM) or is_ip_address(host):
+            return self.system_resolver()(host, port, family, type, proto, flags)
+        results = [(address_family, socket_type, protocol, name, (address[0], port or 0) + address[2:])
+                   for address_family, socket_type, protocol, name, address in self.lookup(host)
+                   if family in (0, address_family)]
+        if not results:
+            raise socket.gaierror(socket.EAI_NONAME, f"No address of the requested family for {host}")
+        return results
+
+    @staticmethod
+    def system_resolver():
+        return DnsCache.system_getaddrinfo or socket.getaddrinfo
+
+    @staticmethod
+    def shared_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        # socket.getaddrinfo while any cache is installed; the latest installed cache answers
+        try:
+            cache = DnsCache.installed[-1]
+        except IndexError:
+            return DnsCache.system_resolver()(host, port, family, type, proto, flags)
+        return cache.getaddrinfo(host, port, family, type, proto, flags)
+
+    def install(self):
+        with DnsCache.hook_lock:
+            if self in DnsCache.installed:
+                return
+            if DnsCache.system_getaddrinfo is None:
+                DnsCache.system_getaddrinfo = socket.getaddrinfo
+                socket.getaddrinfo = DnsCache.shared_getaddrinfo
+            DnsCache.installed.append(self)
+
+    def uninstall(self):
+        # The hook is removed with the last cache. If something wrapped socket.getaddrinfo since, the hook stays
+        # under the wrapper, falls through to the system resolver and serves the next install
+        with DnsCache.hook_lock:
+            if self in DnsCache.installed:
+                DnsCache.installed.remove(self)
+            if not DnsCache.installed and socket.getaddrinfo is DnsCache.shared_getaddrinfo:
+                socket.getaddrinfo = DnsCache.system_getaddrinfo
+                DnsCache.system_getaddrinfo = None
+
+    def close(self):
+        # Uninstalls the cache and stops its resolver threads; a later lookup starts a new pool
+        self.uninstall()
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        with self.lock:
+            self.pending = {host: future for host, future in self.pending.items() if not future.cancelled()}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DnsCacheResolver:
+    # aiohttp resolver over a DnsCache, in place of aiohttp's own per-connector cache
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        return [{'hostname': host, 'host': address[0], 'port': port, 'family': address_family, 'proto': protocol,
+                 'flags': socket.AI_NUMERICHOST | socket.AI_NUMERICSERV}
+                for address_family, _, protocol, _, address in await self.cache.lookup_async(host)
+                if family in (0, address_family)]
+
+    async def close(self):
+        pass
+
+
+def parse_lastmod(text):
+    # W3C datetime from <lastmod> as a Unix timestamp, 0.0 when missing or malformed
+    try:
+        moment = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def iter_sitemap(url, timeout):
+    # Streams (kind, loc, lastmod timestamp) from a sitemap ('url' entries) or sitemap index ('sitemap'
+    # entries). Each entry is cleared once read, so a 50k-URL sitemap is never held as a whole tree
+    response = requests.get(url, timeout=timeout, stream=True)
+    try:
+        if response.status_code != 200:
+            return
+        response.raw.decode_content = True
+        source = gzip.GzipFile(fileobj=response.raw) if urlsplit(url).path.endswith('.gz') else response.raw
+        loc = lastmod = None
+        for _, element in ElementTree.iterparse(source, events=('end',)):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'loc':
+                loc = (element.text or '').strip()
+            elif tag == 'lastmod':
+                lastmod = element.text
+            elif tag in ('url', 'sitemap'):
+                if loc:
+                    yield tag, loc, parse_lastmod(lastmod)
+                loc = lastmod = None
+                element.clear()
+    finally:
+        response.close()
+
+
+class CrawlState:
+    # Frontier, visited set and results mirrored to SQLite so an interrupted crawl can be resumed
+    def __init__(self, path, commit_every=200, commit_interval=1.0):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, depth INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS results (url TEXT PRIMARY KEY, id INTEGER NOT NULL, data TEXT NOT NULL);
+        """)
+        self.connection.commit()
+
+        self.lock = threading.Lock()
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+
+    def _written(self, count):
+        # Called with the lock held; commits in batches instead of once per row
+        self.pending_writes += count
+        if self.pending_writes >= self.commit_every or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.connection.commit()
+            self.pending_writes = 0
+            self.last_commit = time.monotonic()
+
+    def add_urls(self, items):
+        items = list(items)
+        if not items:
+            return
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO frontier (url, depth) VALUES (?, ?)", items)
+            self._written(len(items))
+
+    def save_result(self, url, page_info):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results (url, id, data) VALUES (?, ?, ?)",
+                                    (url, page_info.get('id', -1), json.dumps(page_info)))
+            self._written(1)
+
+    def store_page(self, url, page_info, links=()):
+        # The page's result, the links found on it and its completion are written in one transaction, so a crash
+        # never leaves a completed page without its result or its links
+        links = list(links)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results (url, id, data) VALUES (?, ?, ?)",
+                                    (url, page_info.get('id', -1), json.dumps(page_info)))
+            self.connection.executemany("INSERT OR IGNORE INTO frontier (url, depth) VALUES (?, ?)", links)
+            self.connection.execute("DELETE FROM frontier WHERE url = ?", (url,))
+            self.connection.execute("INSERT OR IGNORE INTO visited (url) VALUES (?)", (url,))
+            self._written(3 + len(links))
+
+    def complete_url(self, url):
+        # A URL leaves the frontier only once it is finished, so pages that were in flight are fetched again
+        with self.lock:
+            self.connection.execute("DELETE FROM frontier WHERE url = ?", (url,))
+            self.connection.execute("INSERT OR IGNORE INTO visited (url) VALUES (?)", (url,))
+            self._written(2)
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT NOT EXISTS (SELECT 1 FROM frontier) AND NOT EXISTS (SELECT 1 FROM visited)").fetchone()[0] == 1
+
+    def load(self):
+        with self.lock:
+            pending = self.connection.execute(
+                "SELECT url, depth FROM frontier WHERE url NOT IN (SELECT url FROM visited) ORDER BY rowid").fetchall()
+            visited = {row[0] for row in self.connection.execute("SELECT url FROM visited")}
+            stored = self.connection.execute("SELECT url, data FROM results ORDER BY id").fetchall()
+        return pending, visited, {url: json.loads(data) for url, data in stored}
+
+    def clear(self):
+        with self.lock:
+            self.connection.executescript("DELETE FROM frontier; DELETE FROM visited; DELETE FROM results;")
+            self.connection.commit()
+
+    def checkpoint(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending_writes = 0
+            self.last_commit = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
+        self.connection.close()
+
+
+def page_digest(page_info):
+    # Digest of what the crawler extracted from a page. Markup-only changes such as rotating nonces do not count
+    content = {key: value for key, value in page_info.items() if key not in ('id', 'duplicate_cluster')}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class RevisitScheduler:
+    # Schedule of a continuous crawl. Per URL it keeps the depth, page id, last fetch time, a digest of the extracted
+    # content and how often revisits found it changed, in SQLite so a restarted crawl keeps its schedule.
+    # The change rate is Cho and Garcia-Molina's estimator for pages checked at intervals: after n revisits that
+    # found X changes over T seconds, rate = -ln((n - X + 0.5) / (n + 0.5)) * n / T. A page is due when the chance
+    # that it changed since its last fetch, 1 - exp(-rate * age), reaches max_staleness
+    def __init__(self, path=None, max_staleness=0.5, min_interval=60.0, max_interval=7 * 86400.0,
+                 initial_interval=3600.0, commit_every=200):
+        self.max_staleness = max_staleness
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.initial_interval = initial_interval
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.connection = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY, depth INTEGER NOT NULL, id INTEGER NOT NULL, last_fetch REAL NOT NULL,
+                digest TEXT NOT NULL, revisits INTEGER NOT NULL, changes INTEGER NOT NULL, observed REAL NOT NULL)
+        """)
+        self.connection.commit()
+
+        self.lock = threading.Lock()
+        # url -> [depth, id, last_fetch, digest, revisits, changes, observed, due]
+        self.pages = {}
+        self.heap = []
+        self.scheduled = set()
+        self.fetched = 0
+        self.changed = 0
+        for url, *page in self.connection.execute("SELECT * FROM pages"):
+            page.append(page[2] + self.interval(self.rate(page)))
+            self.pages[url] = page
+            self.heap.append((page[7], url))
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def rate(self, page):
+        # Estimated changes per second; pages that were never revisited get initial_interval
+        revisits, changes, observed = page[4], page[5], page[6]
+        if revisits == 0 or observed <= 0:
+            return 1.0 / self.initial_interval
+        return -math.log((revisits - changes + 0.5) / (revisits + 0.5)) * revisits / observed
+
+    def interval(self, rate):
+        if rate <= 0:
+            return self.max_interval
+        return min(max(-math.log(1 - self.max_staleness) / rate, self.min_interval), self.max_interval)
+
+    def staleness(self, page, now):
+        return 1 - math.exp(-self.rate(page) * max(now - page[2], 0.0))
+
+    def known(self, url):
+        return url in self.pages
+
+    def page_id(self, url):
+        page = self.pages.get(url)
+        return page[1] if page is not None else None
+
+    def record(self, url, depth, page_id, digest, now=None):
+        # Returns whether a revisit found the page changed, or None for a first fetch
+        now = time.time() if now is None else now
+        with self.lock:
+            previous = self.pages.get(url)
+            changed = None
+            if previous is None:
+                page = [depth, page_id, now, digest, 0, 0, 0.0]
+            else:
+                changed = digest != previous[3]
+                page = [min(depth, previous[0]), previous[1], now, digest, previous[4] + 1,
+                        previous[5] + changed, previous[6] + now - previous[2]]
+                self.fetched += 1
+                self.changed += changed
+            page.append(now + self.interval(self.rate(page)))
+            self.pages[url] = page
+            heapq.heappush(self.heap, (page[7], url))
+            self.connection.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (url, *page[:7]))
+            self.pending_writes += 1
+            if self.pending_writes >= self.commit_every:
+                self.connection.commit()
+                self.pending_writes = 0
+        return changed
+
+    def pop_due(self, count, now=None):
+        # Up to count due (url, depth, staleness), stalest first. They stay scheduled until a worker takes them.
+        # Each also comes due again after min_interval, so a revisit the frontier evicted is not lost
+        now = time.time() if now is None else now
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now and len(due) < count:
+                when, url = heapq.heappop(self.heap)
+                page = self.pages.get(url)
+                # Outdated heap entries are skipped: the page was fetched again since
+                if page is None or page[7] != when:
+                    continue
+                self.scheduled.add(url)
+                self._push(url, now + self.min_interval)
+                due.append((url, page[0], self.staleness(page, now)))
+        return sorted(due, key=lambda item: -item[2])
+
+    def _push(self, url, when):
+        self.pages[url][7] = when
+        heapq.heappush(self.heap, (when, url))
+
+    def take(self, url):
+        # True when url is a scheduled revisit. If the fetch then fails, the page comes due again after min_interval
+        with self.lock:
+            if url not in self.scheduled:
+                return False
+            self.scheduled.discard(url)
+            self._push(url, time.time() + self.min_interval)
+            return True
+
+    def reschedule(self, url, now=None):
+        # For a due page the frontier did not accept: it comes due again after min_interval
+        now = time.time() if now is None else now
+        with self.lock:
+            if url in self.scheduled:
+                self.scheduled.discard(url)
+                self._push(url, now + self.min_interval)
+
+    def checkpoint(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        self.checkpoint()
+        self.connection.close()
+
+
+DEFAULT_STRIP_PARAMS = ('utm_*', 'fbclid', 'gclid')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url, strip_params=DEFAULT_STRIP_PARAMS):
+    # Dedup key of a URL: lowercase scheme and host, no default port or fragment, an empty path as '/', and the
+    # query parameters filtered and sorted as written. It is never fetched, so '/a/' stays distinct from '/a'
+    try:
+        parsed = urlsplit(url)
+        scheme = parsed.scheme.lower()
+        host = parsed.hostname or ''
+        port = parsed.port
+    except ValueError:
+        return url
+
+    if ':' in host:
+        host = f"[{host}]"
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+    if parsed.username is not None:
+        userinfo = parsed.username if parsed.password is None else f"{parsed.username}:{parsed.password}"
+        host = f"{userinfo}@{host}"
+
+    params = [param for param in parsed.query.split('&') if param and not any(
+        fnmatchcase(unquote_plus(param.split('=', 1)[0]).lower(), pattern) for pattern in strip_params)]
+    return urlunsplit((scheme, host, parsed.path or '/', '&'.join(sorted(params)), ''))
+
+
+SEEN_SETS = ('exact', 'hashed', 'bloom')
+
+
+def url_fingerprint(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class ExactSeenSet(set):
+    # Today's behaviour: every full URL string is kept
+    def memory_usage(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(url) for url in self)
+
+
+class HashedSeenSet:
+    # 64-bit URL fingerprints in an open-addressing table, 0 marks an empty slot
+    def __init__(self, capacity=1024):
+        size = 1024
+        while size * 3 < capacity * 4:
+            size *= 2
+        self.table = array('Q', bytes(8 * size))
+        self.mask = size - 1
+        self.count = 0
+
+    def _fingerprint(self, url):
+        return url_fingerprint(url) or 1
+
+    def _find(self, fingerprint):
+        # The mask comes from the table itself, so a lookup racing with _grow still stays inside the table it reads
+        table = self.table
+        mask = len(table) - 1
+        slot = fingerprint & mask
+        while table[slot] != 0 and table[slot] != fingerprint:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        table = array('Q', bytes(16 * len(self.table)))
+        mask = len(table) - 1
+        for fingerprint in self.table:
+            if fingerprint:
+                slot = fingerprint & mask
+                while table[slot] != 0:
+                    slot = (slot + 1) & mask
+                table[slot] = fingerprint
+        self.table, self.mask = table, mask
+
+    def add(self, url):
+        fingerprint = self._fingerprint(url)
+        slot = self._find(fingerprint)
+        if self.table[slot] == 0:
+            self.table[slot] = fingerprint
+            self.count += 1
+            if self.count * 4 > len(self.table) * 3:
+                self._grow()
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        return self.table[self._find(self._fingerprint(url))] != 0
+
+    def __len__(self):
+        return self.count
+
+    def memory_usage(self):
+        return sys.getsizeof(self) + self.table.itemsize * len(self.table)
+
+
+class BloomSeenSet:
+    # Fixed-size bit array sized for capacity URLs at the given false-positive rate
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, url):
+        added = False
+        for position in self._positions(url):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(url))
+
+    def __len__(self):
+        return self.count
+
+    def memory_usage(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.bits)
+
+
+class StripedSeenSet:
+    # Visited URLs split by hash over independent seen sets, each behind its own lock, so threads checking
+    # different URLs rarely wait for each other. Each stripe is sized for its share of the capacity
+    def __init__(self, kind='exact', capacity=1000000, error_rate=0.001, stripes=16):
+        self.kind = kind
+        self.stripes = [make_seen_set(kind, -(-capacity // stripes), error_rate) for _ in range(stripes)]
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def add_new(self, url):
+        # Atomic check-and-add: True only for the one caller that adds url
+        stripe = hash(url) % len(self.stripes)
+        with self.locks[stripe]:
+            if url in self.stripes[stripe]:
+                return False
+            self.stripes[stripe].add(url)
+            return True
+
+    def add(self, url):
+        self.add_new(url)
+
+    def update(self, urls):
+        for url in urls:
+            self.add_new(url)
+
+    def __contains__(self, url):
+        # No lock: a lookup racing with an add can only miss the new URL, and add_new decides under the lock
+        return url in self.stripes[hash(url) % len(self.stripes)]
+
+    def __len__(self):
+        return sum(len(stripe) for stripe in self.stripes)
+
+    def memory_usage(self):
+        return sys.getsizeof(self) + sum(stripe.memory_usage() for stripe in self.stripes)
+
+
+def make_seen_set(kind='exact', capacity=1000000, error_rate=0.001, stripes=1):
+    if stripes > 1:
+        return StripedSeenSet(kind, capacity, error_rate, stripes)
+    if kind == 'hashed':
+        return HashedSeenSet(capacity)
+    if kind == 'bloom':
+        return BloomSeenSet(capacity, error_rate)
+    return ExactSeenSet()
+
+
+class HttpCache:
+    # Validators, content hash and extracted results per canonical URL, least recently used rows evicted past max_bytes
+    def __init__(self, path, max_bytes=256 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT,
+                page_info TEXT NOT NULL, links TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+        """)
+        self.connection.commit()
+
+        self.lock = threading.Lock()
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, content_hash, page_info, links FROM entries WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+        return {'url': url, 'etag': row[0], 'last_modified': row[1], 'content_hash': row[2],
+                'page_info': json.loads(row[3]), 'links': json.loads(row[4])}
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, response_headers, content_hash, page_info, links):
+        response_headers = response_headers or {}
+        page_info_json = json.dumps(page_info, ensure_ascii=False)
+        links_json = json.dumps(links, ensure_ascii=False)
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+        size = len(url) + len(page_info_json) + len(links_json) + len(etag or '') + len(last_modified or '')
+
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM entries WHERE url = ?", (url,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, page_info_json, links_json, size, time.time()))
+            self.total_size += size - (previous[0] if previous else 0)
+
+            while self.total_size > self.max_bytes:
+                oldest = self.connection.execute(
+                    "SELECT url, size FROM entries ORDER BY last_used LIMIT 64").fetchall()
+                if not oldest:
+                    break
+                for old_url, old_size in oldest:
+                    if self.total_size <= self.max_bytes:
+                        break
+                    self.connection.execute("DELETE FROM entries WHERE url = ?", (old_url,))
+                    self.total_size -= old_size
+                    self.evictions += 1
+            self.connection.commit()
+
+    def checkpoint(self):
+        with self.lock:
+            self.connection.commit()
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+class PageRecord(Mapping):
+    # Read-only page-info view of one ResultStore row; compares equal to the dict it was stored from
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.store.value(self.row, key)
+
+    def __iter__(self):
+        return iter(self.store.shape(self.row))
+
+    def __len__(self):
+        return len(self.store.shape(self.row))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ResultStore(MutableMapping):
+    # Columnar crawl_results. URLs and hosts get integer ids, id/text_length/links_count live in
+    # array columns (-1 = not stored), and titles and headings share one table of interned strings.
+    # Each row keeps the key order of its page-info dict as an interned shape, and values that do
+    # not fit a column (errors, None ids, extra keys) go to a sparse extras dict
+    INT_FIELDS = ('id', 'text_length', 'links_count')
+
+    def __init__(self, results=None):
+        self.rows = {}
+        self.urls = []
+        self.hosts = []
+        self.host_ids = {}
+        self.host_column = array('I')
+        self.shapes = []
+        self.shape_ids = {}
+        self.shape_column = array('I')
+        self.int_columns = {name: array('q') for name in self.INT_FIELDS}
+        self.titles = []
+        self.headings = []
+        self.strings = {}
+        self.extras = {}
+        if results:
+            self.update(results)
+
+    def _intern(self, text):
+        if isinstance(text, str):
+            return self.strings.setdefault(text, text)
+        return text
+
+    def _table_id(self, table, ids, value):
+        table_id = ids.get(value)
+        if table_id is None:
+            table_id = ids[value] = len(table)
+            table.append(value)
+        return table_id
+
+    def shape(self, row):
+        return self.shapes[self.shape_column[row]]
+
+    def value(self, row, key):
+        if key not in self.shape(row):
+            raise KeyError(key)
+        extras = self.extras.get(row)
+        if extras and key in extras:
+            return extras[key]
+        if key == 'url':
+            return self.urls[row]
+        if key == 'title':
+            return self.titles[row]
+        if key == 'headings':
+            h1, h2 = self.headings[row]
+            return {'h1': list(h1), 'h2': list(h2)}
+        return self.int_columns[key][row]
+
+    def host_of(self, url):
+        return self.hosts[self.host_column[self.rows[url]]]
+
+    def __setitem__(self, url, page_info):
+        row = self.rows.get(url)
+        if row is None:
+            row = self.rows[url] = len(self.urls)
+            self.urls.append(url)
+            self.host_column.append(0)
+            self.shape_column.append(0)
+            for column in self.int_columns.values():
+                column.append(-1)
+            self.titles.append(None)
+            self.headings.append(None)
+
+        extras = {}
+        self.host_column[row] = self._table_id(self.hosts, self.host_ids, urlsplit(url).netloc)
+        self.shape_column[row] = self._table_id(self.shapes, self.shape_ids, tuple(page_info))
+        for name, column in self.int_columns.items():
+            value = page_info.get(name, -1)
+            if name in page_info and not (type(value) is int and value >= 0):
+                extras[name] = value
+                value = -1
+            column[row] = value
+        self.titles[row] = self._intern(page_info.get('title'))
+
+        headings = page_info.get('headings')
+        if isinstance(headings, dict) and headings.keys() == {'h1', 'h2'}:
+            self.headings[row] = (tuple(map(self._intern, headings['h1'])), tuple(map(self._intern, headings['h2'])))
+        else:
+            self.headings[row] = None
+            if 'headings' in page_info:
+                extras['headings'] = headings
+
+        if page_info.get('url', url) != url:
+            extras['url'] = page_info['url']
+        for key, value in page_info.items():
+            if key not in ('url', 'title', 'headings') + self.INT_FIELDS:
+                extras[key] = value
+        if extras:
+            self.extras[row] = extras
+        else:
+            self.extras.pop(row, None)
+
+    def __getitem__(self, url):
+        return PageRecord(self, self.rows[url])
+
+    def __delitem__(self, url):
+        # The row's column slots stay behind unused; only the lookups are dropped
+        row = self.rows.pop(url)
+        self.extras.pop(row, None)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f"ResultStore({len(self)} pages, {len(self.hosts)} hosts)"
+
+
+class LinkGraph:
+    # Page-to-page links in CSR form. Row r is the r-th recorded page: sources[r] is its URL id and
+    # targets[offsets[r]:offsets[r + 1]] are the URL ids it links to. URL ids are given out on first
+    # sight, so pages that were linked but never crawled are nodes without a row
+    BINARY_MAGIC = b'LINKGRF1'
+
+    def __init__(self):
+        self.url_ids = {}
+        self.urls = []
+        self.sources = array('I')
+        self.offsets = array('Q', [0])
+        self.targets = array('I')
+        self.lock = threading.Lock()
+
+    def _url_id(self, url):
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            url_id = self.url_ids[url] = len(self.urls)
+            self.urls.append(url)
+        return url_id
+
+    def add_page(self, url, links):
+        with self.lock:
+            self.sources.append(self._url_id(url))
+            self.targets.extend(self._url_id(link) for link in links)
+            self.offsets.append(len(self.targets))
+
+    @property
+    def node_count(self):
+        return len(self.urls)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def snapshot(self):
+        # Copies of the CSR arrays, so computations do not block pages being added
+        with self.lock:
+            return len(self.urls), array('I', self.sources), array('Q', self.offsets), array('I', self.targets)
+
+    def iter_edges(self):
+        # Yields (source id, target id) pairs row by row
+        _, sources, offsets, targets = self.snapshot()
+        for row, source in enumerate(sources):
+            for target in targets[offsets[row]:offsets[row + 1]]:
+                yield source, target
+
+    def export_edge_list(self, path, ids=False):
+        # One "source<TAB>target" line per edge, as URLs or as URL ids
+        _, sources, offsets, targets = self.snapshot()
+        names = range(len(self.urls)) if ids else self.urls
+        with open(path, 'w', encoding='utf-8') as file:
+            for row, source in enumerate(sources):
+                source_name = names[source]
+                file.writelines(f"{source_name}\t{names[target]}\n" for target in targets[offsets[row]:offsets[row + 1]])
+
+    def export_binary(self, path):
+        # Magic, node/row/edge counts, the sources, offsets and targets arrays (little-endian), then one URL per line
+        nodes, sources, offsets, targets = self.snapshot()
+        with open(path, 'wb') as file:
+            file.write(self.BINARY_MAGIC)
+            file.write(struct.pack('<QQQ', nodes, len(sources), len(targets)))
+            for column in (sources, offsets, targets):
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                column.tofile(file)
+            for url in self.urls[:nodes]:
+                file.write(url.encode('utf-8') + b'\n')
+
+    def export(self, path):
+        if path.endswith(('.tsv', '.txt')):
+            self.export_edge_list(path)
+        else:
+            self.export_binary(path)
+
+    @classmethod
+    def load_binary(cls, path):
+        graph = cls()
+        with open(path, 'rb') as file:
+            if file.read(len(cls.BINARY_MAGIC)) != cls.BINARY_MAGIC:
+                raise ValueError(f"{path} is not a link graph file")
+            nodes, rows, edges = struct.unpack('<QQQ', file.read(24))
+            graph.offsets = array('Q')
+            for column, count in ((graph.sources, rows), (graph.offsets, rows + 1), (graph.targets, edges)):
+                column.fromfile(file, count)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+            graph.urls = file.read().decode('utf-8').split('\n')[:nodes]
+        graph.url_ids = {url: url_id for url_id, url in enumerate(graph.urls)}
+        return graph
+
+    def in_degree(self):
+        # Number of recorded links pointing at each URL id
+        nodes, _, _, targets = self.snapshot()
+        if NUMPY_AVAILABLE:
+            return numpy.bincount(numpy.frombuffer(targets, dtype=numpy.uint32), minlength=nodes)
+        degrees = array('Q', bytes(8 * nodes))
+        for target in targets:
+            degrees[target] += 1
+        return degrees
+
+    def pagerank(self, damping=0.85, iterations=50, tolerance=1e-6):
+        # Power iteration; the rank of pages without outgoing links is spread evenly over all pages
+        nodes, sources, offsets, targets = self.snapshot()
+        if nodes == 0:
+            return []
+        if NUMPY_AVAILABLE:
+            return self._pagerank_numpy(nodes, sources, offsets, targets, damping, iterations, tolerance)
+
+        out_degree = array('Q', bytes(8 * nodes))
+        for row, source in enumerate(sources):
+            out_degree[source] += offsets[row + 1] - offsets[row]
+        dangling = [node for node in range(nodes) if out_degree[node] == 0]
+        rank = [1.0 / nodes] * nodes
+        for _ in range(iterations):
+            new_rank = [0.0] * nodes
+            for row, source in enumerate(sources):
+                start, end = offsets[row], offsets[row + 1]
+                if start == end:
+                    continue
+                share = rank[source] / out_degree[source]
+                for target in targets[start:end]:
+                    new_rank[target] += share
+            base = (1 - damping + damping * sum(rank[node] for node in dangling)) / nodes
+            new_rank = [base + damping * value for value in new_rank]
+            change = sum(abs(new - old) for new, old in zip(new_rank, rank))
+            rank = new_rank
+            if change < tolerance:
+                break
+        return rank
+
+    def _pagerank_numpy(self, nodes, sources, offsets, targets, damping, iterations, tolerance):
+        row_lengths = numpy.diff(numpy.frombuffer(offsets, dtype=numpy.uint64)).astype(numpy.int64)
+        edge_sources = numpy.repeat(numpy.frombuffer(sources, dtype=numpy.uint32), row_lengths)
+        edge_targets = numpy.frombuffer(targets, dtype=numpy.uint32)
+        out_degree = numpy.bincount(edge_sources, minlength=nodes).astype(numpy.float64)
+        dangling = out_degree == 0
+        edge_weights = 1.0 / out_degree[edge_sources]
+        rank = numpy.full(nodes, 1.0 / nodes)
+        for _ in range(iterations):
+            new_rank = numpy.bincount(edge_targets, weights=rank[edge_sources] * edge_weights, minlength=nodes)
+            new_rank = (1 - damping + damping * rank[dangling].sum()) / nodes + damping * new_rank
+            change = numpy.abs(new_rank - rank).sum()
+            rank = new_rank
+            if change < tolerance:
+                break
+        return rank
+
+    def top(self, scores, count=10):
+        # The count highest-scoring URLs as (url, score), for in_degree() or pagerank() output
+        best = heapq.nlargest(count, range(len(scores)), key=scores.__getitem__)
+        return [(self.urls[url_id], scores[url_id]) for url_id in best]
+
+
+class ResultSink:
+    # Receives page-info records in batches from a SinkWriter thread; open() and close() run on that thread.
+    # With append set, open() keeps what an earlier run wrote; a resumed crawl sets it on all its sinks
+    append = False
+
+    def open(self):
+        pass
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(ResultSink):
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.file = None
+
+    def open(self):
+        self.file = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+
+    def write_batch(self, records):
+        self.file.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink(ResultSink):
+    COLUMNS = ['id', 'url', 'title', 'h1', 'h2', 'text_length', 'links_count', 'error']
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.file = None
+        self.writer = None
+
+    def open(self):
+        self.file = open(self.path, 'a' if self.append else 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        # An appended file already has its header, unless it is new or empty
+        if self.file.tell() == 0:
+            self.writer.writerow(self.COLUMNS)
+
+    def write_batch(self, records):
+        for record in records:
+            headings = record.get('headings', {})
+            self.writer.writerow([record.get('id'), record.get('url'), record.get('title'),
+                                  ' | '.join(headings.get('h1', [])), ' | '.join(headings.get('h2', [])),
+                                  record.get('text_length'), record.get('links_count'), record.get('error')])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteSink(ResultSink):
+    # Rows are keyed by URL and the table is never dropped, so it always keeps an earlier run's pages
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.connection = None
+
+    def open(self):
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER, url TEXT PRIMARY KEY, title TEXT, text_length INTEGER, links_count INTEGER, data TEXT)""")
+
+    def write_batch(self, records):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO pages (id, url, title, text_length, links_count, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [(record.get('id'), record.get('url'), record.get('title'), record.get('text_length'),
+              record.get('links_count'), json.dumps(record, ensure_ascii=False)) for record in records])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+SINKS = {'jsonl': JsonLinesSink, 'csv': CsvSink, 'sqlite': SqliteSink}
+
+
+def make_sink(path, output_format='', append=False):
+    # The format defaults to the file extension: .jsonl, .csv, .db/.sqlite
+    if not output_format:
+        extension = path.rsplit('.', 1)[-1].lower()
+        output_format = {'db': 'sqlite', 'sqlite3': 'sqlite', 'json': 'jsonl'}.get(extension, extension)
+    if output_format not in SINKS:
+        raise ValueError(f"Unknown output format {output_format}, use one of {', '.join(SINKS)}")
+    return SINKS[output_format](path, append)
+
+
+class SinkWriter(Thread):
+    # Background thread that writes records to a sink in batches, so workers never wait on disk.
+    # The queue is bounded, so a sink slower than the crawl holds the workers back instead of filling memory
+    def __init__(self, sink, batch_size=100, flush_interval=1.0, queue_size=1000):
+        Thread.__init__(self, daemon=True)
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records = Queue(maxsize=queue_size)
+        self.error = None
+
+    def write(self, record):
+        # False once the sink has failed; records are no longer queued then
+        while self.error is None:
+            try:
+                self.records.put(record, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            self.sink.open()
+            finished = False
+            while not finished:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    try:
+                        record = self.records.get(timeout=max(deadline - time.monotonic(), 0))
+                    except Empty:
+                        break
+                    if record is None:
+                        finished = True
+                        break
+                    batch.append(record)
+                if batch:
+                    self.sink.write_batch(batch)
+            self.sink.close()
+        except Exception as e:
+            self.error = e
+            logging.getLogger(__name__).error(f"Result sink {type(self.sink).__name__} failed: {e}")
+
+    def close(self):
+        # A failed writer has stopped reading, so its full queue must not block the shutdown
+        while self.is_alive():
+            try:
+                self.records.put(None, timeout=0.1)
+                break
+            except Full:
+                continue
+        self.join()
+
+
+class Histogram:
+    # Latency histogram in seconds with fixed buckets, like a Prometheus histogram
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket that holds the q-th observation
+        if not self.count:
+            return 0.0
+        seen = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return math.inf
+
+
+def prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    # Per-stage latency histograms, labelled counters and gauges read on demand. One short lock per update
+    # keeps it cheap enough to leave on; hosts past max_hosts share the label "other"
+    def __init__(self, max_hosts=1000):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.hosts = set()
+        self.max_hosts = max_hosts
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, label=None, value=''):
+        key = (name, label, value)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def inc_host(self, name, host, amount=1):
+        with self.lock:
+            if host not in self.hosts:
+                if len(self.hosts) >= self.max_hosts:
+                    host = 'other'
+                else:
+                    self.hosts.add(host)
+            key = (name, 'host', host)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def total(self, name):
+        with self.lock:
+            return sum(count for (counter, _, _), count in self.counters.items() if counter == name)
+
+    def quantile(self, stage, q):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            return histogram.quantile(q) if histogram is not None else 0.0
+
+    def render(self):
+        # Prometheus text exposition format
+        with self.lock:
+            counters = sorted(self.counters.items(), key=lambda item: (item[0][0], str(item[0][2])))
+            histograms = [(stage, list(histogram.counts), histogram.count, histogram.total, histogram.buckets)
+                          for stage, histogram in sorted(self.histograms.items())]
+        lines = []
+        declared = set()
+        for (name, label, value), count in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE crawler_{name}_total counter")
+            labels = f'{{{label}="{prometheus_label(value)}"}}' if label else ''
+            lines.append(f"crawler_{name}_total{labels} {count}")
+        if histograms:
+            lines.append("# TYPE crawler_stage_seconds histogram")
+        for stage, counts, count, total, buckets in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"# TYPE crawler_{name} gauge")
+            lines.append(f"crawler_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    # Serves registry.render() at http://host:port/metrics from a daemon thread
+    def __init__(self, registry, port=0, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsReporter(Thread):
+    # Logs one summary line every interval seconds until stopped
+    def __init__(self, registry, logger, interval):
+        Thread.__init__(self, daemon=True)
+        self.registry = registry
+        self.logger = logger
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def summary(self, elapsed, pages_before, bytes_before):
+        registry = self.registry
+        pages = registry.total('pages')
+        read = registry.total('bytes')
+        queue = registry.gauges['queue_depth']() if 'queue_depth' in registry.gauges else 0
+
+        def latency(stage):
+            return (f"{stage} p50 {registry.quantile(stage, 0.5) * 1000:.0f} ms "
+                    f"p99 {registry.quantile(stage, 0.99) * 1000:.0f} ms")
+
+        concurrency = (f", concurrency {registry.gauges['concurrency_active']()}/"
+                       f"{registry.gauges['concurrency_limit']()}" if 'concurrency_limit' in registry.gauges else "")
+        return (f"Metrics: {pages} pages ({(pages - pages_before) / elapsed:.1f}/s), "
+                f"{(read - bytes_before) / elapsed / 2 ** 20:.2f} MiB/s, queue {queue}{concurrency}, "
+                f"{latency('ttfb')}, {latency('parse')}, {latency('queue_wait')}")
+
+    def run(self):
+        pages_before = bytes_before = 0
+        started = time.monotonic()
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            self.logger.info(self.summary(now - started, pages_before, bytes_before))
+            started = now
+            pages_before = self.registry.total('pages')
+            bytes_before = self.registry.total('bytes')
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def declared_length(headers):
+    try:
+        return int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def download_rejection(headers, max_bytes):
+    # Why a response should be dropped from its headers alone, or None to read the body
+    content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type and content_type not in HTML_CONTENT_TYPES:
+        return 'content-type'
+    length = declared_length(headers)
+    if length is not None and length > max_bytes:
+        return 'too large'
+    return None
+
+
+class DownloadStats:
+    # Body bytes read, and responses dropped before or while reading with the bytes that were not read
+    def __init__(self):
+        self.pages = 0
+        self.bytes_read = 0
+        self.aborts = {}
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+
+    def record_download(self, size):
+        with self.lock:
+            self.pages += 1
+            self.bytes_read += size
+
+    def record_abort(self, reason, received, length):
+        # The unread size is only known when the server declared Content-Length
+        with self.lock:
+            self.aborts[reason] = self.aborts.get(reason, 0) + 1
+            self.bytes_read += received
+            if length is not None:
+                self.bytes_saved += max(length - received, 0)
+
+
+class HashRing:
+    # Consistent hashing of hosts onto cluster nodes. Every node owns `replicas` points on the ring, so hosts spread
+    # evenly and adding or removing a node only moves about 1/n of them
+    def __init__(self, nodes, replicas=64):
+        self.nodes = list(nodes)
+        points = sorted((self.hash(f"{node}#{replica}"), index)
+                        for index, node in enumerate(self.nodes) for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.owners = [owner for _, owner in points]
+
+    @staticmethod
+    def hash(text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def owner(self, host):
+        # Index of the node owning host: the first node point clockwise from the host's hash
+        return self.owners[bisect.bisect(self.points, self.hash(host.lower())) % len(self.points)]
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class ClusterNode:
+    # One node of a crawl split over several processes or machines. Each node fetches only the hosts the HashRing
+    # gives it, so the frontier and the visited set are partitioned. Links to other nodes' hosts are forwarded once
+    # per URL, and every other node sends its stored pages to node 0. Both are buffered per node and sent in batches,
+    # one JSON line per TCP connection, acknowledged once the receiver has queued or stored them.
+    # Node 0 merges all pages into its results and stops the cluster when max_pages is reached, or when every node
+    # is idle and the sent and received counts match in two polls in a row
+    def __init__(self, crawler, nodes, index, batch_size=500, flush_interval=0.2):
+        if not 0 <= index < len(nodes):
+            raise ValueError(f"node_index {index} is not in cluster_nodes")
+        self.crawler = crawler
+        self.addresses = [parse_address(node) for node in nodes]
+        self.index = index
+        self.ring = HashRing(nodes)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.outbox = {}
+        self.forwarded = HashedSeenSet()
+        self.lock = threading.Lock()
+        self.sending = 0
+        self.sent = 0
+        self.received = 0
+        self.done = set()
+        self.finished = threading.Event()
+        self.wake = threading.Event()
+        self.server = None
+        self.threads = []
+
+    @property
+    def coordinator(self):
+        return self.index == 0
+
+    def route(self, links, depth, score):
+        # Returns the links this node owns; the rest wait in the outbox of their node
+        local = []
+        with self.lock:
+            for link in links:
+                key = self.crawler.canonicalize(link)
+                owner = self.ring.owner(urlsplit(key).netloc)
+                if owner == self.index:
+                    local.append(link)
+                elif key not in self.forwarded:
+                    self.forwarded.add(key)
+                    batch = self.outbox.setdefault((owner, 'links'), [])
+                    batch.append([link, depth, score])
+                    if len(batch) >= self.batch_size:
+                        self.wake.set()
+        return local
+
+    def forward_page(self, url, page_info):
+        if self.coordinator:
+            return
+        with self.lock:
+            batch = self.outbox.setdefault((0, 'pages'), [])
+            batch.append([url, dict(page_info)])
+            if len(batch) >= self.batch_size:
+                self.wake.set()
+
+    def send(self, node, message):
+        # Returns the reply, or None when the node cannot be reached (yet)
+        try:
+            with socket.create_connection(self.addresses[node], timeout=max(self.crawler.timeout, 5)) as connection:
+                connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+                reply = connection.makefile('rb').readline()
+            return json.loads(reply) if reply else None
+        except (OSError, ValueError):
+            return None
+
+    def flush(self):
+        # Returns False when a batch could not be delivered; it stays in the outbox for the next try
+        delivered = True
+        with self.lock:
+            keys = list(self.outbox)
+        for node, kind in keys:
+            with self.lock:
+                items = self.outbox.get((node, kind))
+                if not items:
+                    continue
+                batch, self.outbox[(node, kind)] = items[:self.batch_size], items[self.batch_size:]
+                self.sending += 1
+            try:
+                reply = self.send(node, {'type': kind, 'node': self.index, 'items': batch})
+                with self.lock:
+                    if reply is None:
+                        self.outbox[(node, kind)] = batch + self.outbox[(node, kind)]
+                        delivered = False
+                    else:
+                        self.sent += len(batch)
+            finally:
+                with self.lock:
+                    self.sending -= 1
+        return delivered
+
+    def status(self):
+        with self.lock:
+            idle = self.crawler.url_queue.unfinished_tasks == 0 and not self.sending and \
+                not any(self.outbox.values())
+            return {'idle': idle, 'sent': self.sent, 'received': self.received}
+
+    def handle(self, message):
+        kind = message.get('type')
+        items = message.get('items', [])
+        if kind == 'status':
+            return self.status()
+        if kind == 'stop':
+            self.stop_local()
+        elif kind == 'done':
+            with self.lock:
+                self.done.add(message['node'])
+        elif kind == 'links':
+            groups = {}
+            for url, depth, score in items:
+                groups.setdefault((depth, score), []).append(url)
+            for (depth, score), urls in groups.items():
+                self.crawler.enqueue_links(urls, depth, score)
+        elif kind == 'pages':
+            for url, page_info in items:
+                self.crawler.store_remote_page(url, page_info)
+        with self.lock:
+            self.received += len(items)
+        return {'ok': True}
+
+    def stop_local(self):
+        self.finished.set()
+        self.crawler.stop_requested = True
+        self.wake.set()
+
+    def run_flusher(self):
+        while not self.finished.is_set():
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def run_monitor(self):
+        previous = None
+        while not self.finished.wait(self.flush_interval):
+            if self.crawler.total_pages_crawled >= self.crawler.max_pages:
+                break
+            statuses = [self.status() if node == self.index else self.send(node, {'type': 'status'})
+                        for node in range(len(self.addresses))]
+            if any(status is None for status in statuses):
+                previous = None
+                continue
+            counts = [(status['sent'], status['received']) for status in statuses]
+            quiet = all(status['idle'] for status in statuses) and \
+                sum(sent for sent, _ in counts) == sum(received for _, received in counts)
+            if quiet and counts == previous:
+                break
+            previous = counts if quiet else None
+        for node in range(len(self.addresses)):
+            if node != self.index:
+                self.send(node, {'type': 'stop'})
+        self.stop_local()
+
+    def start(self):
+        node = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if line:
+                    self.wfile.write(json.dumps(node.handle(json.loads(line))).encode('utf-8') + b'\n')
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(self.addresses[self.index], Handler)
+        self.threads = [Thread(target=self.server.serve_forever, daemon=True),
+                        Thread(target=self.run_flusher, daemon=True)]
+        if self.coordinator:
+            self.threads.append(Thread(target=self.run_monitor, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, wait=60):
+        # Node 0 waits for every node's last pages; the others deliver them and say they are done
+        deadline = time.monotonic() + wait
+        if self.coordinator:
+            while len(self.done) < len(self.addresses) - 1 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        else:
+            self.stop_local()
+            while not self.flush() and time.monotonic() < deadline:
+                time.sleep(self.flush_interval)
+            while self.send(0, {'type': 'done', 'node': self.index}) is None and time.monotonic() < deadline:
+                time.sleep(self.flush_interval)
+        self.stop_local()
+        self.server.shutdown()
+        self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+
+
+THROTTLE_STATUSES = (429, 503)
+MAX_RETRY_AFTER = 300
+
+
+def retry_after(headers):
+    # Seconds asked for by a Retry-After header (delta-seconds or an HTTP date), capped at MAX_RETRY_AFTER
+    value = (headers or {}).get('Retry-After')
+    if not value:
+        return 0.0
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return 0.0
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class AimdLimit:
+    # One additive-increase/multiplicative-decrease limit. A window is as many completed fetches as the limit,
+    # roughly one round trip of every slot. The limit only grows after a window in which it was reached
+    __slots__ = ('floor', 'ceiling', 'limit', 'active', 'slow_start', 'saturated', 'done', 'latency', 'hold')
+
+    def __init__(self, floor, ceiling):
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.limit = floor
+        self.active = 0
+        self.slow_start = True
+        self.saturated = False
+        self.done = 0
+        self.latency = 0.0
+        self.hold = 0
+
+    def start(self):
+        self.active += 1
+        if self.active >= self.limit:
+            self.saturated = True
+
+    def finish(self, latency=None):
+        # Returns the mean latency when this fetch completes a window
+        self.active -= 1
+        if self.hold:
+            self.hold -= 1
+        if latency is None:
+            return None
+        self.done += 1
+        self.latency += latency
+        if self.done < self.limit:
+            return None
+        mean = self.latency / self.done
+        self.done = 0
+        self.latency = 0.0
+        return mean
+
+    def grow(self):
+        # Doubles until the first decrease (slow start), then adds one
+        if self.saturated:
+            self.limit = min(self.ceiling, self.limit * 2 if self.slow_start else self.limit + 1)
+        self.saturated = self.active >= self.limit
+
+    def shrink(self, factor):
+        # Fetches already in flight were started at the old limit, so their signals do not shrink it again
+        if self.hold:
+            return False
+        self.slow_start = False
+        self.limit = max(self.floor, int(self.limit * factor))
+        self.hold = self.active
+        self.done = 0
+        self.latency = 0.0
+        self.saturated = False
+        return True
+
+
+class AdaptiveConcurrency:
+    # Tunes how many fetches run at once, globally and per host, like TCP congestion control. Both limits start at
+    # floor and grow while fetches succeed. A 429/503, a timeout or a connection error halves the host's limit and
+    # the global one. A window whose mean latency is over latency_tolerance times the best window so far takes 10%
+    # off the global limit, before servers start refusing
+    def __init__(self, ceiling, floor=1, host_ceiling=0, latency_tolerance=2.0):
+        ceiling = max(ceiling, 1)
+        self.floor = min(max(floor, 1), ceiling)
+        self.host_ceiling = min(host_ceiling, ceiling) if host_ceiling > 0 else ceiling
+        self.latency_tolerance = latency_tolerance
+        self.total = AimdLimit(self.floor, ceiling)
+        self.hosts = {}
+        self.baseline = None
+        self.peak = self.total.limit
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self.total.limit
+
+    @property
+    def active(self):
+        return self.total.active
+
+    def host_limit(self, host):
+        limit = self.hosts.get(host)
+        return limit.limit if limit is not None else min(self.floor, self.host_ceiling)
+
+    def _acquire(self, host):
+        limit = self.hosts.get(host)
+        if limit is None:
+            limit = self.hosts[host] = AimdLimit(min(self.floor, self.host_ceiling), self.host_ceiling)
+        if self.total.active >= self.total.limit or limit.active >= limit.limit:
+            return False
+        self.total.start()
+        limit.start()
+        return True
+
+    def try_acquire(self, host):
+        with self.condition:
+            return self._acquire(host)
+
+    def acquire(self, host):
+        # Never waits forever: a full limit means some fetch is running and will release its slot
+        with self.condition:
+            self.condition.wait_for(lambda: self._acquire(host))
+
+    def release(self, host, latency=None, status=None):
+        # latency is None when the request failed. Returns (before, after, reason) when the global limit changed
+        with self.condition:
+            host_limit = self.hosts[host]
+            before = self.total.limit
+            reason = None
+            if latency is None or status in THROTTLE_STATUSES:
+                reason = str(status) if latency is not None else 'error'
+                # Shrinking first counts this fetch among the ones in flight at the old limit
+                host_limit.shrink(0.5)
+                host_limit.finish()
+                if self.total.shrink(0.5):
+                    self.decreases += 1
+                self.total.finish()
+            else:
+                if host_limit.finish(latency) is not None:
+                    host_limit.grow()
+                mean = self.total.finish(latency)
+                if mean is not None:
+                    if self.baseline is None or mean < self.baseline:
+                        self.baseline = mean
+                    else:
+                        # Drifts up slowly, so hosts that are simply slower do not keep the limit down forever
+                        self.baseline += (mean - self.baseline) * 0.05
+                    if mean > self.baseline * self.latency_tolerance:
+                        reason = 'latency'
+                        if self.total.shrink(0.9):
+                            self.decreases += 1
+                    else:
+                        reason = 'increase'
+                        self.total.grow()
+            self.peak = max(self.peak, self.total.limit)
+            self.condition.notify_all()
+            if self.total.limit != before:
+                return before, self.total.limit, reason
+            return None
+
+
+class PageBudget:
+    # Exact max_pages accounting. A worker that holds a URL reserves a slot before it fetches and releases it after;
+    # a stored page counts as used while its slot is still reserved, so used + reserved never lets more than limit
+    # pages be stored. A limit of None never runs out. Page ids come from a counter whose next() is atomic, so ids
+    # need no lock
+    def __init__(self, limit=None, used=0):
+        self.limit = limit
+        self.used = used
+        self.reserved = 0
+        self.ids = itertools.count(used)
+        self.condition = threading.Condition(threading.Lock())
+
+    def reserve(self, timeout=None):
+        # Blocks up to timeout while every slot is reserved; False when none is free, without waiting once all are used
+        with self.condition:
+            while self.limit is not None and self.used + self.reserved >= self.limit:
+                if self.used >= self.limit or timeout == 0 or not self.condition.wait(timeout):
+                    return False
+            self.reserved += 1
+            return True
+
+    def release(self):
+        # Every waiter is woken: the slot may be free again, or the budget may be used up and they should stop
+        with self.condition:
+            self.reserved -= 1
+            self.condition.notify_all()
+
+    def count(self):
+        with self.condition:
+            self.used += 1
+            if self.exhausted():
+                self.condition.notify_all()
+
+    def take(self):
+        # Counts a page stored without a reservation, such as one from another cluster node, if a slot is free
+        with self.condition:
+            if self.limit is not None and self.used + self.reserved >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    def exhausted(self):
+        return self.limit is not None and self.used >= self.limit
+
+    def next_id(self):
+        return next(self.ids)
+
+    def reset(self, used):
+        with self.condition:
+            self.used = used
+            self.ids = itertools.count(used)
+            self.condition.notify_all()
+
+
+RESULT_BATCH_SIZE = 64
+
+
+class WebCrawler:
+    def __init__(self, start_urls, max_pages, max_depth, max_workers,timeout, parser='html.parser',
+                 politeness_delay=0.5, host_delays=None, respect_robots=False, state_file=None, resume=False,
+                 seen_set='exact', seen_set_capacity=0, seen_set_error_rate=0.001, seen_set_stripes=16,
+                 strip_query_params=DEFAULT_STRIP_PARAMS, frontier_capacity=100000, parser_workers=0,
+                 sinks=None, keep_results=True, cache_file=None, cache_max_bytes=256 * 2 ** 20,
+                 search_index=False, index_file=None, compact_results=False, record_link_graph=False,
+                 link_graph_file=None, robots_ttl=86400, use_sitemaps=False, sitemap_urls=None, max_sitemaps=100,
+                 stream_downloads=False, max_page_bytes=5 * 2 ** 20, metrics_port=None, metrics_interval=0,
+                 adaptive_concurrency=False, min_concurrency=1, max_host_concurrency=0, cluster_nodes=None,
+                 node_index=0, near_duplicates=False, near_duplicate_distance=3, continuous=False, revisit_file=None,
+                 revisit_rate=1.0, max_staleness=0.5, min_revisit_interval=60, max_revisit_interval=7 * 86400,
+                 initial_revisit_interval=3600, dns_cache=False, dns_ttl=300, dns_negative_ttl=60, dns_concurrency=8):
+        if start_urls is None:
+            raise TypeError("start_urls cannot be None")
+        if max_pages is None:
+            raise TypeError("max_pages cannot be None")
+        if max_depth is None:
+            raise TypeError("max_depth cannot be None")
+        if max_workers is None:
+            raise TypeError("max_workers cannot be None")
+        if timeout is None:
+            raise TypeError("timeout cannot be None")
+
+        if not isinstance(max_pages, int):
+            raise TypeError("max_pages must be a number bigger or even than 1")
+        if not isinstance(max_depth, int):
+            raise TypeError("max_depth must be a number bigger than 1")
+        if not isinstance(max_workers, int):
+            raise TypeError("max_workers must be a 2 or bigger")
+        if not isinstance(timeout, int):
+            raise TypeError
+
+        if max_pages is True or max_pages is False:
+            raise TypeError("max_pages cannot be True or False")
+        if max_depth is True or max_depth is False:
+            raise TypeError("max_depth cannot be True or False")
+        if max_workers is True or max_workers is False:
+            raise TypeError("max_workers cannot be True or False")
+        if not isinstance(politeness_delay, (int, float)) or isinstance(politeness_delay, bool):
+            raise TypeError("politeness_delay must be a number of seconds")
+        if host_delays is not None and not isinstance(host_delays, dict):
+            raise TypeError("host_delays must be a dict of host: seconds")
+        if isinstance(strip_query_params, str) or not all(isinstance(name, str) for name in strip_query_params):
+            raise TypeError("strip_query_params must be a list of parameter names")
+
+        if timeout is True:
+            #I set default time out on one because mot mustch pages have slower response than 1 but there are some exceptions
+            self.timeout = 1
+        elif timeout is False:
+            #There is possibility that program will fail somewhere because som pages have slower response
+            self.timeout = 0
+
+        if max_pages < max_depth:
+            self.max_pages = max_depth *2
+        else:
+            self.max_depth = max_depth
+
+        self.start_urls = start_urls if isinstance(start_urls, list) else [start_urls]
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        if max_depth <= 0:
+            self.max_depth = 10
+        if max_depth >= 1000:
+            self.max_depth = 100
+        if max_workers <= 0:
+            self.max_workers = 2
+        if timeout < 0:
+            self.timeout = 1
+
+        # In continuous mode max_pages caps the pages being kept fresh, not the number of fetches
+        self.budget = PageBudget(None if continuous else self.max_pages)
+        self.url_queue = CrawlFrontier(max(politeness_delay, 0), host_delays, capacity=max(frontier_capacity, 0),
+                                       max_depth=self.max_depth,
+                                       budget=None if continuous else lambda: self.max_pages - self.total_pages_crawled,
+                                       key=self.canonicalize)
+        self.robots = RobotsCache(self.timeout, robots_ttl) if respect_robots else None
+        self.robots_blocked = 0
+        self.use_sitemaps = use_sitemaps or bool(sitemap_urls)
+        self.sitemap_urls = list(sitemap_urls or [])
+        self.max_sitemaps = max_sitemaps
+        self.sitemap_thread = None
+        self.sitemap_stop = threading.Event()
+        self.ingesting_sitemaps = False
+        self.sitemap_urls_queued = 0
+        self.stream_downloads = stream_downloads
+        self.max_page_bytes = max_page_bytes
+        self.download_stats = DownloadStats()
+        # Always collected; the endpoint and the summary line are opt-in
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge('queue_depth', self.url_queue.qsize)
+        self.metrics.gauge('pages_crawled', lambda: self.total_pages_crawled)
+        self.metrics_port = metrics_port
+        self.metrics_interval = metrics_interval
+        # Hosts are resolved ahead, as their links are queued; requests reaches the cache through socket.getaddrinfo
+        self.dns = DnsCache(dns_ttl, dns_negative_ttl, dns_concurrency, self.metrics) if dns_cache else None
+        self.metrics_server = None
+        self.metrics_reporter = None
+        # max_workers threads still run; the limit decides how many of them fetch at once
+        self.min_concurrency = min_concurrency
+        self.max_host_concurrency = max_host_concurrency
+        self.concurrency = AdaptiveConcurrency(self.max_workers, min_concurrency, max_host_concurrency) \
+            if adaptive_concurrency else None
+        if self.concurrency is not None:
+            self.metrics.gauge('concurrency_limit', lambda: self.concurrency.limit)
+            self.metrics.gauge('concurrency_active', lambda: self.concurrency.active)
+        self.strip_query_params = tuple(name.lower() for name in strip_query_params)
+        self.crawl_results = ResultStore() if compact_results else {}
+        self.link_graph = LinkGraph() if record_link_graph or link_graph_file else None
+        self.link_graph_file = link_graph_file
+        self.near_duplicates = SimHashIndex(near_duplicate_distance) if near_duplicates else None
+
+        self.visited_lock = threading.Lock()
+        self.results_lock = threading.Lock()
+        # Worker threads collect results here and merge them into crawl_results in batches
+        self.local = threading.local()
+
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s: %(message)s'
+        )
+        self.logger = logging.getLogger(__name__)
+
+        if parser not in PARSERS:
+            self.logger.warning(f"Unknown parser {parser}, using html.parser")
+            parser = 'html.parser'
+        if parser == 'lxml' and not LXML_AVAILABLE:
+            self.logger.warning("lxml is not installed, using html.parser")
+            parser = 'html.parser'
+        self.parser = parser
+
+        if not isinstance(parser_workers, int) or isinstance(parser_workers, bool):
+            raise TypeError("parser_workers must be a number")
+        # Fetching stays in max_workers threads (or coroutines); parsing moves to this many processes
+        self.parser_workers = max(parser_workers, 0)
+        self.parser_pool = None
+
+        self.sinks = list(sinks or [])
+        self.sink_writers = []
+        self.sink_error = None
+        self.listeners = []
+        self.keep_results = keep_results
+        self.cache = HttpCache(cache_file, cache_max_bytes) if cache_file else None
+        # The index holds every page's title and headings, so it is only built when asked for and results are kept
+        if search_index and not keep_results:
+            self.logger.warning("search_index needs keep_results, the search index is not built")
+        self.search_index = SearchIndex() if search_index and keep_results else None
+        self.index_file = index_file
+
+        if seen_set not in SEEN_SETS:
+            self.logger.warning(f"Unknown seen_set {seen_set}, using exact")
+            seen_set = 'exact'
+        if not 0 < seen_set_error_rate < 1:
+            self.logger.warning("seen_set_error_rate must be between 0 and 1, using 0.001")
+            seen_set_error_rate = 0.001
+        # Only fetched URLs are marked visited, so a few times max_pages is enough by default
+        capacity = seen_set_capacity if seen_set_capacity > 0 else max(self.max_pages * 4, 1024)
+        self.visited_urls = make_seen_set(seen_set, capacity, seen_set_error_rate, max(seen_set_stripes, 1))
+        self.seen_set = seen_set
+
+        self.stop_requested = False
+        self.cluster = ClusterNode(self, cluster_nodes, node_index) if cluster_nodes else None
+        self.revisits = RevisitScheduler(revisit_file, max_staleness, min_revisit_interval, max_revisit_interval,
+                                         initial_revisit_interval) if continuous else None
+        self.revisit_rate = revisit_rate if revisit_rate > 0 else 1.0
+        self.revisit_thread = None
+        self.revisit_stop = threading.Event()
+        if self.revisits is not None and len(self.revisits):
+            # Known pages are only fetched again when they are due, even when a link leads to them earlier
+            self.visited_urls.update(self.canonicalize(url) for url in self.revisits.pages)
+            self.total_pages_crawled = len(self.revisits)
+            self.logger.info(f"Continuous crawl: {len(self.revisits)} pages scheduled for revisits")
+        if resume and not state_file:
+            state_file = 'crawl_state.db'
+        self.state = CrawlState(state_file) if state_file else None
+
+        if resume and self.state is not None and not self.state.is_empty():
+            pending, visited, stored_results = self.state.load()
+            # The stored pages are already in the sinks' files from the interrupted run
+            for sink in self.sinks:
+                sink.append = True
+            self.visited_urls.update(self.canonicalize(url) for url in visited)
+            self.crawl_results.update(stored_results)
+            if self.search_index is not None:
+                for page_info in stored_results.values():
+                    self.search_index.add(page_info)
+            self.total_pages_crawled = len(stored_results)
+            for url, depth in pending:
+                self.url_queue.put((url, depth))
+            self.logger.info(f"Resuming crawl: {len(stored_results)} pages done, {len(pending)} URLs in frontier")
+        else:
+            if self.state is not None:
+                self.state.clear()
+            self.enqueue_links(self.unique_links(self.start_urls), 0)
+
+    @property
+    def total_pages_crawled(self):
+        return self.budget.used
+
+    @total_pages_crawled.setter
+    def total_pages_crawled(self, value):
+        self.budget.reset(value)
+
+    def enqueue_links(self, links, depth, score=0.0):
+        links, accepted = self.queue_links(links, depth, score)
+        if self.state is not None:
+            self.state.add_urls((link, depth) for link in links)
+        return accepted
+
+    def queue_links(self, links, depth, score=0.0):
+        # Returns the links the stored frontier keeps and the ones url_queue accepted; the caller stores them
+        if self.revisits is not None and self.total_pages_crawled >= self.max_pages:
+            # Continuous crawl with max_pages pages known: only revisits are queued
+            return [], []
+        if self.cluster is not None:
+            # Other nodes' links are forwarded before robots.txt is checked; their owner checks it
+            links = self.cluster.route(links, depth, score)
+        if self.robots is not None:
+            allowed = [link for link in links if self.robots_allows(link)]
+            self.robots_blocked += len(links) - len(allowed)
+            links = allowed
+        accepted = [link for link in links if self.url_queue.put((link, depth), score=score)]
+        if self.dns is not None:
+            for host in {urlsplit(link).hostname for link in accepted}:
+                self.dns.prefetch(host)
+        # The stored frontier keeps rejected and evicted URLs too, so a resumed crawl with a bigger budget can reach them
+        return links, accepted
+
+    def complete_url(self, url):
+        if self.state is not None:
+            self.state.complete_url(url)
+
+    def canonicalize(self, url):
+        return canonicalize_url(url, self.strip_query_params)
+
+    def is_valid_url(self, url):
+
+        try:
+            parsed = urlparse(url)
+
+            seen = self.canonicalize(url) in self.visited_urls
+
+            checks = [
+                parsed.scheme in ['http', 'https'],
+                bool(parsed.netloc),
+                not seen,
+                not url.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webm', '.pdf', '.mp4')),
+                len(url) < 300,
+            ]
+
+            return all(checks)
+
+        except Exception as e:
+            self.logger.warning(f"URL validation error for {url}: {e}")
+            return False
+
+    def run_parser(self, html_content, url, encoding=None):
+        # Returns the raw (page_info, links) from parse_page, or an error record
+        start = time.perf_counter()
+        try:
+            if self.parser_pool is not None:
+                return self.parser_pool.submit(parse_page, html_content, url, self.parser,
+                                               self.near_duplicates is not None, encoding).result()
+            return parse_page(html_content, url, self.parser, self.near_duplicates is not None, encoding)
+        except Exception as e:
+            self.metrics.inc('errors', label='kind', value='parse')
+            self.logger.error(f"Page parse error for {url}: {e}")
+            return {'url': url, 'error': str(e)}, []
+        finally:
+            self.metrics.observe('parse', time.perf_counter() - start)
+
+    def parse_page(self, html_content, url):
+        return self.prepare_page(*self.run_parser(html_content, url))
+
+    def prepare_page(self, page_info, links):
+        if 'error' in page_info:
+            return page_info, []
+
+        # A revisited page keeps its id
+        page_id = self.revisits.page_id(page_info['url']) if self.revisits is not None else None
+        page_info = {'id': self.budget.next_id() if page_id is None else page_id, **page_info}
+
+        unique_links = self.unique_links(links)
+        if self.link_graph is not None:
+            # Recorded before the visited check, so links to pages crawled earlier stay in the graph. Nodes are
+            # canonical URLs, so two spellings of a page are one node
+            self.link_graph.add_page(self.canonicalize(page_info['url']),
+                                     [self.canonicalize(link) for link in unique_links
+                                      if urlsplit(link).scheme in ('http', 'https')])
+        if self.add_fingerprint(page_info) != page_info['id']:
+            # A mirror, print version or copy: its links were already queued from the first page of the cluster
+            self.metrics.inc('near_duplicates')
+            return page_info, []
+        return page_info, [link for link in unique_links if self.is_valid_url(link)]
+
+    def add_fingerprint(self, page_info):
+        # Sets and returns the page's duplicate_cluster; pages without text are never clustered
+        fingerprint = int(page_info.get('simhash', '0'), 16)
+        if self.near_duplicates is None or not fingerprint:
+            return page_info['id']
+        page_info['duplicate_cluster'] = self.near_duplicates.add(fingerprint, page_info['id'])
+        return page_info['duplicate_cluster']
+
+    def unique_links(self, links):
+        # Duplicates within one page collapse here, before they reach url_queue. The first spelling of each URL
+        # is kept, since that is the URL the server knows and the base its relative links resolve against
+        unique = {}
+        for link in links:
+            unique.setdefault(self.canonicalize(link), urldefrag(link)[0])
+        return list(unique.values())
+
+    def filter_links(self, links):
+        return [link for link in self.unique_links(links) if self.is_valid_url(link)]
+
+    def extract_links(self, html_content, current_url):
+        try:
+            links = parse_page(html_content, current_url, self.parser)[1]
+            return self.filter_links(links)
+
+        except Exception as e:
+            self.logger.error(f"Link extraction error: {e}")
+            return []
+
+    def extract_page_info(self, html_content, url):
+
+        try:
+            page_info = parse_page(html_content, url, self.parser)[0]
+            return {'id': self.total_pages_crawled, **page_info}
+
+        except Exception as e:
+            self.logger.error(f"Page info extraction error for {url}: {e}")
+            return {'url': url, 'error': str(e)}
+
+    def mark_visited(self, url):
+        url = self.canonicalize(url)
+        if isinstance(self.visited_urls, StripedSeenSet):
+            return self.visited_urls.add_new(url)
+        with self.visited_lock:
+            if url in self.visited_urls:
+                return False
+            self.visited_urls.add(url)
+            return True
+
+    def claim_url(self, url):
+        # True when a worker should fetch url: a due revisit, or a URL that was not visited yet
+        if self.revisits is not None:
+            if self.revisits.take(url):
+                return True
+            if self.total_pages_crawled >= self.max_pages:
+                return False
+        return self.mark_visited(url)
+
+    def apply_robots_delay(self, url):
+        # Crawl-delay from robots.txt can only make a host slower than configured
+        host = urlparse(url).netloc.lower()
+        if self.robots is None or self.robots.fresh(host):
+            return
+        delay = self.robots.crawl_delay(url)
+        if delay is not None:
+            self.url_queue.set_host_delay(host, max(float(delay), self.url_queue.host_delay(host)))
+
+    def robots_allows(self, url):
+        # The first check for a host (or the first after the TTL) fetches robots.txt and applies its Crawl-delay
+        self.apply_robots_delay(url)
+        return self.robots.can_fetch(url)
+
+    def prefetch_robots(self, links):
+        for host_url in {urlsplit(link).netloc.lower(): link for link in links}.values():
+            self.apply_robots_delay(host_url)
+
+    def sitemap_roots(self):
+        # Configured sitemaps, then the ones robots.txt lists for each start URL, else /sitemap.xml
+        roots = list(self.sitemap_urls)
+        robots = self.robots or RobotsCache(self.timeout)
+        for url in self.start_urls:
+            parsed = urlsplit(url)
+            roots.extend(robots.sitemaps(url) or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"])
+        return list(dict.fromkeys(roots))
+
+    def ingest_sitemaps(self):
+        # Streams sitemap entries into the frontier one hop below the start URLs. The lastmod timestamp
+        # is the frontier score, so fresh pages are served before older ones and before anchor links
+        pending = deque(self.sitemap_roots())
+        seen = set(pending)
+        fetched = 0
+        while pending and fetched < self.max_sitemaps and not self.sitemap_stop.is_set():
+            sitemap_url = pending.popleft()
+            fetched += 1
+            host = urlsplit(self.canonicalize(sitemap_url)).netloc
+            queued = 0
+            try:
+                for kind, loc, score in iter_sitemap(sitemap_url, self.timeout):
+                    if self.sitemap_stop.is_set():
+                        break
+                    if kind == 'sitemap':
+                        if loc not in seen:
+                            seen.add(loc)
+                            pending.append(loc)
+                        continue
+                    link = urldefrag(loc)[0]
+                    # The sitemap protocol only allows URLs from the sitemap's own host
+                    if urlsplit(self.canonicalize(link)).netloc == host and self.is_valid_url(link):
+                        queued += len(self.enqueue_links([link], 1, score))
+            except (requests.RequestException, ElementTree.ParseError, OSError) as e:
+                self.logger.warning(f"Sitemap failed for {sitemap_url}: {e}")
+            self.sitemap_urls_queued += queued
+            self.logger.info(f"Sitemap {sitemap_url}: {queued} URLs queued")
+
+    def start_sitemaps(self):
+        if not self.use_sitemaps:
+            return
+        self.sitemap_stop.clear()
+        self.ingesting_sitemaps = True
+
+        def run():
+            try:
+                self.ingest_sitemaps()
+            finally:
+                self.ingesting_sitemaps = False
+
+        self.sitemap_thread = Thread(target=run, daemon=True)
+        self.sitemap_thread.start()
+
+    def stop_sitemaps(self):
+        if self.sitemap_thread is not None:
+            self.sitemap_stop.set()
+            self.sitemap_thread.join()
+            self.sitemap_thread = None
+
+    def feed_revisits(self):
+        # Moves due pages into the frontier, at most revisit_rate per second; their staleness is the frontier score
+        tick = max(1.0 / self.revisit_rate, 0.05)
+        batch = max(1, round(self.revisit_rate * tick))
+        while not self.revisit_stop.wait(tick):
+            for url, depth, staleness in self.revisits.pop_due(batch):
+                if not self.url_queue.put((url, depth), score=staleness):
+                    # Already queued from a link, which the worker will treat as the revisit. Otherwise the
+                    # frontier turned it away, for example because it is full, and it is tried again later
+                    if not self.url_queue.is_queued(url):
+                        self.revisits.reschedule(url)
+                    continue
+                self.metrics.inc('revisits_queued')
+
+    def start_revisits(self):
+        if self.revisits is None:
+            return
+        self.revisit_stop.clear()
+        self.revisit_thread = Thread(target=self.feed_revisits, daemon=True)
+        self.revisit_thread.start()
+
+    def stop_revisits(self):
+        if self.revisit_thread is not None:
+            self.revisit_stop.set()
+            self.revisit_thread.join()
+            self.revisit_thread = None
+
+    def cache_lookup(self, url):
+        return self.cache.lookup(url) if self.cache is not None else None
+
+    def content_hash(self, html_content):
+        if self.cache is None:
+            return None
+        if isinstance(html_content, str):
+            html_content = html_content.encode('utf-8', 'replace')
+        return hashlib.sha1(html_content).hexdigest()
+
+    def store_cached_page(self, current_url, depth, cached):
+        # Unchanged page: the stored page info and links are reused without downloading or parsing again
+        self.cache.count(hit=True)
+        page_info = {key: value for key, value in cached['page_info'].items() if key not in ('id', 'duplicate_cluster')}
+        self.store_page(current_url, depth, *self.prepare_page(page_info, cached['links']))
+
+    def cache_page(self, current_url, headers, content_hash, parsed):
+        if self.cache is None:
+            return
+        self.cache.count(hit=False)
+        page_info, links = parsed
+        if 'error' not in page_info:
+            # Links are stored unfiltered; which ones are already visited depends on the crawl that reuses them
+            self.cache.store(current_url, headers, content_hash, page_info, links)
+
+    def process_page(self, html_content, current_url, depth, headers=None, cached=None):
+        # html_content is the raw body, or text when the response has no bytes
+        encoding = sniff_charset(headers, html_content) if isinstance(html_content, bytes) else None
+        self.finish_page(current_url, depth, headers, cached, self.content_hash(html_content),
+                         lambda: self.run_parser(html_content, current_url, encoding))
+
+    def finish_page(self, current_url, depth, headers, cached, content_hash, parse):
+        if cached is not None and cached['content_hash'] == content_hash:
+            self.store_cached_page(current_url, depth, cached)
+            return
+
+        self.store_parsed_page(current_url, depth, headers, content_hash, parse())
+
+    def store_parsed_page(self, current_url, depth, headers, content_hash, parsed):
+        self.cache_page(current_url, headers, content_hash, parsed)
+        self.store_page(current_url, depth, *self.prepare_page(*parsed))
+
+    @staticmethod
+    def response_body(response):
+        # The undecoded body; responses without bytes content (such as test doubles) give their text
+        content = getattr(response, 'content', None)
+        return content if isinstance(content, bytes) else response.text
+
+    def request(self, url, headers=None):
+        options = {'timeout': self.timeout}
+        if headers is not None:
+            options['headers'] = headers
+        if self.stream_downloads:
+            options['stream'] = True
+        return requests.get(url, **options)
+
+    def record_response(self, url, response, fetch_time):
+        # requests reports the time to the response headers as elapsed; DNS and connect are inside it.
+        # Without stream_downloads the body is already read too, so the rest of fetch_time is the download
+        self.metrics.inc('responses', label='status', value=response.status_code)
+        elapsed = getattr(response, 'elapsed', None)
+        ttfb = elapsed.total_seconds() if isinstance(elapsed, timedelta) else fetch_time
+        self.metrics.observe('ttfb', ttfb)
+        if not self.stream_downloads:
+            self.metrics.observe('download', max(fetch_time - ttfb, 0.0))
+            content = getattr(response, 'content', None)
+            if isinstance(content, bytes):
+                self.metrics.inc('bytes', len(content))
+        if response.status_code >= 400:
+            self.metrics.inc_host('host_errors', urlsplit(url).netloc)
+
+    def record_failure(self, url, error):
+        self.metrics.inc('errors', label='kind', value=type(error).__name__)
+        self.metrics.inc_host('host_errors', urlsplit(url).netloc)
+
+    def acquire_slot(self, url):
+        if self.concurrency is not None:
+            self.concurrency.acquire(urlsplit(url).netloc)
+
+    def release_slot(self, url, latency=None, status=None, headers=None):
+        # latency is None when the request failed
+        if self.concurrency is None:
+            return
+        host = urlsplit(url).netloc
+        if status in THROTTLE_STATUSES or latency is None:
+            self.metrics.inc_host('host_throttled', host)
+            delay = retry_after(headers)
+            if delay > 0:
+                self.url_queue.defer_host(host, delay)
+        change = self.concurrency.release(host, latency, status)
+        if change is None:
+            return
+        before, after, reason = change
+        if reason == 'increase':
+            self.logger.debug(f"Concurrency {before} -> {after}")
+        else:
+            self.metrics.inc('concurrency_decreases', label='reason', value=reason)
+            self.logger.info(f"Concurrency {before} -> {after} after {reason} from {host} "
+                             f"(host limit {self.concurrency.host_limit(host)})")
+
+    def start_metrics(self):
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+            self.metrics_server.start()
+            self.logger.info(f"Metrics at http://127.0.0.1:{self.metrics_server.port}/metrics")
+        if self.metrics_interval > 0:
+            self.metrics_reporter = MetricsReporter(self.metrics, self.logger, self.metrics_interval)
+            self.metrics_reporter.start()
+
+    def stop_metrics(self):
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+            self.metrics_reporter = None
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def stream_page(self, response, current_url, depth, cached):
+        # The headers decide first; then the body is kept as bytes or, with the stream parser, decoded chunk by
+        # chunk and parsed as it arrives. The charset is sniffed once, from the headers and the first chunk.
+        # Reading stops as soon as the page grows past max_page_bytes
+        length = declared_length(response.headers)
+        reason = download_rejection(response.headers, self.max_page_bytes)
+        if reason is not None:
+            self.download_stats.record_abort(reason, 0, length)
+            return
+
+        start = time.perf_counter()
+        digest = hashlib.sha1() if self.cache is not None else None
+        page_parser = StreamingPageParser(current_url, self.near_duplicates is not None) \
+            if self.parser == 'stream' and self.parser_pool is None else None
+        encoding = decoder = None
+        pieces = []
+        received = 0
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            received += len(chunk)
+            if received > self.max_page_bytes:
+                self.download_stats.record_abort('too large', received, length)
+                self.metrics.inc('bytes', received)
+                return
+            if encoding is None:
+                encoding = sniff_charset(response.headers, chunk)
+                decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            if digest is not None:
+                digest.update(chunk)
+            if page_parser is not None:
+                page_parser.feed(decoder.decode(chunk))
+            else:
+                pieces.append(chunk)
+        if page_parser is not None and decoder is not None:
+            page_parser.feed(decoder.decode(b'', final=True))
+        self.download_stats.record_download(received)
+        self.metrics.inc('bytes', received)
+        self.metrics.observe('download', time.perf_counter() - start)
+
+        def parse():
+            if page_parser is None:
+                return self.run_parser(b''.join(pieces), current_url, encoding)
+            page_parser.close()
+            return page_parser.page_info(current_url), page_parser.links
+
+        self.finish_page(current_url, depth, response.headers, cached,
+                         digest.hexdigest() if digest is not None else None, parse)
+
+    def store_page(self, current_url, depth, page_info, discovered_links):
+        revisit = self.revisits is not None and self.revisits.known(current_url)
+        if not revisit:
+            start = time.perf_counter()
+            self.budget.count()
+            self.metrics.observe('lock_page_count', time.perf_counter() - start)
+        self.logger.info(f"{'Revisited' if revisit else 'Crawled'}: {current_url}")
+        self.metrics.inc('pages')
+        self.metrics.inc_host('host_pages', urlsplit(current_url).netloc)
+
+        if self.revisits is not None and 'error' not in page_info:
+            if self.revisits.record(current_url, depth, page_info['id'], page_digest(page_info)):
+                self.metrics.inc('revisit_changes')
+
+        self.record_page(current_url, page_info)
+        if self.cluster is not None:
+            self.cluster.forward_page(current_url, page_info)
+        links = self.queue_links(discovered_links, depth + 1)[0]
+        if self.state is not None:
+            self.state.store_page(current_url, page_info, [(link, depth + 1) for link in links])
+
+    def record_page(self, current_url, page_info):
+        if self.keep_results:
+            buffer = getattr(self.local, 'results', None)
+            if buffer is None:
+                self.merge_results([(current_url, page_info)])
+            else:
+                buffer.append((current_url, page_info))
+                if len(buffer) >= RESULT_BATCH_SIZE:
+                    self.flush_results()
+
+        if self.search_index is not None:
+            self.search_index.add(page_info)
+
+        for writer in self.sink_writers:
+            if not writer.write(page_info):
+                # The output is lost from here on, so the crawl stops and crawl() raises the sink's error
+                self.stop_requested = True
+        for listener in self.listeners:
+            listener.put(page_info)
+
+    def merge_results(self, pages):
+        start = time.perf_counter()
+        with self.results_lock:
+            self.metrics.observe('lock_results', time.perf_counter() - start)
+            for url, page_info in pages:
+                self.crawl_results[url] = page_info
+
+    def flush_results(self):
+        buffer = getattr(self.local, 'results', None)
+        if buffer:
+            self.merge_results(buffer)
+            buffer.clear()
+
+    def store_remote_page(self, current_url, page_info):
+        # A page crawled by another cluster node, on node 0. It gets the next id here, and max_pages counts it
+        if not self.budget.take():
+            return
+        page_info = {**page_info, 'id': self.budget.next_id()}
+        # Clusters are numbered by page id, so they are recomputed across all nodes' pages here
+        self.add_fingerprint(page_info)
+        self.metrics.inc('remote_pages')
+        self.record_page(current_url, page_info)
+        if self.state is not None:
+            self.state.save_result(current_url, page_info)
+
+    def waiting_for_links(self):
+        # Sitemap entries are still being queued, other cluster nodes may still forward links,
+        # or a continuous crawl waits for the next revisit
+        return self.ingesting_sitemaps or (self.cluster is not None and not self.cluster.finished.is_set()) or \
+            (self.revisits is not None and not self.stop_requested)
+
+    def start_dns(self):
+        if self.dns is not None:
+            self.dns.install()
+
+    def stop_dns(self):
+        if self.dns is not None:
+            self.dns.close()
+
+    def start_cluster(self):
+        if self.cluster is not None:
+            self.cluster.start()
+            self.logger.info(f"Cluster node {self.cluster.index} of {len(self.cluster.addresses)} listening on "
+                             f"{self.cluster.addresses[self.cluster.index][0]}:{self.cluster.addresses[self.cluster.index][1]}")
+
+    def stop_cluster(self):
+        if self.cluster is not None:
+            self.cluster.stop()
+
+    def reserve_page(self):
+        # Waits while every free slot is reserved by a fetch in flight; False once all slots hold stored pages
+        while not self.budget.reserve(timeout=0.1):
+            if self.budget.exhausted() or self.stop_requested:
+                return False
+        return True
+
+    def worker(self):
+        # A continuous crawl is not budgeted and revisits from different workers would race through their buffers,
+        # so results are only batched per worker in a bounded crawl
+        self.local.results = [] if self.revisits is None else None
+        try:
+            while not self.stop_requested and not self.budget.exhausted():
+                try:
+                    # Workers stop as soon as the frontier is drained, unless more links may still arrive
+                    start = time.perf_counter()
+                    current_url, depth = self.url_queue.get(timeout=self.timeout,
+                                                            until_drained=not self.waiting_for_links())
+                    self.metrics.observe('queue_wait', time.perf_counter() - start)
+
+                    if depth > self.max_depth:
+                        self.url_queue.task_done()
+                        continue
+
+                    # A page slot is only reserved with a URL in hand, so no slot is held while the frontier is empty
+                    if not self.reserve_page():
+                        self.url_queue.task_done()
+                        continue
+
+                    if not self.claim_url(current_url):
+                        self.budget.release()
+                        self.url_queue.task_done()
+                        continue
+
+                    try:
+                        self.apply_robots_delay(current_url)
+                        cached = self.cache_lookup(current_url)
+                        self.acquire_slot(current_url)
+                        fetch_time = response = None
+                        try:
+                            start = time.perf_counter()
+                            response = self.request(
+                                current_url, HttpCache.conditional_headers(cached) if cached is not None else None)
+                            fetch_time = time.perf_counter() - start
+                            self.record_response(current_url, response, fetch_time)
+                            try:
+                                if response.status_code == 304 and cached is not None:
+                                    self.store_cached_page(current_url, depth, cached)
+                                elif response.status_code == 200 and self.stream_downloads:
+                                    self.stream_page(response, current_url, depth, cached)
+                                elif response.status_code == 200:
+                                    self.process_page(self.response_body(response), current_url, depth,
+                                                      response.headers, cached)
+                            finally:
+                                if self.stream_downloads:
+                                    response.close()
+                        finally:
+                            if response is None:
+                                self.release_slot(current_url)
+                            else:
+                                self.release_slot(current_url, fetch_time, response.status_code, response.headers)
+
+                    except requests.RequestException as e:
+                        self.record_failure(current_url, e)
+                        self.logger.warning(f"Request failed for {current_url}: {e}")
+                    finally:
+                        self.budget.release()
+                        self.complete_url(current_url)
+                        self.url_queue.task_done()
+                except Empty:
+                    # No more URLs to process, unless sitemap entries or other nodes' links may still arrive
+                    if self.waiting_for_links():
+                        continue
+                    break
+
+                except Exception as e:
+                    self.logger.error(f"Unexpected worker error: {e}")
+                    break
+        finally:
+            self.flush_results()
+            self.local.results = None
+        time.sleep(1)
+
+
+    def checkpoint(self):
+        if self.state is not None:
+            self.state.checkpoint()
+        if self.revisits is not None:
+            self.revisits.checkpoint()
+        if self.cache is not None:
+            self.cache.checkpoint()
+        if self.search_index is not None and self.index_file:
+            self.search_index.save(self.index_file)
+        if self.link_graph is not None and self.link_graph_file:
+            self.link_graph.export(self.link_graph_file)
+
+    def start_parser_pool(self):
+        if self.parser_workers > 0:
+            self.parser_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.parser_workers)
+
+    def stop_parser_pool(self):
+        if self.parser_pool is not None:
+            self.parser_pool.shutdown()
+            self.parser_pool = None
+
+    def start_sinks(self):
+        self.sink_error = None
+        self.sink_writers = [SinkWriter(sink) for sink in self.sinks]
+        for writer in self.sink_writers:
+            writer.start()
+
+    def stop_sinks(self):
+        for writer in self.sink_writers:
+            writer.close()
+            if writer.error is not None and self.sink_error is None:
+                self.sink_error = writer.error
+        self.sink_writers = []
+
+    def iter_results(self):
+        # Runs the crawl in a background thread and yields each page-info record as soon as it is stored
+        records = Queue()
+        errors = []
+        self.listeners.append(records)
+
+        def run():
+            try:
+                self.crawl()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                records.put(None)
+
+        crawl_thread = Thread(target=run, daemon=True)
+        crawl_thread.start()
+        try:
+            while True:
+                record = records.get()
+                if record is None:
+                    break
+                yield record
+        finally:
+            # Also reached when the consumer stops iterating early
+            if crawl_thread.is_alive():
+                self.stop_requested = True
+            crawl_thread.join()
+            self.listeners.remove(records)
+        if errors:
+            raise errors[0]
+
+    def crawl(self):
+        self.logger.info(f"Starting crawl for {self.start_urls}")
+
+        self.start_services()
+        try:
+            # Create thread pool
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self.worker)
+                    for _ in range(self.max_workers)
+                ]
+
+                # Wait for all threads to complete
+                try:
+                    concurrent.futures.wait(futures)
+                except KeyboardInterrupt:
+                    self.logger.warning("Crawl interrupted, waiting for workers to stop")
+                    self.stop_requested = True
+                    raise
+        finally:
+            self.stop_services()
+
+        if self.sink_error is not None:
+            raise self.sink_error
+        self.logger.info(f"Crawl completed. Total pages: {self.total_pages_crawled}")
+        self.log_crawl_stats()
+        return self.crawl_results
+
+    def start_services(self):
+        # Everything a crawl runs next to its workers, in both engines
+        self.start_parser_pool()
+        self.start_sinks()
+        self.start_sitemaps()
+        self.start_metrics()
+        self.start_cluster()
+        self.start_revisits()
+        self.start_dns()
+
+    def stop_services(self):
+        # Link sources stop before the pools and sinks they feed; the state is saved last
+        self.stop_dns()
+        self.stop_revisits()
+        self.stop_cluster()
+        self.stop_sitemaps()
+        self.stop_parser_pool()
+        self.stop_sinks()
+        self.stop_metrics()
+        self.checkpoint()
+
+    def log_crawl_stats(self):
+        stripes = len(self.visited_urls.stripes) if isinstance(self.visited_urls, StripedSeenSet) else 1
+        self.logger.info(f"Visited set: {len(self.visited_urls)} URLs in "
+                         f"{self.visited_urls.memory_usage() / 1024:.1f} KiB ({self.seen_set}, {stripes} stripes)")
+        self.logger.info(f"Frontier: {self.url_queue.qsize()} URLs left, {self.url_queue.rejected} rejected, "
+                         f"{len(self.url_queue.overflowed)} held back by max_pages, {self.url_queue.evicted} evicted")
+        if self.cache is not None:
+            self.logger.info(f"HTTP cache: {self.cache.hits} hits, {self.cache.misses} misses, "
+                             f"{self.cache.evictions} evicted, {self.cache.total_size / 2 ** 20:.1f} MiB stored")
+        if self.stream_downloads:
+            stats = self.download_stats
+            aborts = ", ".join(f"{count} {reason}" for reason, count in sorted(stats.aborts.items())) or "none"
+            self.logger.info(f"Downloads: {stats.pages} pages, {stats.bytes_read / 2 ** 20:.1f} MiB read, "
+                             f"aborted: {aborts}, {stats.bytes_saved / 2 ** 20:.1f} MiB not downloaded")
+        if self.robots is not None:
+            self.logger.info(f"robots.txt: {len(self.robots.parsers)} hosts, {self.robots_blocked} URLs disallowed")
+        if self.dns is not None:
+            dns = self.dns
+            mean = dns.resolve_time / dns.resolutions * 1000 if dns.resolutions else 0.0
+            self.logger.info(f"DNS: {len(dns)} hosts, {dns.hits} hits, {dns.negative_hits} negative hits, "
+                             f"{dns.misses} misses, {dns.prefetches} prefetched, {dns.failures} failed, "
+                             f"{mean:.1f} ms per resolution")
+        if self.use_sitemaps:
+            self.logger.info(f"Sitemaps: {self.sitemap_urls_queued} URLs queued")
+        if self.link_graph is not None:
+            self.logger.info(f"Link graph: {self.link_graph.node_count} URLs, {self.link_graph.edge_count} links")
+        if self.revisits is not None:
+            self.logger.info(f"Revisits: {self.revisits.fetched} fetched, {self.revisits.changed} found changed, "
+                             f"{len(self.revisits)} pages scheduled")
+        if self.near_duplicates is not None:
+            self.logger.info(f"Near-duplicates: {self.metrics.total('near_duplicates')} pages whose links were not followed, "
+                             f"{len(self.near_duplicates)} distinct texts")
+        if self.cluster is not None:
+            self.logger.info(f"Cluster: {self.cluster.sent} links and pages sent, {self.cluster.received} received, "
+                             f"{len(self.crawl_results)} results on this node")
+        if self.concurrency is not None:
+            self.logger.info(f"Concurrency: limit {self.concurrency.limit} (peak {self.concurrency.peak}), "
+                             f"{self.concurrency.decreases} decreases, "
+                             f"{self.metrics.total('host_throttled')} throttled or failed fetches")
+
+
+IDLE_CHECK_INTERVAL = 0.5
+
+
+class AsyncWebCrawler(WebCrawler):
+    # Same frontier, parsing and results as WebCrawler, but fetches run as coroutines sharing one pooled session
+    def __init__(self, start_urls, max_pages, max_depth, max_workers, timeout,
+                 max_connections=100, max_connections_per_host=10, **options):
+        WebCrawler.__init__(self, start_urls, max_pages, max_depth, max_workers, timeout, **options)
+
+        if not isinstance(max_connections, int) or isinstance(max_connections, bool):
+            raise TypeError("max_connections must be a number")
+        if not isinstance(max_connections_per_host, int) or isinstance(max_connections_per_host, bool):
+            raise TypeError("max_connections_per_host must be a number")
+
+        self.max_connections = max_connections if max_connections > 0 else 100
+        self.max_connections_per_host = max_connections_per_host if max_connections_per_host > 0 else 0
+        if self.concurrency is not None:
+            # Coroutines take the place of threads: max_connections of them, at most max_connections_per_host per host
+            self.concurrency = AdaptiveConcurrency(self.max_connections, self.min_concurrency,
+                                                   self.max_host_concurrency or self.max_connections_per_host)
+        self.in_flight = 0
+        self.metrics.gauge('in_flight', lambda: self.in_flight)
+        # One thread for the SQLite state, cache and revisit calls, so they never block the event loop
+        self.db_executor = None
+        # Set while crawl_async runs. wakeup is set when a URL is queued or done or a page slot is released,
+        # slot_freed when a host connection slot is released
+        self.loop = None
+        self.wakeup = None
+        self.slot_freed = None
+
+    def trace_config(self):
+        # aiohttp reports DNS, connect and time-to-headers separately, unlike requests
+        trace = aiohttp.TraceConfig()
+
+        def timer(stage, started):
+            async def start(session, context, params):
+                setattr(context, started, time.perf_counter())
+
+            async def end(session, context, params):
+                if hasattr(context, started):
+                    self.metrics.observe(stage, time.perf_counter() - getattr(context, started))
+            return start, end
+
+        for stage, start_hooks, end_hooks in (
+                ('dns', trace.on_dns_resolvehost_start, trace.on_dns_resolvehost_end),
+                ('connect', trace.on_connection_create_start, trace.on_connection_create_end),
+                ('ttfb', trace.on_request_start, trace.on_request_end)):
+            start, end = timer(stage, f"{stage}_started")
+            start_hooks.append(start)
+            end_hooks.append(end)
+        return trace
+
+    async def fetch(self, session, url, headers=None):
+        # Returns (status, headers, body); body is the raw bytes, only read for 200 responses
+        async with session.get(url, headers=headers) as response:
+            self.metrics.inc('responses', label='status', value=response.status)
+            if response.status >= 400:
+                self.metrics.inc_host('host_errors', urlsplit(url).netloc)
+            if response.status != 200:
+                return response.status, response.headers, None
+            if not self.stream_downloads:
+                start = time.perf_counter()
+                body = await response.read()
+                self.metrics.observe('download', time.perf_counter() - start)
+                self.metrics.inc('bytes', len(body))
+                return response.status, response.headers, body
+
+            length = declared_length(response.headers)
+            reason = download_rejection(response.headers, self.max_page_bytes)
+            if reason is not None:
+                self.download_stats.record_abort(reason, 0, length)
+                return response.status, response.headers, None
+            start = time.perf_counter()
+            pieces = []
+            received = 0
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > self.max_page_bytes:
+                    self.download_stats.record_abort('too large', received, length)
+                    self.metrics.inc('bytes', received)
+                    return response.status, response.headers, None
+                pieces.append(chunk)
+            self.download_stats.record_download(received)
+            self.metrics.inc('bytes', received)
+            self.metrics.observe('download', time.perf_counter() - start)
+            return response.status, response.headers, b''.join(pieces)
+
+    async def run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, function, *args)
+
+    async def run_parser_async(self, html_content, url, encoding=None):
+        # Without a parser pool the page is parsed in a thread of the loop's default executor
+        if self.parser_pool is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.run_parser, html_content, url, encoding)
+
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.parser_pool, parse_page, html_content, url, self.parser, self.near_duplicates is not None,
+                encoding)
+        except Exception as e:
+            self.metrics.inc('errors', label='kind', value='parse')
+            self.logger.error(f"Page parse error for {url}: {e}")
+            return {'url': url, 'error': str(e)}, []
+        finally:
+            self.metrics.observe('parse', time.perf_counter() - start)
+
+    async def process_page_async(self, html_content, current_url, depth, headers=None, cached=None):
+        content_hash = self.content_hash(html_content)
+        if cached is not None and cached['content_hash'] == content_hash:
+            await self.run_db(self.store_cached_page, current_url, depth, cached)
+            return
+
+        encoding = sniff_charset(headers, html_content) if isinstance(html_content, bytes) else None
+        parsed = await self.run_parser_async(html_content, current_url, encoding)
+        if self.robots is not None:
+            # robots.txt of newly linked hosts is fetched off the event loop before queue_links checks it
+            await asyncio.to_thread(self.prefetch_robots, parsed[1])
+        await self.run_db(self.store_parsed_page, current_url, depth, headers, content_hash, parsed)
+
+    def wake(self):
+        # Safe from any thread. An already set event needs no call: the dispatcher clears it before it looks
+        # at the frontier, so it will see this change anyway
+        if self.loop is not None and not self.wakeup.is_set():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def wait_for_wakeup(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def reserve_page_async(self):
+        # Same page budget as the threads; a coroutine cannot block, so it waits until a worker releases a slot
+        while True:
+            self.wakeup.clear()
+            if self.budget.reserve(timeout=0):
+                return True
+            if self.budget.exhausted() or self.stop_requested:
+                return False
+            await self.wait_for_wakeup()
+
+    async def acquire_slot_async(self, url):
+        if self.concurrency is None:
+            return
+        host = urlsplit(url).netloc
+        while True:
+            self.slot_freed.clear()
+            if self.concurrency.try_acquire(host):
+                return
+            await self.slot_freed.wait()
+
+    def release_slot(self, url, latency=None, status=None, headers=None):
+        WebCrawler.release_slot(self, url, latency, status, headers)
+        if self.slot_freed is not None:
+            self.slot_freed.set()
+
+    async def dispatch(self, ready):
+        # The only coroutine taking URLs from the frontier. It reserves each URL's page slot and hands it to an
+        # idle worker, and otherwise sleeps until the frontier changes, a slot is released or a host cools down
+        while not self.stop_requested and not self.budget.exhausted():
+            self.wakeup.clear()
+            try:
+                current_url, depth = self.url_queue.get_nowait()
+            except Empty:
+                if self.url_queue.unfinished_tasks == 0 and not self.waiting_for_links():
+                    break
+                # Sitemaps, other cluster nodes and a stop request give no signal, so they are checked now and then
+                timeout = self.url_queue.cooldown()
+                if self.waiting_for_links():
+                    timeout = IDLE_CHECK_INTERVAL if timeout is None else min(timeout, IDLE_CHECK_INTERVAL)
+                await self.wait_for_wakeup(timeout)
+                continue
+
+            if depth > self.max_depth or not await self.reserve_page_async():
+                self.url_queue.task_done()
+                continue
+            await ready.put((current_url, depth))
+
+        for _ in range(self.max_connections):
+            await ready.put(None)
+
+    async def async_worker(self, session, ready):
+        while True:
+            item = await ready.get()
+            if item is None:
+                return
+            current_url, depth = item
+
+            try:
+                if not self.claim_url(current_url):
+                    self.budget.release()
+                    self.wake()
+                    continue
+
+                # As in the threads engine, only a fetched URL is completed; skipped ones stay in the stored
+                # frontier for a resumed crawl with a bigger budget
+                self.in_flight += 1
+                try:
+                    if self.robots is not None:
+                        await asyncio.to_thread(self.apply_robots_delay, current_url)
+                    cached = await self.run_db(self.cache_lookup, current_url)
+                    await self.acquire_slot_async(current_url)
+                    fetch_time = status = headers = None
+                    try:
+                        start = time.perf_counter()
+                        status, headers, html_content = await self.fetch(
+                            session, current_url, HttpCache.conditional_headers(cached))
+                        fetch_time = time.perf_counter() - start
+                    finally:
+                        self.release_slot(current_url, fetch_time, status, headers)
+                    if status == 304 and cached is not None:
+                        await self.run_db(self.store_cached_page, current_url, depth, cached)
+                    elif html_content is not None:
+                        await self.process_page_async(html_content, current_url, depth, headers, cached)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.record_failure(current_url, e)
+                    self.logger.warning(f"Request failed for {current_url}: {e}")
+                finally:
+                    self.in_flight -= 1
+                    self.budget.release()
+                    self.wake()
+                    await self.run_db(self.complete_url, current_url)
+
+            except Exception as e:
+                self.logger.error(f"Unexpected worker error: {e}")
+            finally:
+                self.url_queue.task_done()
+
+    async def crawl_async(self):
+        # With the DNS cache, aiohttp's own per-connector cache would only hide its hits
+        dns = {'resolver': DnsCacheResolver(self.dns), 'use_dns_cache': False} if self.dns is not None else {}
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host,
+                                         **dns)
+        timeout = aiohttp.ClientTimeout(total=self.timeout or None)
+
+        self.db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='crawl-db')
+        self.wakeup = asyncio.Event()
+        self.slot_freed = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.url_queue.on_change = self.wake
+        # One slot, so a URL leaves the frontier only once a worker is free to take it
+        ready = asyncio.Queue(maxsize=1)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             trace_configs=[self.trace_config()]) as session:
+                await asyncio.gather(self.dispatch(ready),
+                                     *[self.async_worker(session, ready) for _ in range(self.max_connections)])
+        finally:
+            self.url_queue.on_change = None
+            self.loop = None
+            self.db_executor.shutdown()
+            self.db_executor = None
+
+    def crawl(self):
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("AsyncWebCrawler needs aiohttp, install it with: pip install aiohttp")
+
+        self.logger.info(f"Starting async crawl for {self.start_urls}")
+        self.start_services()
+        try:
+            asyncio.run(self.crawl_async())
+        finally:
+            self.stop_services()
+
+        if self.sink_error is not None:
+            raise self.sink_error
+        self.logger.info(f"Crawl completed. Total pages: {self.total_pages_crawled}")
+        self.log_crawl_stats()
+        return self.crawl_results
+
+class SearchIndex:
+    # Inverted index over lowercased titles and h1/h2 headings, filled as pages are stored.
+    # Whole words go to a token index and every 3-character window to a trigram index. A whole-word query
+    # intersects the posting lists of its words; a substring query only checks the documents in the shortest
+    # posting list of its trigrams. A page added again, such as a revisit, replaces its document
+    FIELDS = ('title', 'header')
+    TOKEN_PATTERN = re.compile(r'\w+')
+    def __init__(self):
+        # (id, url, title) per document, built once so a query with many matches only collects them
+        self.entries = []
+        # Document number of each URL
+        self.docs = {}
+        # Whether ids only grow with the documents, so matches in document order are already in id order
+        self.in_order = True
+        self.texts = {name: [] for name in self.FIELDS}
+        self.tokens = {name: {} for name in self.FIELDS}
+        self.trigrams = {name: {} for name in self.FIELDS}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, page_info):
+        page_id = page_info.get('id')
+        title = page_info.get('title') or ''
+        headings = page_info.get('headings') or {}
+        header = '\n'.join(list(headings.get('h1', [])) + list(headings.get('h2', [])))
+
+        url = page_info.get('url')
+        texts = (title.lower(), header.lower())
+        with self.lock:
+            doc = self.docs.get(url)
+            if doc is None:
+                self._add(page_id, url, title, texts)
+            else:
+                self._replace(doc, page_id, url, title, texts)
+
+    @classmethod
+    def _words(cls, text):
+        return set(cls.TOKEN_PATTERN.findall(text))
+
+    @staticmethod
+    def _grams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _add(self, page_id, url, title, texts):
+        # texts are the lowercased title and header, in FIELDS order
+        doc = len(self.entries)
+        self.in_order = self.in_order and page_id is not None and (not doc or self.entries[-1][0] < page_id)
+        self.entries.append((page_id, url, title))
+        if url is not None:
+            self.docs[url] = doc
+        for name, text in zip(self.FIELDS, texts):
+            self.texts[name].append(text)
+            # Documents are numbered in insertion order, so every posting list stays sorted
+            for token in self._words(text):
+                self.tokens[name].setdefault(token, []).append(doc)
+            for gram in self._grams(text):
+                self.trigrams[name].setdefault(gram, []).append(doc)
+
+    def _replace(self, doc, page_id, url, title, texts):
+        # The document keeps its number; it only leaves the posting lists of words and trigrams it lost and joins
+        # the ones it gained, in sorted position
+        if self.entries[doc][0] != page_id:
+            self.in_order = False
+        self.entries[doc] = (page_id, url, title)
+        for name, text in zip(self.FIELDS, texts):
+            old_text = self.texts[name][doc]
+            if old_text == text:
+                continue
+            self.texts[name][doc] = text
+            for postings, split in ((self.tokens[name], self._words), (self.trigrams[name], self._grams)):
+                before, after = split(old_text), split(text)
+                for key in before - after:
+                    posting = postings[key]
+                    del posting[bisect.bisect_left(posting, doc)]
+                    if not posting:
+                        del postings[key]
+                for key in after - before:
+                    bisect.insort(postings.setdefault(key, []), doc)
+
+    def _postings(self, name, query, whole_words):
+        # Posting lists every match must be in: one per word, or one per trigram
+        if whole_words:
+            return [self.tokens[name].get(token, ()) for token in self._words(query)]
+        return [self.trigrams[name].get(gram, ()) for gram in self._grams(query)]
+
+    @staticmethod
+    def _intersect(postings):
+        # Sorted documents in every posting list, taken smallest first and stopping once none are left
+        postings = sorted(postings, key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates = sorted(set(candidates).intersection(posting))
+        return candidates
+
+    def search(self, title='', header='', whole_words=False):
+        # Returns (id, url, title) of pages matching every non-empty query, ordered by id
+        queries = [(name, query.lower()) for name, query in zip(self.FIELDS, (title, header)) if query]
+        if not queries:
+            return []
+
+        with self.lock:
+            postings = [posting for name, query in queries for posting in self._postings(name, query, whole_words)]
+            if not postings:
+                candidates = range(len(self.entries))
+            elif whole_words:
+                # Token lists are exact, so their intersection is the answer
+                candidates = self._intersect(postings)
+            else:
+                # Trigrams only narrow a substring query down and the texts decide. Checking a text costs less than
+                # walking another posting list of similar length, so only the smallest list is used
+                candidates = min(postings, key=len)
+            if not whole_words:
+                for name, query in queries:
+                    texts = self.texts[name]
+                    candidates = [doc for doc in candidates if query in texts[doc]]
+            entries = self.entries
+            matches = [entries[doc] for doc in candidates]
+            in_order = self.in_order
+        if not in_order:
+            matches.sort(key=lambda match: (match[0] is None, match[0] or 0))
+        return matches
+
+    def save(self, path):
+        # Only the documents are written, and outside the lock; load() rebuilds the token and trigram indexes,
+        # which are several times larger than the texts
+        with self.lock:
+            entries = list(self.entries)
+            texts = {name: list(column) for name, column in self.texts.items()}
+        ids, urls, titles = (list(column) for column in zip(*entries)) if entries else ([], [], [])
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'ids': ids, 'urls': urls, 'titles': titles, 'texts': texts}, file)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        index = cls()
+        texts = zip(*(data['texts'][name] for name in cls.FIELDS))
+        for page_id, url, title, document_texts in zip(data['ids'], data['urls'], data['titles'], texts):
+            index._add(page_id, url, title, document_texts)
+        return index
+
+
+SHARD_SEPARATOR = '\x00'
+
+
+def make_search_shard(records):
+    # One contiguous slice of the results as flat columns. The lowercased titles and headings are
+    # joined into one string each, so a query is a few str.find calls over the whole shard
+    ids = [page_info.get('id') for page_info in records]
+    urls = [page_info.get('url') for page_info in records]
+    titles = [page_info.get('title') or '' for page_info in records]
+    headers = []
+    for page_info in records:
+        headings = page_info.get('headings') or {}
+        headers.append(SHARD_SEPARATOR.join(list(headings.get('h1', [])) + list(headings.get('h2', []))))
+    return ids, urls, titles, text_column([title.lower() for title in titles]), text_column(
+        [header.lower() for header in headers])
+
+
+def text_column(texts):
+    # Returns the texts joined by SHARD_SEPARATOR and the offset each text starts at
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text) + 1
+    return SHARD_SEPARATOR.join(texts), offsets
+
+
+def match_column(column, query):
+    # Row numbers whose text contains query, each reported once
+    blob, offsets = column
+    rows = []
+    start = blob.find(query)
+    while start != -1:
+        row = bisect.bisect_right(offsets, start) - 1
+        rows.append(row)
+        if row + 1 == len(offsets):
+            break
+        start = blob.find(query, offsets[row + 1])
+    return rows
+
+
+def match_shard(shard, wanted_title, wanted_header):
+    # Returns (id, url, title) of the shard's pages matching every non-empty query, in shard order
+    ids, urls, titles, title_column, header_column = shard
+    rows = None
+    for column, query in ((title_column, wanted_title), (header_column, wanted_header)):
+        if query:
+            matched = match_column(column, query.lower())
+            rows = matched if rows is None else sorted(set(rows).intersection(matched))
+    return [(ids[row], urls[row], titles[row]) for row in rows or ()]
+
+
+_search_shards = []
+
+
+def _load_search_shards(shards):
+    # Pool initializer: each process keeps only the shards it serves, so a query only sends the query text
+    global _search_shards
+    _search_shards = shards
+
+
+def _match_loaded_shards(wanted_title, wanted_header):
+    return [match for shard in _search_shards for match in match_shard(shard, wanted_title, wanted_header)]
+
+
+class ShardedSearch:
+    # Splits crawl results into contiguous shards ordered by id and matches them in worker processes
+    # (workers > 1) or in this process. Each worker process owns a contiguous run of shards and is the only one
+    # that holds them, so memory does not grow with the number of workers. Merging in order keeps the matches in
+    # id order
+    def __init__(self, results, num_shards=0, workers=0):
+        records = sorted(results.values(), key=lambda page_info: (page_info.get('id') is None,
+                                                                 page_info.get('id') or 0))
+        num_shards = max(num_shards or workers, 1)
+        size = -(-len(records) // num_shards) or 1
+        self.shards = [make_search_shard(records[start:start + size]) for start in range(0, len(records), size)]
+        self.pools = []
+        if workers > 1 and len(self.shards) > 1:
+            per_worker = -(-len(self.shards) // workers)
+            self.pools = [concurrent.futures.ProcessPoolExecutor(max_workers=1, initializer=_load_search_shards,
+                                                                 initargs=(self.shards[start:start + per_worker],))
+                          for start in range(0, len(self.shards), per_worker)]
+
+    def __len__(self):
+        return sum(len(shard[0]) for shard in self.shards)
+
+    def search(self, title='', header=''):
+        if not title and not header:
+            return []
+        if self.pools:
+            futures = [pool.submit(_match_loaded_shards, title, header) for pool in self.pools]
+            parts = (future.result() for future in futures)
+        else:
+            parts = (match_shard(shard, title, header) for shard in self.shards)
+        return [match for part in parts for match in part]
+
+    def close(self):
+        for pool in self.pools:
+            pool.shutdown()
+        self.pools = []
+
+
+class findMatchingTitle(Thread):
+    def __init__(self, from_id, to_id, wanted_word):
+        Thread.__init__(self)
+        self.from_id = from_id
+        self.to_id = to_id
+        self.wanted_word = wanted_word
+
+    def find_word(self, title, wanted_word):
+            title_low = title.lower()
+            wanted_word_low = wanted_word.lower()
+
+            if wanted_word_low in title_low:
+                return True
+            return False
+
+    def find(self):
+        found = 0
+        i = 0
+        for url, data in results.items():
+            if self.from_id < i < self.to_id and self.find_word(data.get('title'), self.wanted_word):
+                print("Wanted word is on row {} with title {} and url address {}.".format(i, data.get('title'), data.get('url')))
+                found += 1
+            i = i + 1
+        if found == 0:
+            print("This thread have not found title you are looking for.")
+
+    def run(self):
+        self.find()
+
+class findMatchingHeader(Thread):
+    def __init__(self, from_id, to_id, wanted_header):
+        Thread.__init__(self)
+        self.from_id = from_id
+        self.to_id = to_id
+        self.wanted_header = wanted_header
+
+    def find_header(self, headers, wanted_header):
+            wanted_header_low = wanted_header.lower()
+
+            for header in headers:
+                if wanted_header_low in header.lower():
+                    return True
+                return False
+
+    def find(self):
+        found = 0
+        i = 0
+        for url, data in results.items():
+            if self.from_id < i < self.to_id and self.find_header(data.get('headers'), self.wanted_header):
+                print("Wanted word is on row {} with title {} and url address {}.".format(i, data.get('title'), data.get('url')))
+                found += 1
+            i = i + 1
+        if found == 0:
+            print("This thread have not found title you are looking for.")
+
+    def run(self):
+        self.find()
+
+
+class findMatchingTitleAndHeader(Thread):
+    def __init__(self, from_id, to_id, wanted_title, wanted_header):
+        Thread.__init__(self)
+        self.from_id = from_id
+        self.to_id = to_id
+        self.wanted_title = wanted_title
+        self.wanted_header = wanted_header
+
+def search_specific(total_pages, num_workers, wanted_title, wanted_header, index=None):
+    if total_pages % num_workers != 0:
+        total_pages = num_workers * 10
+    if not isinstance(total_pages, int):
+        raise TypeError
+    if not isinstance(num_workers, int):
+        raise TypeError
+    if not isinstance(wanted_title, str):
+        raise TypeError
+    if not isinstance(wanted_header, str):
+        raise TypeError
+
+    if index is not None:
+        # A SearchIndex or ShardedSearch answers the whole query at once, so no worker threads are needed
+        matches = index.search(wanted_title, wanted_header)
+        for page_id, url, title in matches:
+            print("Wanted word is on row {} with title {} and url address {}.".format(page_id, title, url))
+        if not matches:
+            print("Search has not found title you are looking for.")
+        return matches
+
+    if total_pages < num_workers or total_pages < 0:
+        total_pages = num_workers * 2
+    if num_workers <= 0:
+        num_workers = 2
+
+    if total_pages is True or total_pages is False:
+        total_pages = 100
+    if num_workers is False or num_workers is True:
+        num_workers = 2
+
+
+    chunk_size = total_pages // num_workers
+    threads = []
+
+    for i in range(num_workers):
+        from_id = i * chunk_size
+        to_id = from_id + chunk_size if i < num_workers - 1 else total_pages
+        if wanted_title == "":
+            thread = findMatchingHeader(from_id, to_id, wanted_header)
+            threads.append(thread)
+            thread.start()
+        if wanted_header == "":
+            thread = findMatchingTitle(from_id, to_id, wanted_title)
+            threads.append(thread)
+            thread.start()
+        else:
+            thread = findMatchingTitleAndHeader(from_id, to_id,wanted_title, wanted_header)
+            threads.append(thread)
+            thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+@dataclass
+class CrawlerConfig:
+    start_urls: List[str]
+    max_pages: int
+    max_depth: int
+    max_workers: int
+    timeout: int
+    wanted_title: str
+    wanted_header:str
+    parser: str = 'html.parser'
+    engine: str = 'threads'
+    max_connections: int = 100
+    max_connections_per_host: int = 10
+    politeness_delay: float = 0.5
+    host_delays: Dict[str, float] = field(default_factory=dict)
+    respect_robots: bool = False
+    state_file: str = ""
+    resume: bool = False
+    seen_set: str = 'exact'
+    seen_set_capacity: int = 0
+    seen_set_error_rate: float = 0.001
+    seen_set_stripes: int = 16
+    strip_query_params: List[str] = field(default_factory=lambda: list(DEFAULT_STRIP_PARAMS))
+    frontier_capacity: int = 100000
+    parser_workers: int = 0
+    output_file: str = ""
+    output_format: str = ""
+    keep_results: bool = True
+    cache_file: str = ""
+    cache_max_mb: int = 256
+    search_index: bool = False
+    index_file: str = ""
+    compact_results: bool = False
+    record_link_graph: bool = False
+    link_graph_file: str = ""
+    robots_ttl: int = 86400
+    use_sitemaps: bool = False
+    sitemap_urls: List[str] = field(default_factory=list)
+    max_sitemaps: int = 100
+    stream_downloads: bool = False
+    max_page_mb: float = 5
+    metrics_port: int = 0
+    metrics_interval: float = 0
+    adaptive_concurrency: bool = False
+    min_concurrency: int = 1
+    max_host_concurrency: int = 0
+    cluster_nodes: List[str] = field(default_factory=list)
+    node_index: int = 0
+    near_duplicates: bool = False
+    near_duplicate_distance: int = 3
+    continuous: bool = False
+    revisit_file: str = ""
+    revisit_rate: float = 1.0
+    max_staleness: float = 0.5
+    min_revisit_interval: float = 60
+    max_revisit_interval: float = 604800
+    initial_revisit_interval: float = 3600
+    dns_cache: bool = False
+    dns_ttl: float = 300
+    dns_negative_ttl: float = 60
+    dns_concurrency: int = 8
+
+    @classmethod
+    def from_json(cls, json_file: str) -> 'Crawler':
+        with open(json_file, 'r') as file:
+            data = json.load(file)
+            return cls(**data)
+
+    def to_json(self, json_file: str) -> None:
+        with open(json_file, 'w') as file:
+            json.dump(self.__dict__, file, indent=4)
+
+
+def build_crawler(config):
+    options = dict(parser=config.parser, politeness_delay=config.politeness_delay, host_delays=config.host_delays,
+                   respect_robots=config.respect_robots, state_file=config.state_file or None, resume=config.resume,
+                   seen_set=config.seen_set, seen_set_capacity=config.seen_set_capacity,
+                   seen_set_error_rate=config.seen_set_error_rate, seen_set_stripes=config.seen_set_stripes,
+                   strip_query_params=config.strip_query_params,
+                   frontier_capacity=config.frontier_capacity, parser_workers=config.parser_workers,
+                   sinks=[make_sink(config.output_file, config.output_format)]
+                   if config.output_file and config.node_index == 0 else None,
+                   keep_results=config.keep_results, cache_file=config.cache_file or None,
+                   cache_max_bytes=config.cache_max_mb * 2 ** 20,
+                   # Without a search to answer or a file to save it to, the index would only cost memory
+                   search_index=config.search_index and bool(config.wanted_title or config.wanted_header
+                                                             or config.index_file),
+                   index_file=config.index_file or None,
+                   compact_results=config.compact_results, record_link_graph=config.record_link_graph,
+                   link_graph_file=config.link_graph_file or None, robots_ttl=config.robots_ttl,
+                   use_sitemaps=config.use_sitemaps, sitemap_urls=config.sitemap_urls,
+                   max_sitemaps=config.max_sitemaps, stream_downloads=config.stream_downloads,
+                   max_page_bytes=int(config.max_page_mb * 2 ** 20), metrics_port=config.metrics_port or None,
+                   metrics_interval=config.metrics_interval, adaptive_concurrency=config.adaptive_concurrency,
+                   min_concurrency=config.min_concurrency, max_host_concurrency=config.max_host_concurrency,
+                   cluster_nodes=config.cluster_nodes or None, node_index=config.node_index,
+                   near_duplicates=config.near_duplicates, near_duplicate_distance=config.near_duplicate_distance,
+                   continuous=config.continuous, revisit_file=config.revisit_file or None,
+                   revisit_rate=config.revisit_rate, max_staleness=config.max_staleness,
+                   min_revisit_interval=config.min_revisit_interval, max_revisit_interval=config.max_revisit_interval,
+                   initial_revisit_interval=config.initial_revisit_interval, dns_cache=config.dns_cache,
+                   dns_ttl=config.dns_ttl, dns_negative_ttl=config.dns_negative_ttl,
+                   dns_concurrency=config.dns_concurrency)
+
+    if config.engine == 'async':
+        return AsyncWebCrawler(start_urls=config.start_urls, max_pages=config.max_pages, max_depth=config.max_depth,
+                               max_workers=config.max_workers, timeout=config.timeout,
+                               max_connections=config.max_connections,
+                               max_connections_per_host=config.max_connections_per_host, **options)
+
+    return WebCrawler(start_urls=config.start_urls, max_pages=config.max_pages, max_depth=config.max_depth,
+                      max_workers=config.max_workers, timeout=config.timeout, **options)
+
+
+if __name__ == "__main__":
+    loaded_config = CrawlerConfig.from_json(sys.argv[1] if len(sys.argv) > 1 else 'Crawler.json')
+    crawler = build_crawler(loaded_config)
+
+    try:
+        results = crawler.crawl()
+    except KeyboardInterrupt:
+        if not loaded_config.continuous:
+            raise
+        # A continuous crawl runs until it is interrupted; its schedule is already saved
+        results = crawler.crawl_results
+
+    if not(loaded_config.wanted_title == "" and loaded_config.wanted_header == ""):
+        index = crawler.search_index
+        if index is None:
+            index = ShardedSearch(results, loaded_config.max_workers, min(loaded_config.max_workers, os.cpu_count() or 1))
+        search_specific(loaded_config.max_pages, loaded_config.max_workers, loaded_config.wanted_title, loaded_config.wanted_header,
+                        index=index)
+        if isinstance(index, ShardedSearch):
+            index.close()
+    else:
+        for url, data in results.items():
+         print(f"id: {data.get('id')}")
+         print(f"URL: {url}")
+         print(f"Title: {data.get('title', 'No Title')}")
+         print(f"Text Length: {data.get('text_length', 0)}")
+         print(f"H1 Headings: {data.get('headings', {}).get('h1', [])}")
          print("\n")
\ No newline at end of file
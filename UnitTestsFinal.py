@@ -1,630 +1,2545 @@
-import unittest
-from unittest.mock import Mock, patch
-import json
-import requests
-from queue import Queue
-import threading
-from MyWebCrowler import WebCrawler, findMatchingTitle, CrawlerConfig, search_specific, findMatchingTitleAndHeader, findMatchingHeader
-
-
-class TestWebCrawler(unittest.TestCase):
-    def setUp(self):
-        """Set up test cases with default values"""
-        self.valid_start_urls = ["http://example.com"]
-        self.valid_max_pages = 10
-        self.valid_max_depth = 3
-        self.valid_max_workers = 2
-        self.valid_timeout = 5
-
-    def test_init_valid_parameters(self):
-        """Test initialization with valid parameters"""
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            self.valid_max_pages,
-            self.valid_max_depth,
-            self.valid_max_workers,
-            self.valid_timeout
-        )
-
-        self.assertEqual(crawler.start_urls, self.valid_start_urls)
-        self.assertEqual(crawler.max_pages, self.valid_max_pages)
-        self.assertEqual(crawler.max_depth, self.valid_max_depth)
-        self.assertEqual(crawler.max_workers, self.valid_max_workers)
-        self.assertEqual(crawler.timeout, self.valid_timeout)
-        self.assertIsInstance(crawler.url_queue, Queue)
-        self.assertIsInstance(crawler.visited_urls, set)
-        self.assertIsInstance(crawler.crawl_results, dict)
-        self.assertIsInstance(crawler.visited_lock, threading.Lock)
-        self.assertIsInstance(crawler.results_lock, threading.Lock)
-        self.assertIsInstance(crawler.page_count_lock, threading.Lock)
-        self.assertEqual(crawler.total_pages_crawled, 0)
-
-    def test_init_none_parameters(self):
-        """Test initialization with None parameters"""
-        parameters = [
-            (None, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, None, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, None, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, None, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, None)
-        ]
-
-        for params in parameters:
-            with self.assertRaises(TypeError):
-                WebCrawler(*params)
-
-    def test_init_invalid_types(self):
-        """Test initialization with invalid parameter types"""
-        invalid_params = [
-            (self.valid_start_urls, "10", self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, "3", self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, "2", self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, "5")
-        ]
-
-        for params in invalid_params:
-            with self.assertRaises(TypeError):
-                WebCrawler(*params)
-
-    def test_init_boolean_parameters(self):
-        """Test initialization with boolean parameters"""
-        boolean_params = [
-            (self.valid_start_urls, True, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, True, self.valid_max_workers, self.valid_timeout),
-            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, True, self.valid_timeout)
-        ]
-
-        for params in boolean_params:
-            with self.assertRaises(TypeError):
-                WebCrawler(*params)
-
-        # Special case for timeout boolean
-        crawler_true = WebCrawler(self.valid_start_urls, self.valid_max_pages,
-                                           self.valid_max_depth, self.valid_max_workers, True)
-        self.assertEqual(crawler_true.timeout, 1)
-
-        crawler_false = WebCrawler(self.valid_start_urls, self.valid_max_pages,
-                                            self.valid_max_depth, self.valid_max_workers, False)
-        self.assertEqual(crawler_false.timeout, 0)
-
-    def test_init_edge_cases(self):
-        """Test initialization with edge case values"""
-        # Test with negative values
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            -10,
-            -3,
-            -2,
-            -5
-        )
-        self.assertTrue(crawler.max_depth > 0)
-        self.assertEqual(crawler.max_workers, 2)
-        self.assertEqual(crawler.timeout, 1)
-
-        # Test with very large values
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            1000000,
-            2000,
-            100,
-            1000
-        )
-        self.assertEqual(crawler.max_depth, 100)  # Should be capped at 100
-
-    def test_is_valid_url(self):
-        """Test URL validation method"""
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            self.valid_max_pages,
-            self.valid_max_depth,
-            self.valid_max_workers,
-            self.valid_timeout
-        )
-
-        # Test valid URLs
-        valid_urls = [
-            "http://example.com",
-            "https://example.com/path",
-            "http://subdomain.example.com",
-            "https://example.com/path?param=value"
-        ]
-        for url in valid_urls:
-            self.assertTrue(crawler.is_valid_url(url))
-
-        # Test invalid URLs
-        invalid_urls = [
-            "ftp://example.com",
-            "http://example.com/image.jpg",
-            "http://example.com/document.pdf",
-            "http://" + "a" * 300,
-            "not_a_url",
-            "http://",
-            "",
-            None
-        ]
-        for url in invalid_urls:
-            self.assertFalse(crawler.is_valid_url(url))
-
-    @patch('requests.get')
-    def test_extract_links(self, mock_get):
-        """Test link extraction from HTML content"""
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            self.valid_max_pages,
-            self.valid_max_depth,
-            self.valid_max_workers,
-            self.valid_timeout
-        )
-
-        # Test with various HTML contents
-        test_cases = [
-            {
-                'html': """
-                    <html>
-                        <body>
-                            <a href="http://example.com/page1">Link 1</a>
-                            <a href="/page2">Link 2</a>
-                            <a href="page3">Link 3</a>
-                            <a href="http://example.com/image.jpg">Image</a>
-                        </body>
-                    </html>
-                """,
-                'base_url': "http://example.com",
-                'expected_links': [
-                    "http://example.com/page1",
-                    "http://example.com/page2",
-                    "http://example.com/page3"
-                ]
-            },
-            {
-                'html': "<html><body></body></html>",
-                'base_url': "http://example.com",
-                'expected_links': []
-            },
-            {
-                'html': None,
-                'base_url': "http://example.com",
-                'expected_links': []
-            }
-        ]
-
-        for test_case in test_cases:
-            links = crawler.extract_links(test_case['html'], test_case['base_url'])
-            self.assertEqual(sorted(links), sorted(test_case['expected_links']))
-
-    def test_extract_page_info(self):
-        """Test page information extraction"""
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            self.valid_max_pages,
-            self.valid_max_depth,
-            self.valid_max_workers,
-            self.valid_timeout
-        )
-
-        # Test with various HTML contents
-        test_cases = [
-            {
-                'html': """
-                    <html>
-                        <head><title>Test Page</title></head>
-                        <body>
-                            <h1>Main Heading</h1>
-                            <h2>Sub Heading 1</h2>
-                            <h2>Sub Heading 2</h2>
-                            <p>Some content</p>
-                            <a href="#">Link 1</a>
-                            <a href="#">Link 2</a>
-                        </body>
-                    </html>
-                """,
-                'url': "http://example.com",
-                'expected': {
-                    'title': 'Test Page',
-                    'h1_count': 1,
-                    'h2_count': 2,
-                    'links_count': 2
-                }
-            },
-            {
-                'html': "<html><body></body></html>",
-                'url': "http://example.com",
-                'expected': {
-                    'title': 'No Title',
-                    'h1_count': 0,
-                    'h2_count': 0,
-                    'links_count': 0
-                }
-            }
-        ]
-
-        for test_case in test_cases:
-            info = crawler.extract_page_info(test_case['html'], test_case['url'])
-            self.assertEqual(info['title'], test_case['expected']['title'])
-            self.assertEqual(len(info['headings']['h1']), test_case['expected']['h1_count'])
-            self.assertEqual(len(info['headings']['h2']), test_case['expected']['h2_count'])
-            self.assertEqual(info['links_count'], test_case['expected']['links_count'])
-
-    @patch('requests.get')
-    def test_worker_functionality(self, mock_get):
-        """Test worker thread functionality"""
-        crawler = WebCrawler(
-            self.valid_start_urls,
-            self.valid_max_pages,
-            self.valid_max_depth,
-            self.valid_max_workers,
-            self.valid_timeout
-        )
-
-        # Test successful page crawl
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = """
-            <html>
-                <head><title>Test</title></head>
-                <body>
-                    <h1>Test Page</h1>
-                    <a href="http://example.com/page1">Link</a>
-                </body>
-            </html>
-        """
-        mock_get.return_value = mock_response
-
-        crawler.url_queue.put(("http://example.com", 0))
-        crawler.worker()
-
-        self.assertEqual(len(crawler.crawl_results), 1)
-        self.assertEqual(crawler.total_pages_crawled, 1)
-
-        # Test failed request
-        mock_get.side_effect = requests.RequestException()
-        crawler.url_queue.put(("http://example.com/error", 0))
-        crawler.worker()
-
-        self.assertEqual(len(crawler.crawl_results), 1)  # Should not increase
-
-        # Test max depth limit
-        crawler.url_queue.put(("http://example.com/deep", crawler.max_depth + 1))
-        crawler.worker()
-
-        self.assertEqual(len(crawler.crawl_results), 1)  # Should not increase
-
-
-class TestThreadedClasses(unittest.TestCase):
-    """Test cases for threaded classes"""
-
-    def test_find_matching_title(self):
-        """Test findMatchingTitle class"""
-        thread = findMatchingTitle(0, 10, "test")
-
-        # Test initialization
-        self.assertEqual(thread.from_id, 0)
-        self.assertEqual(thread.to_id, 10)
-        self.assertEqual(thread.wanted_word, "test")
-
-        # Test word finding
-        self.assertTrue(thread.find_word("Test Title", "test"))
-        self.assertTrue(thread.find_word("TEST TITLE", "test"))
-        self.assertTrue(thread.find_word("A test in title", "test"))
-        self.assertFalse(thread.find_word("No match here", "test"))
-
-        # Test with empty strings
-        self.assertFalse(thread.find_word("", "test"))
-        self.assertFalse(thread.find_word("Title", ""))
-
-    def test_find_matching_header(self):
-        """Test findMatchingHeader class"""
-        thread = findMatchingHeader(0, 10, "test")
-
-        # Test initialization
-        self.assertEqual(thread.from_id, 0)
-        self.assertEqual(thread.to_id, 10)
-        self.assertEqual(thread.wanted_header, "test")
-
-        # Test header finding
-        headers = ["Test Header", "Another Header"]
-        self.assertTrue(thread.find_header(headers, "test"))
-        self.assertFalse(thread.find_header(headers, "nonexistent"))
-
-        # Test with empty lists and strings
-        self.assertFalse(thread.find_header([], "test"))
-        self.assertFalse(thread.find_header(headers, ""))
-
-    def test_find_matching_title_and_header(self):
-        """Test findMatchingTitleAndHeader class"""
-        thread = findMatchingTitleAndHeader(0, 10, "test_title", "test_header")
-
-        # Test initialization
-        self.assertEqual(thread.from_id, 0)
-        self.assertEqual(thread.to_id, 10)
-        self.assertEqual(thread.wanted_title, "test_title")
-        self.assertEqual(thread.wanted_header, "test_header")
-
-
-class TestSearchSpecific(unittest.TestCase):
-    """Test cases for search_specific function"""
-
-    def test_valid_parameters(self):
-        """Test with valid parameters"""
-        with patch('threading.Thread.start'), patch('threading.Thread.join'):
-            result = search_specific(100, 4, "test", "header")
-            self.assertIsInstance(result, list)
-            self.assertEqual(len(result), 4)
-
-    def test_invalid_parameters(self):
-        """Test with invalid parameters"""
-        invalid_params = [
-            ("100", 4, "test", "header"),
-            (100, "4", "test", "header"),
-            (100, 4, 123, "header"),
-            (100, 4, "test", 123)
-        ]
-
-        for params in invalid_params:
-            with self.assertRaises(TypeError):
-                search_specific(*params)
-
-    def test_edge_cases(self):
-        """Test edge cases"""
-        test_cases = [
-            (-50, 4, "test", "header"),
-            (100, 0, "test", "header"),
-            (True, 4, "test", "header"),
-            (100, False, "test", "header")
-        ]
-
-        with patch('threading.Thread.start'), patch('threading.Thread.join'):
-            for params in test_cases:
-                result = search_specific(*params)
-                self.assertIsInstance(result, list)
-                self.assertGreater(len(result), 0)
-
-    def test_chunk_size_calculation(self):
-        """Test chunk size calculation logic"""
-        test_cases = [
-            {
-                'total_pages': 100,
-                'num_workers': 4,
-                'expected_chunk': 25
-            },
-            {
-                'total_pages': 99,  # Not evenly divisible
-                'num_workers': 4,
-                'expected_chunk': 10  # Should adjust to num_workers * 10
-            },
-            {
-                'total_pages': 10,
-                'num_workers': 2,
-                'expected_chunk': 5
-            }
-        ]
-
-        for case in test_cases:
-            with patch('threading.Thread.start'), patch('threading.Thread.join'):
-                result = search_specific(
-                    case['total_pages'],
-                    case['num_workers'],
-                    "test",
-                    "header"
-                )
-                self.assertEqual(
-                    len(result),
-                    case['num_workers']
-                )
-
-    def test_empty_strings(self):
-        """Test behavior with empty strings"""
-        with patch('threading.Thread.start'), patch('threading.Thread.join'):
-            # Empty title
-            result = search_specific(100, 4, "", "header")
-            self.assertTrue(all(isinstance(thread, findMatchingHeader) for thread in result))
-
-            # Empty header
-            result = search_specific(100, 4, "title", "")
-            self.assertTrue(all(isinstance(thread, findMatchingTitle) for thread in result))
-
-            # Both empty
-            result = search_specific(100, 4, "", "")
-            self.assertEqual(len(result), 0)
-
-
-class TestCrawlerConfig(unittest.TestCase):
-    """Test cases for CrawlerConfig class"""
-
-    def setUp(self):
-        self.valid_config = {
-            'start_urls': ["http://example.com"],
-            'max_pages': 10,
-            'max_depth': 3,
-            'max_workers': 2,
-            'timeout': 5,
-            'wanted_title': "test",
-            'wanted_header': "header"
-        }
-        self.config = CrawlerConfig(**self.valid_config)
-
-    def test_initialization(self):
-        """Test CrawlerConfig initialization"""
-        self.assertEqual(self.config.start_urls, self.valid_config['start_urls'])
-        self.assertEqual(self.config.max_pages, self.valid_config['max_pages'])
-        self.assertEqual(self.config.max_depth, self.valid_config['max_depth'])
-        self.assertEqual(self.config.max_workers, self.valid_config['max_workers'])
-        self.assertEqual(self.config.timeout, self.valid_config['timeout'])
-        self.assertEqual(self.config.wanted_title, self.valid_config['wanted_title'])
-        self.assertEqual(self.config.wanted_header, self.valid_config['wanted_header'])
-
-    def test_to_json(self):
-        """Test JSON serialization"""
-        test_file = "test_config.json"
-
-        # Test writing to JSON
-        self.config.to_json(test_file)
-
-        # Read and verify JSON content
-        with open(test_file, 'r') as file:
-            loaded_data = json.load(file)
-
-            self.assertEqual(loaded_data['start_urls'], self.valid_config['start_urls'])
-            self.assertEqual(loaded_data['max_pages'], self.valid_config['max_pages'])
-            self.assertEqual(loaded_data['max_depth'], self.valid_config['max_depth'])
-            self.assertEqual(loaded_data['max_workers'], self.valid_config['max_workers'])
-            self.assertEqual(loaded_data['timeout'], self.valid_config['timeout'])
-            self.assertEqual(loaded_data['wanted_title'], self.valid_config['wanted_title'])
-            self.assertEqual(loaded_data['wanted_header'], self.valid_config['wanted_header'])
-
-    def test_from_json(self):
-        """Test JSON deserialization"""
-        test_file = "test_config.json"
-
-        # Write test config
-        with open(test_file, 'w') as file:
-            json.dump(self.valid_config, file)
-
-        # Load and verify
-        loaded_config = CrawlerConfig.from_json(test_file)
-
-        self.assertEqual(loaded_config.start_urls, self.valid_config['start_urls'])
-        self.assertEqual(loaded_config.max_pages, self.valid_config['max_pages'])
-        self.assertEqual(loaded_config.max_depth, self.valid_config['max_depth'])
-        self.assertEqual(loaded_config.max_workers, self.valid_config['max_workers'])
-        self.assertEqual(loaded_config.timeout, self.valid_config['timeout'])
-        self.assertEqual(loaded_config.wanted_title, self.valid_config['wanted_title'])
-        self.assertEqual(loaded_config.wanted_header, self.valid_config['wanted_header'])
-
-    def test_json_error_handling(self):
-        """Test error handling in JSON operations"""
-        # Test with invalid JSON file
-        with self.assertRaises(json.JSONDecodeError):
-            CrawlerConfig.from_json("nonexistent.json")
-
-        # Test with missing required fields
-        invalid_config = {
-            'start_urls': ["http://example.com"],
-            'max_pages': 10
-            # missing other required fields
-        }
-
-        test_file = "invalid_config.json"
-        with open(test_file, 'w') as file:
-            json.dump(invalid_config, file)
-
-        with self.assertRaises(TypeError):
-            CrawlerConfig.from_json(test_file)
-
-
-class TestIntegration(unittest.TestCase):
-    """Integration tests for the complete crawler system"""
-
-    def setUp(self):
-        self.config = CrawlerConfig(
-            start_urls=["http://example.com"],
-            max_pages=10,
-            max_depth=3,
-            max_workers=2,
-            timeout=5,
-            wanted_title="test",
-            wanted_header="header"
-        )
-
-    @patch('requests.get')
-    def test_complete_workflow(self, mock_get):
-        """Test the complete workflow from configuration to crawling"""
-        # Mock responses
-        mock_responses = {
-            "http://example.com": """
-                    <html>
-                        <head><title>Test Page</title></head>
-                        <body>
-                            <h1>Welcome</h1>
-                            <h2>Subheading</h2>
-                            <a href="http://example.com/page1">Link 1</a>
-                            <a href="http://example.com/page2">Link 2</a>
-                        </body>
-                    </html>
-                """,
-            "http://example.com/page1": """
-                    <html>
-                        <head><title>Page 1</title></head>
-                        <body>
-                            <h1>Page 1</h1>
-                            <a href="http://example.com/page3">Link 3</a>
-                        </body>
-                    </html>
-                """
-        }
-
-        def mock_get_response(*args, **kwargs):
-            url = args[0]
-            response = Mock()
-            response.status_code = 200
-            response.text = mock_responses.get(url, "<html><head><title>Default</title></head></html>")
-            return response
-
-        mock_get.side_effect = mock_get_response
-
-        # Create crawler and run
-        crawler = WebCrawler(
-            start_urls=self.config.start_urls,
-            max_pages=self.config.max_pages,
-            max_depth=self.config.max_depth,
-            max_workers=self.config.max_workers,
-            timeout=self.config.timeout
-        )
-
-        results = crawler.crawl()
-
-        # Verify results
-        self.assertIn("http://example.com", results)
-        self.assertIn("http://example.com/page1", results)
-        self.assertEqual(results["http://example.com"]['title'], "Test Page")
-        self.assertEqual(len(results["http://example.com"]['headings']['h1']), 1)
-        self.assertEqual(len(results["http://example.com"]['headings']['h2']), 1)
-
-    def test_error_recovery(self):
-        """Test system's ability to handle and recover from errors"""
-        with patch('requests.get') as mock_get:
-            # Simulate various errors
-            mock_get.side_effect = [
-                requests.RequestException("Connection error"),
-                Mock(status_code=404),
-                Mock(status_code=500),
-                Mock(status_code=200, text="<html><head><title>Success</title></head></html>")
-            ]
-
-            crawler = WebCrawler(
-                start_urls=self.config.start_urls,
-                max_pages=self.config.max_pages,
-                max_depth=self.config.max_depth,
-                max_workers=self.config.max_workers,
-                timeout=self.config.timeout
-            )
-
-            results = crawler.crawl()
-
-            # Verify crawler continues despite errors
-            self.assertGreaterEqual(len(results), 0)
-
-    @patch('logging.Logger.warning')
-    @patch('logging.Logger.error')
-    def test_logging(self, mock_error, mock_warning):
-        """Test logging functionality"""
-        crawler = WebCrawler(
-            start_urls=self.config.start_urls,
-            max_pages=self.config.max_pages,
-            max_depth=self.config.max_depth,
-            max_workers=self.config.max_workers,
-            timeout=self.config.timeout
-        )
-
-        with patch('requests.get') as mock_get:
-            # Trigger warning
-            mock_get.side_effect = requests.RequestException("Test error")
-            crawler.crawl()
-
-            # Verify logging calls
-            mock_warning.assert_called()
-            self.assertIn("Request failed", str(mock_warning.call_args))
-
-
-if __name__ == '__main__':
+import unittest
+from unittest.mock import Mock, patch
+import json
+import os
+import csv
+import sqlite3
+import tempfile
+import time
+import math
+import requests
+from urllib.parse import urlsplit
+from collections import Counter
+from queue import Queue, Empty
+import threading
+import socket
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from MyWebCrowler import WebCrawler, findMatchingTitle, CrawlerConfig, search_specific, findMatchingTitleAndHeader, findMatchingHeader, parse_page, PARSERS, LXML_AVAILABLE
+from MyWebCrowler import AsyncWebCrawler, AIOHTTP_AVAILABLE, build_crawler, CrawlFrontier, CrawlState
+from MyWebCrowler import ExactSeenSet, HashedSeenSet, BloomSeenSet, SEEN_SETS, canonicalize_url
+from MyWebCrowler import make_sink, ResultSink, SinkWriter, JsonLinesSink, CsvSink, SqliteSink, HttpCache, SearchIndex, ShardedSearch
+from MyWebCrowler import _match_loaded_shards
+from MyWebCrowler import ResultStore, PageRecord, LinkGraph, NUMPY_AVAILABLE
+from MyWebCrowler import RobotsCache, iter_sitemap, parse_lastmod
+from MyWebCrowler import Histogram, MetricsRegistry, MetricsServer
+from MyWebCrowler import AdaptiveConcurrency, retry_after, HashRing, simhash, SimHashIndex, RevisitScheduler
+from MyWebCrowler import sniff_charset, PageBudget, StripedSeenSet, DnsCache
+
+
+SITE_PAGES = {
+    "/": '<html><head><title>Home</title></head><body><h1>Home</h1><a href="/a">A</a><a href="/b">B</a></body></html>',
+    "/a": '<html><head><title>A</title></head><body><h2>Page A</h2><a href="/c">C</a><a href="/">Home</a></body></html>',
+    "/b": '<html><head><title>B</title></head><body><a href="/d">D</a><a href="/missing">Missing</a></body></html>',
+    "/c": '<html><head><title>C</title></head><body><a href="/e">E</a></body></html>',
+    "/d": '<html><head><title>D</title></head><body>Leaf</body></html>',
+    "/e": '<html><head><title>E</title></head><body>Deep leaf</body></html>',
+    # Only reached through robots.txt and the sitemaps; {base} is replaced with the server's address
+    "/robots.txt": "User-agent: *\nDisallow: /private\nSitemap: {base}/sitemap_index.xml\n",
+    "/sitemap_index.xml": '<?xml version="1.0" encoding="UTF-8"?>'
+                          '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                          '<sitemap><loc>{base}/sitemap-news.xml</loc></sitemap></sitemapindex>',
+    "/sitemap-news.xml": '<?xml version="1.0" encoding="UTF-8"?>'
+                         '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                         '<url><loc>{base}/news/old</loc><lastmod>2020-01-01</lastmod></url>'
+                         '<url><loc>{base}/news/undated</loc></url>'
+                         '<url><loc>{base}/news/fresh</loc><lastmod>2025-06-01T10:00:00Z</lastmod></url>'
+                         '<url><loc>{base}/private/secret</loc><lastmod>2025-06-02</lastmod></url>'
+                         '<url><loc>http://other.example/page</loc></url></urlset>',
+    "/news/": '<html><head><title>News</title></head><body><a href="fresh">Fresh</a></body></html>',
+    "/news/old": '<html><head><title>Old news</title></head><body>Old</body></html>',
+    "/news/undated": '<html><head><title>Undated news</title></head><body>Undated</body></html>',
+    "/news/fresh": '<html><head><title>Fresh news</title></head><body>Fresh</body></html>',
+    "/private/secret": '<html><head><title>Secret</title></head><body>Secret</body></html>',
+}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Serves SITE_PAGES to crawlers under test"""
+    hits = Counter()
+    not_modified = 0
+
+    def do_GET(self):
+        SiteHandler.hits[self.path] += 1
+        body = SITE_PAGES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.replace("{base}", f"http://{self.headers['Host']}").encode('utf-8')
+        etag = f'"{len(data)}-{sum(data)}"'
+        if self.headers.get('If-None-Match') == etag:
+            SiteHandler.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_site_server(handler=SiteHandler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def stop_site_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class TestWebCrawler(unittest.TestCase):
+    def setUp(self):
+        """Set up test cases with default values"""
+        self.valid_start_urls = ["http://example.com"]
+        self.valid_max_pages = 10
+        self.valid_max_depth = 3
+        self.valid_max_workers = 2
+        self.valid_timeout = 5
+
+    def test_init_valid_parameters(self):
+        """Test initialization with valid parameters"""
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            self.valid_max_pages,
+            self.valid_max_depth,
+            self.valid_max_workers,
+            self.valid_timeout
+        )
+
+        self.assertEqual(crawler.start_urls, self.valid_start_urls)
+        self.assertEqual(crawler.max_pages, self.valid_max_pages)
+        self.assertEqual(crawler.max_depth, self.valid_max_depth)
+        self.assertEqual(crawler.max_workers, self.valid_max_workers)
+        self.assertEqual(crawler.timeout, self.valid_timeout)
+        self.assertIsInstance(crawler.url_queue, Queue)
+        self.assertIsInstance(crawler.visited_urls, StripedSeenSet)
+        self.assertIsInstance(crawler.crawl_results, dict)
+        self.assertIsInstance(crawler.results_lock, threading.Lock)
+        self.assertIsInstance(crawler.budget, PageBudget)
+        self.assertEqual(crawler.total_pages_crawled, 0)
+
+    def test_init_none_parameters(self):
+        """Test initialization with None parameters"""
+        parameters = [
+            (None, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, None, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, None, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, None, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, None)
+        ]
+
+        for params in parameters:
+            with self.assertRaises(TypeError):
+                WebCrawler(*params)
+
+    def test_init_invalid_types(self):
+        """Test initialization with invalid parameter types"""
+        invalid_params = [
+            (self.valid_start_urls, "10", self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, "3", self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, "2", self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, self.valid_max_workers, "5")
+        ]
+
+        for params in invalid_params:
+            with self.assertRaises(TypeError):
+                WebCrawler(*params)
+
+    def test_init_boolean_parameters(self):
+        """Test initialization with boolean parameters"""
+        boolean_params = [
+            (self.valid_start_urls, True, self.valid_max_depth, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, True, self.valid_max_workers, self.valid_timeout),
+            (self.valid_start_urls, self.valid_max_pages, self.valid_max_depth, True, self.valid_timeout)
+        ]
+
+        for params in boolean_params:
+            with self.assertRaises(TypeError):
+                WebCrawler(*params)
+
+        # Special case for timeout boolean
+        crawler_true = WebCrawler(self.valid_start_urls, self.valid_max_pages,
+                                           self.valid_max_depth, self.valid_max_workers, True)
+        self.assertEqual(crawler_true.timeout, 1)
+
+        crawler_false = WebCrawler(self.valid_start_urls, self.valid_max_pages,
+                                            self.valid_max_depth, self.valid_max_workers, False)
+        self.assertEqual(crawler_false.timeout, 0)
+
+    def test_init_edge_cases(self):
+        """Test initialization with edge case values"""
+        # Test with negative values
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            -10,
+            -3,
+            -2,
+            -5
+        )
+        self.assertTrue(crawler.max_depth > 0)
+        self.assertEqual(crawler.max_workers, 2)
+        self.assertEqual(crawler.timeout, 1)
+
+        # Test with very large values
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            1000000,
+            2000,
+            100,
+            1000
+        )
+        self.assertEqual(crawler.max_depth, 100)  # Should be capped at 100
+
+    def test_is_valid_url(self):
+        """Test URL validation method"""
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            self.valid_max_pages,
+            self.valid_max_depth,
+            self.valid_max_workers,
+            self.valid_timeout
+        )
+
+        # Test valid URLs
+        valid_urls = [
+            "http://example.com",
+            "https://example.com/path",
+            "http://subdomain.example.com",
+            "https://example.com/path?param=value"
+        ]
+        for url in valid_urls:
+            self.assertTrue(crawler.is_valid_url(url))
+
+        # Test invalid URLs
+        invalid_urls = [
+            "ftp://example.com",
+            "http://example.com/image.jpg",
+            "http://example.com/document.pdf",
+            "http://" + "a" * 300,
+            "not_a_url",
+            "http://",
+            "",
+            None
+        ]
+        for url in invalid_urls:
+            self.assertFalse(crawler.is_valid_url(url))
+
+    @patch('requests.get')
+    def test_extract_links(self, mock_get):
+        """Test link extraction from HTML content"""
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            self.valid_max_pages,
+            self.valid_max_depth,
+            self.valid_max_workers,
+            self.valid_timeout
+        )
+
+        # Test with various HTML contents
+        test_cases = [
+            {
+                'html': """
+                    <html>
+                        <body>
+                            <a href="http://example.com/page1">Link 1</a>
+                            <a href="/page2">Link 2</a>
+                            <a href="page3">Link 3</a>
+                            <a href="http://example.com/image.jpg">Image</a>
+                        </body>
+                    </html>
+                """,
+                'base_url': "http://example.com",
+                'expected_links': [
+                    "http://example.com/page1",
+                    "http://example.com/page2",
+                    "http://example.com/page3"
+                ]
+            },
+            {
+                'html': "<html><body></body></html>",
+                'base_url': "http://example.com",
+                'expected_links': []
+            },
+            {
+                'html': None,
+                'base_url': "http://example.com",
+                'expected_links': []
+            }
+        ]
+
+        for test_case in test_cases:
+            links = crawler.extract_links(test_case['html'], test_case['base_url'])
+            self.assertEqual(sorted(links), sorted(test_case['expected_links']))
+
+    def test_extract_page_info(self):
+        """Test page information extraction"""
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            self.valid_max_pages,
+            self.valid_max_depth,
+            self.valid_max_workers,
+            self.valid_timeout
+        )
+
+        # Test with various HTML contents
+        test_cases = [
+            {
+                'html': """
+                    <html>
+                        <head><title>Test Page</title></head>
+                        <body>
+                            <h1>Main Heading</h1>
+                            <h2>Sub Heading 1</h2>
+                            <h2>Sub Heading 2</h2>
+                            <p>Some content</p>
+                            <a href="#">Link 1</a>
+                            <a href="#">Link 2</a>
+                        </body>
+                    </html>
+                """,
+                'url': "http://example.com",
+                'expected': {
+                    'title': 'Test Page',
+                    'h1_count': 1,
+                    'h2_count': 2,
+                    'links_count': 2
+                }
+            },
+            {
+                'html': "<html><body></body></html>",
+                'url': "http://example.com",
+                'expected': {
+                    'title': 'No Title',
+                    'h1_count': 0,
+                    'h2_count': 0,
+                    'links_count': 0
+                }
+            }
+        ]
+
+        for test_case in test_cases:
+            info = crawler.extract_page_info(test_case['html'], test_case['url'])
+            self.assertEqual(info['title'], test_case['expected']['title'])
+            self.assertEqual(len(info['headings']['h1']), test_case['expected']['h1_count'])
+            self.assertEqual(len(info['headings']['h2']), test_case['expected']['h2_count'])
+            self.assertEqual(info['links_count'], test_case['expected']['links_count'])
+
+    def test_parse_page_backends(self):
+        """Test that every parser backend returns the same page info and links"""
+        html = """
+            <html>
+                <head><title>Test Page</title><script>var hidden = 1;</script></head>
+                <body>
+                    <h1>Main <b>Heading</b></h1>
+                    <h2>Sub Heading</h2>
+                    <p>Some content</p>
+                    <a href="/page1">Link 1</a>
+                    <a href="http://example.com/page2">Link 2</a>
+                    <a name="anchor">No href</a>
+                </body>
+            </html>
+        """
+        expected_info, expected_links = parse_page(html, "http://example.com", 'html.parser')
+        self.assertEqual(expected_info['headings']['h1'], ['MainHeading'])
+        self.assertEqual(expected_links, ["http://example.com/page1", "http://example.com/page2"])
+
+        for parser in PARSERS:
+            if parser == 'lxml' and not LXML_AVAILABLE:
+                continue
+            info, links = parse_page(html, "http://example.com", parser)
+            if parser == 'lxml':
+                # lxml drops the whitespace around <html>, so only the text length differs
+                info['text_length'] = expected_info['text_length']
+            self.assertEqual(info, expected_info, parser)
+            self.assertEqual(links, expected_links, parser)
+
+    def test_parse_page_single_call(self):
+        """Test that the crawler parse step returns page info with id and valid links"""
+        for parser in ('html.parser', 'stream', 'unknown'):
+            crawler = WebCrawler(
+                self.valid_start_urls,
+                self.valid_max_pages,
+                self.valid_max_depth,
+                self.valid_max_workers,
+                self.valid_timeout,
+                parser=parser
+            )
+            page_info, links = crawler.parse_page(
+                '<html><title>T</title><a href="/a">a</a><a href="/b.jpg">b</a></html>', "http://example.com")
+
+            self.assertEqual(page_info['id'], 0)
+            self.assertEqual(page_info['title'], 'T')
+            self.assertEqual(page_info['links_count'], 2)
+            self.assertEqual(links, ["http://example.com/a"])
+        self.assertEqual(crawler.parser, 'html.parser')
+
+    @patch('requests.get')
+    def test_worker_functionality(self, mock_get):
+        """Test worker thread functionality"""
+        crawler = WebCrawler(
+            self.valid_start_urls,
+            self.valid_max_pages,
+            self.valid_max_depth,
+            self.valid_max_workers,
+            self.valid_timeout
+        )
+
+        # Test successful page crawl
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.text = """
+            <html>
+                <head><title>Test</title></head>
+                <body>
+                    <h1>Test Page</h1>
+                    <a href="http://example.com/page1">Link</a>
+                </body>
+            </html>
+        """
+        mock_get.return_value = mock_response
+
+        crawler.url_queue.put(("http://example.com", 0))
+        crawler.worker()
+
+        self.assertEqual(len(crawler.crawl_results), 1)
+        self.assertEqual(crawler.total_pages_crawled, 1)
+
+        # Test failed request
+        mock_get.side_effect = requests.RequestException()
+        crawler.url_queue.put(("http://example.com/error", 0))
+        crawler.worker()
+
+        self.assertEqual(len(crawler.crawl_results), 1)  # Should not increase
+
+        # Test max depth limit
+        crawler.url_queue.put(("http://example.com/deep", crawler.max_depth + 1))
+        crawler.worker()
+
+        self.assertEqual(len(crawler.crawl_results), 1)  # Should not increase
+
+
+class TestUrlCanonicalization(unittest.TestCase):
+    """Test cases for URL canonicalization and dedup before enqueue"""
+
+    def test_canonicalize_url(self):
+        """Test that equivalent URLs share one canonical form"""
+        variants = [
+            "http://x.cz/a",
+            "http://x.cz/a#top",
+            "HTTP://X.CZ/a",
+            "http://x.cz:80/a",
+        ]
+        self.assertEqual({canonicalize_url(url) for url in variants}, {"http://x.cz/a"})
+
+        self.assertEqual(canonicalize_url("https://x.cz/a?b=2&a=1&utm_source=rss&utm_medium=x&fbclid=1"),
+                         "https://x.cz/a?a=1&b=2")
+        self.assertEqual(canonicalize_url("https://x.cz:8443/a?ref=1", ('ref',)), "https://x.cz:8443/a")
+        self.assertEqual(canonicalize_url("http://example.com"), "http://example.com/")
+        self.assertEqual(canonicalize_url("http://x.cz:bad/"), "http://x.cz:bad/")
+        # The path slash and the query as written are kept: servers may tell them apart
+        self.assertEqual(canonicalize_url("http://x.cz/news/"), "http://x.cz/news/")
+        self.assertEqual(canonicalize_url("http://x.cz/a?q=a%20b&flag&utm_source=rss"), "http://x.cz/a?flag&q=a%20b")
+
+    def test_page_links_deduplicated(self):
+        """Test that duplicates within one page reach url_queue once"""
+        crawler = WebCrawler(["http://example.com"], 10, 3, 2, 5, strip_query_params=['utm_*', 'ref'])
+        html = """
+            <a href="/a">1</a><a href="/a/">2</a><a href="/a#comments">3</a>
+            <a href="HTTP://EXAMPLE.COM/a?utm_campaign=x">4</a><a href="/b?y=2&x=1&ref=menu">5</a>
+            <a href="/b?x=1&y=2">6</a>
+        """
+        links = crawler.extract_links(html, "http://example.com/")
+        # The first spelling of each URL is kept, since it is the one fetched
+        self.assertEqual(links, ["http://example.com/a", "http://example.com/a/", "http://example.com/b?y=2&x=1&ref=menu"])
+
+        crawler.mark_visited("http://EXAMPLE.com/a#top")
+        self.assertFalse(crawler.is_valid_url("http://example.com/a"))
+        self.assertFalse(crawler.mark_visited("http://example.com/a?utm_source=rss"))
+        self.assertTrue(crawler.is_valid_url("http://example.com/a/"))
+
+    def test_relative_links_resolve_against_fetched_url(self):
+        """Test that a page is fetched as linked and its relative links resolve against that URL"""
+        server, base_url = start_site_server()
+        try:
+            crawler = WebCrawler([base_url + "/news/#top"], 10, 1, 2, 5, politeness_delay=0)
+            results = crawler.crawl()
+        finally:
+            stop_site_server(server)
+        self.assertEqual(set(results), {base_url + "/news/", base_url + "/news/fresh"})
+
+
+class TestCrawlFrontier(unittest.TestCase):
+    """Test cases for the per-host politeness frontier"""
+
+    def test_other_hosts_are_not_throttled(self):
+        """Test that a delayed host does not block URLs of other hosts"""
+        frontier = CrawlFrontier(delay=0.3)
+        frontier.put(("http://a.com/1", 0))
+        frontier.put(("http://a.com/2", 0))
+        frontier.put(("http://b.com/1", 0))
+
+        start = time.monotonic()
+        first = frontier.get(timeout=1)[0]
+        second = frontier.get(timeout=1)[0]
+        self.assertEqual({first, second}, {"http://a.com/1", "http://b.com/1"})
+        self.assertLess(time.monotonic() - start, 0.2)
+
+        self.assertEqual(frontier.get(timeout=1)[0], "http://a.com/2")
+        self.assertGreaterEqual(time.monotonic() - start, 0.29)
+
+    def test_host_delays_and_empty(self):
+        """Test per-host delays, non-blocking get and the empty timeout"""
+        frontier = CrawlFrontier(delay=0, host_delays={"Slow.com": 10})
+        self.assertEqual(frontier.host_delay("slow.com"), 10)
+
+        frontier.put(("http://slow.com/1", 0))
+        frontier.put(("http://slow.com/2", 0))
+        frontier.get()
+        with self.assertRaises(Empty):
+            frontier.get_nowait()
+        self.assertEqual(frontier.qsize(), 1)
+
+        with self.assertRaises(Empty):
+            CrawlFrontier().get(timeout=0.05)
+
+    def test_priority_order(self):
+        """Test BFS order by depth, then score, then host fairness"""
+        frontier = CrawlFrontier(delay=0)
+        frontier.put(("http://a.com/deep", 2))
+        frontier.put(("http://a.com/low", 1), score=0.1)
+        frontier.put(("http://b.com/high", 1), score=0.9)
+        frontier.put(("http://a.com/root", 0))
+
+        order = [frontier.get_nowait()[0] for _ in range(4)]
+        self.assertEqual(order, ["http://a.com/root", "http://b.com/high", "http://a.com/low", "http://a.com/deep"])
+
+        for path in ("1", "2", "3"):
+            frontier.put((f"http://a.com/{path}", 1))
+        frontier.put(("http://b.com/1", 1))
+        hosts = [frontier.get_nowait()[0][:12] for _ in range(2)]
+        self.assertEqual(sorted(hosts), ["http://a.com", "http://b.com"])
+
+    def test_duplicates_keep_lowest_depth(self):
+        """Test that a URL is queued once, at its lowest depth"""
+        frontier = CrawlFrontier(delay=0)
+        self.assertTrue(frontier.put(("http://a.com/x", 3)))
+        self.assertFalse(frontier.put(("http://a.com/x", 4)))
+        self.assertTrue(frontier.put(("http://a.com/x", 1)))
+
+        self.assertEqual(frontier.qsize(), 1)
+        self.assertEqual(frontier.get_nowait(), ("http://a.com/x", 1))
+
+    def test_enqueue_time_rejection(self):
+        """Test that unreachable URLs are rejected and the lowest-priority ones are evicted"""
+        frontier = CrawlFrontier(delay=0, max_depth=2, budget=lambda: 2)
+        self.assertFalse(frontier.put(("http://a.com/too-deep", 3)))
+        self.assertTrue(frontier.put(("http://a.com/1", 1)))
+        self.assertTrue(frontier.put(("http://a.com/2", 1)))
+        self.assertFalse(frontier.put(("http://a.com/3", 2)))
+        self.assertEqual(frontier.rejected, 1)
+        self.assertEqual(frontier.overflowed, {"http://a.com/3": 2})
+
+        frontier = CrawlFrontier(delay=0, capacity=2)
+        frontier.put(("http://a.com/1", 2))
+        frontier.put(("http://a.com/2", 1))
+        self.assertFalse(frontier.put(("http://a.com/3", 2)))
+        self.assertTrue(frontier.put(("http://a.com/4", 0)))
+
+        self.assertEqual(frontier.evicted, 1)
+        self.assertEqual([frontier.get_nowait()[0] for _ in range(2)], ["http://a.com/4", "http://a.com/2"])
+        self.assertEqual(frontier.qsize(), 0)
+
+    def test_held_back_urls_are_readmitted(self):
+        """Test that a URL held back by the budget is queued once the URLs ahead of it fail"""
+        stored = []
+        frontier = CrawlFrontier(delay=0, budget=lambda: 2 - len(stored))
+        for number in range(3):
+            frontier.put((f"http://a.com/{number}", 1))
+        self.assertFalse(frontier.put(("http://a.com/deep", 2)))
+
+        frontier.get_nowait()
+        stored.append(1)
+        frontier.task_done()
+        self.assertEqual(frontier.qsize(), 2)
+        frontier.get_nowait()
+        frontier.task_done()
+        self.assertEqual(frontier.qsize(), 1)
+        frontier.get_nowait()
+        frontier.task_done()
+        self.assertEqual(frontier.get_nowait(), ("http://a.com/deep", 2))
+        self.assertEqual(frontier.overflowed, {})
+
+    def test_crawl_after_shallow_failures(self):
+        """Test that links held back behind failing shallow URLs are still crawled"""
+        class ShallowFailureHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/":
+                    body = "".join(f'<a href="/a{number}">a</a>' for number in range(1, 6))
+                elif self.path == "/a1":
+                    body = "".join(f'<a href="/b{number}">b</a>' for number in range(1, 6))
+                elif self.path.startswith("/b"):
+                    body = "leaf"
+                else:
+                    self.send_error(404)
+                    return
+                data = f"<html><head><title>{self.path}</title></head><body>{body}</body></html>".encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server, base_url = start_site_server(ShallowFailureHandler)
+        try:
+            results = WebCrawler([base_url], 5, 3, 1, 1, politeness_delay=0).crawl()
+        finally:
+            stop_site_server(server)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(sum(url.startswith(base_url + "/b") for url in results), 3)
+
+    @patch('requests.get')
+    def test_robots_crawl_delay(self, mock_get):
+        """Test that Crawl-delay from robots.txt slows the host down"""
+        mock_get.return_value = Mock(status_code=200, text="User-agent: *\nCrawl-delay: 3\n")
+        crawler = WebCrawler(["http://example.com"], 10, 3, 2, 5, politeness_delay=1, respect_robots=True)
+
+        crawler.apply_robots_delay("http://example.com/page")
+        crawler.apply_robots_delay("http://example.com/other")
+
+        self.assertEqual(crawler.url_queue.host_delay("example.com"), 3.0)
+        mock_get.assert_called_once_with("http://example.com/robots.txt", timeout=5)
+
+
+class TestSeenSets(unittest.TestCase):
+    """Test cases for the visited URL backends"""
+
+    def setUp(self):
+        self.urls = [f"http://example.com/page{i}" for i in range(5000)]
+
+    def test_exact_and_hashed_backends(self):
+        """Test that exact and hashed backends never report unseen URLs"""
+        for seen in (ExactSeenSet(), HashedSeenSet(capacity=10)):
+            seen.update(self.urls)
+            seen.add(self.urls[0])
+
+            self.assertEqual(len(seen), len(self.urls))
+            self.assertTrue(all(url in seen for url in self.urls))
+            self.assertFalse(any(f"http://example.com/other{i}" in seen for i in range(5000)))
+            self.assertGreater(seen.memory_usage(), 0)
+
+    def test_bloom_backend(self):
+        """Test that the Bloom backend has no false negatives and a bounded false-positive rate"""
+        seen = BloomSeenSet(capacity=5000, error_rate=0.01)
+        seen.update(self.urls)
+
+        self.assertTrue(all(url in seen for url in self.urls))
+        false_positives = sum(1 for i in range(5000) if f"http://example.com/other{i}" in seen)
+        self.assertLess(false_positives, 5000 * 0.03)
+        self.assertLess(seen.memory_usage(), ExactSeenSet(self.urls).memory_usage())
+
+    def test_crawler_seen_set_option(self):
+        """Test that the crawler uses the configured backend for validation"""
+        for kind in SEEN_SETS:
+            crawler = WebCrawler(["http://example.com"], 10, 3, 2, 5, seen_set=kind)
+            self.assertTrue(crawler.mark_visited("http://example.com/a"))
+            self.assertFalse(crawler.mark_visited("http://example.com/a"))
+            self.assertFalse(crawler.is_valid_url("http://example.com/a"))
+            self.assertTrue(crawler.is_valid_url("http://example.com/b"))
+
+        crawler = WebCrawler(["http://example.com"], 10, 3, 2, 5, seen_set='unknown')
+        self.assertIsInstance(crawler.visited_urls.stripes[0], set)
+        crawler = WebCrawler(["http://example.com"], 10, 3, 2, 5, seen_set_stripes=1)
+        self.assertIsInstance(crawler.visited_urls, set)
+
+
+class TestThreadedClasses(unittest.TestCase):
+    """Test cases for threaded classes"""
+
+    def test_find_matching_title(self):
+        """Test findMatchingTitle class"""
+        thread = findMatchingTitle(0, 10, "test")
+
+        # Test initialization
+        self.assertEqual(thread.from_id, 0)
+        self.assertEqual(thread.to_id, 10)
+        self.assertEqual(thread.wanted_word, "test")
+
+        # Test word finding
+        self.assertTrue(thread.find_word("Test Title", "test"))
+        self.assertTrue(thread.find_word("TEST TITLE", "test"))
+        self.assertTrue(thread.find_word("A test in title", "test"))
+        self.assertFalse(thread.find_word("No match here", "test"))
+
+        # Test with empty strings
+        self.assertFalse(thread.find_word("", "test"))
+        self.assertFalse(thread.find_word("Title", ""))
+
+    def test_find_matching_header(self):
+        """Test findMatchingHeader class"""
+        thread = findMatchingHeader(0, 10, "test")
+
+        # Test initialization
+        self.assertEqual(thread.from_id, 0)
+        self.assertEqual(thread.to_id, 10)
+        self.assertEqual(thread.wanted_header, "test")
+
+        # Test header finding
+        headers = ["Test Header", "Another Header"]
+        self.assertTrue(thread.find_header(headers, "test"))
+        self.assertFalse(thread.find_header(headers, "nonexistent"))
+
+        # Test with empty lists and strings
+        self.assertFalse(thread.find_header([], "test"))
+        self.assertFalse(thread.find_header(headers, ""))
+
+    def test_find_matching_title_and_header(self):
+        """Test findMatchingTitleAndHeader class"""
+        thread = findMatchingTitleAndHeader(0, 10, "test_title", "test_header")
+
+        # Test initialization
+        self.assertEqual(thread.from_id, 0)
+        self.assertEqual(thread.to_id, 10)
+        self.assertEqual(thread.wanted_title, "test_title")
+        self.assertEqual(thread.wanted_header, "test_header")
+
+
+class TestSearchSpecific(unittest.TestCase):
+    """Test cases for search_specific function"""
+
+    def test_valid_parameters(self):
+        """Test with valid parameters"""
+        with patch('threading.Thread.start'), patch('threading.Thread.join'):
+            result = search_specific(100, 4, "test", "header")
+            self.assertIsInstance(result, list)
+            self.assertEqual(len(result), 4)
+
+    def test_invalid_parameters(self):
+        """Test with invalid parameters"""
+        invalid_params = [
+            ("100", 4, "test", "header"),
+            (100, "4", "test", "header"),
+            (100, 4, 123, "header"),
+            (100, 4, "test", 123)
+        ]
+
+        for params in invalid_params:
+            with self.assertRaises(TypeError):
+                search_specific(*params)
+
+    def test_edge_cases(self):
+        """Test edge cases"""
+        test_cases = [
+            (-50, 4, "test", "header"),
+            (100, 0, "test", "header"),
+            (True, 4, "test", "header"),
+            (100, False, "test", "header")
+        ]
+
+        with patch('threading.Thread.start'), patch('threading.Thread.join'):
+            for params in test_cases:
+                result = search_specific(*params)
+                self.assertIsInstance(result, list)
+                self.assertGreater(len(result), 0)
+
+    def test_chunk_size_calculation(self):
+        """Test chunk size calculation logic"""
+        test_cases = [
+            {
+                'total_pages': 100,
+                'num_workers': 4,
+                'expected_chunk': 25
+            },
+            {
+                'total_pages': 99,  # Not evenly divisible
+                'num_workers': 4,
+                'expected_chunk': 10  # Should adjust to num_workers * 10
+            },
+            {
+                'total_pages': 10,
+                'num_workers': 2,
+                'expected_chunk': 5
+            }
+        ]
+
+        for case in test_cases:
+            with patch('threading.Thread.start'), patch('threading.Thread.join'):
+                result = search_specific(
+                    case['total_pages'],
+                    case['num_workers'],
+                    "test",
+                    "header"
+                )
+                self.assertEqual(
+                    len(result),
+                    case['num_workers']
+                )
+
+    def test_empty_strings(self):
+        """Test behavior with empty strings"""
+        with patch('threading.Thread.start'), patch('threading.Thread.join'):
+            # Empty title
+            result = search_specific(100, 4, "", "header")
+            self.assertTrue(all(isinstance(thread, findMatchingHeader) for thread in result))
+
+            # Empty header
+            result = search_specific(100, 4, "title", "")
+            self.assertTrue(all(isinstance(thread, findMatchingTitle) for thread in result))
+
+            # Both empty
+            result = search_specific(100, 4, "", "")
+            self.assertEqual(len(result), 0)
+
+
+class TestCrawlerConfig(unittest.TestCase):
+    """Test cases for CrawlerConfig class"""
+
+    def setUp(self):
+        self.valid_config = {
+            'start_urls': ["http://example.com"],
+            'max_pages': 10,
+            'max_depth': 3,
+            'max_workers': 2,
+            'timeout': 5,
+            'wanted_title': "test",
+            'wanted_header': "header"
+        }
+        self.config = CrawlerConfig(**self.valid_config)
+
+    def test_initialization(self):
+        """Test CrawlerConfig initialization"""
+        self.assertEqual(self.config.start_urls, self.valid_config['start_urls'])
+        self.assertEqual(self.config.max_pages, self.valid_config['max_pages'])
+        self.assertEqual(self.config.max_depth, self.valid_config['max_depth'])
+        self.assertEqual(self.config.max_workers, self.valid_config['max_workers'])
+        self.assertEqual(self.config.timeout, self.valid_config['timeout'])
+        self.assertEqual(self.config.wanted_title, self.valid_config['wanted_title'])
+        self.assertEqual(self.config.wanted_header, self.valid_config['wanted_header'])
+
+    def test_to_json(self):
+        """Test JSON serialization"""
+        test_file = "test_config.json"
+
+        # Test writing to JSON
+        self.config.to_json(test_file)
+
+        # Read and verify JSON content
+        with open(test_file, 'r') as file:
+            loaded_data = json.load(file)
+
+            self.assertEqual(loaded_data['start_urls'], self.valid_config['start_urls'])
+            self.assertEqual(loaded_data['max_pages'], self.valid_config['max_pages'])
+            self.assertEqual(loaded_data['max_depth'], self.valid_config['max_depth'])
+            self.assertEqual(loaded_data['max_workers'], self.valid_config['max_workers'])
+            self.assertEqual(loaded_data['timeout'], self.valid_config['timeout'])
+            self.assertEqual(loaded_data['wanted_title'], self.valid_config['wanted_title'])
+            self.assertEqual(loaded_data['wanted_header'], self.valid_config['wanted_header'])
+
+    def test_from_json(self):
+        """Test JSON deserialization"""
+        test_file = "test_config.json"
+
+        # Write test config
+        with open(test_file, 'w') as file:
+            json.dump(self.valid_config, file)
+
+        # Load and verify
+        loaded_config = CrawlerConfig.from_json(test_file)
+
+        self.assertEqual(loaded_config.start_urls, self.valid_config['start_urls'])
+        self.assertEqual(loaded_config.max_pages, self.valid_config['max_pages'])
+        self.assertEqual(loaded_config.max_depth, self.valid_config['max_depth'])
+        self.assertEqual(loaded_config.max_workers, self.valid_config['max_workers'])
+        self.assertEqual(loaded_config.timeout, self.valid_config['timeout'])
+        self.assertEqual(loaded_config.wanted_title, self.valid_config['wanted_title'])
+        self.assertEqual(loaded_config.wanted_header, self.valid_config['wanted_header'])
+
+    def test_json_error_handling(self):
+        """Test error handling in JSON operations"""
+        # Test with invalid JSON file
+        with self.assertRaises(json.JSONDecodeError):
+            CrawlerConfig.from_json("nonexistent.json")
+
+        # Test with missing required fields
+        invalid_config = {
+            'start_urls': ["http://example.com"],
+            'max_pages': 10
+            # missing other required fields
+        }
+
+        test_file = "invalid_config.json"
+        with open(test_file, 'w') as file:
+            json.dump(invalid_config, file)
+
+        with self.assertRaises(TypeError):
+            CrawlerConfig.from_json(test_file)
+
+
+class TestIntegration(unittest.TestCase):
+    """Integration tests for the complete crawler system"""
+
+    def setUp(self):
+        self.config = CrawlerConfig(
+            start_urls=["http://example.com"],
+            max_pages=10,
+            max_depth=3,
+            max_workers=2,
+            timeout=5,
+            wanted_title="test",
+            wanted_header="header"
+        )
+
+    @patch('requests.get')
+    def test_complete_workflow(self, mock_get):
+        """Test the complete workflow from configuration to crawling"""
+        # Mock responses
+        mock_responses = {
+            "http://example.com": """
+                    <html>
+                        <head><title>Test Page</title></head>
+                        <body>
+                            <h1>Welcome</h1>
+                            <h2>Subheading</h2>
+                            <a href="http://example.com/page1">Link 1</a>
+                            <a href="http://example.com/page2">Link 2</a>
+                        </body>
+                    </html>
+                """,
+            "http://example.com/page1": """
+                    <html>
+                        <head><title>Page 1</title></head>
+                        <body>
+                            <h1>Page 1</h1>
+                            <a href="http://example.com/page3">Link 3</a>
+                        </body>
+                    </html>
+                """
+        }
+
+        def mock_get_response(*args, **kwargs):
+            url = args[0]
+            response = Mock()
+            response.status_code = 200
+            response.text = mock_responses.get(url, "<html><head><title>Default</title></head></html>")
+            return response
+
+        mock_get.side_effect = mock_get_response
+
+        # Create crawler and run
+        crawler = WebCrawler(
+            start_urls=self.config.start_urls,
+            max_pages=self.config.max_pages,
+            max_depth=self.config.max_depth,
+            max_workers=self.config.max_workers,
+            timeout=self.config.timeout
+        )
+
+        results = crawler.crawl()
+
+        # Verify results
+        self.assertIn("http://example.com", results)
+        self.assertIn("http://example.com/page1", results)
+        self.assertEqual(results["http://example.com"]['title'], "Test Page")
+        self.assertEqual(len(results["http://example.com"]['headings']['h1']), 1)
+        self.assertEqual(len(results["http://example.com"]['headings']['h2']), 1)
+
+    def test_error_recovery(self):
+        """Test system's ability to handle and recover from errors"""
+        with patch('requests.get') as mock_get:
+            # Simulate various errors
+            mock_get.side_effect = [
+                requests.RequestException("Connection error"),
+                Mock(status_code=404),
+                Mock(status_code=500),
+                Mock(status_code=200, text="<html><head><title>Success</title></head></html>")
+            ]
+
+            crawler = WebCrawler(
+                start_urls=self.config.start_urls,
+                max_pages=self.config.max_pages,
+                max_depth=self.config.max_depth,
+                max_workers=self.config.max_workers,
+                timeout=self.config.timeout
+            )
+
+            results = crawler.crawl()
+
+            # Verify crawler continues despite errors
+            self.assertGreaterEqual(len(results), 0)
+
+    @patch('logging.Logger.warning')
+    @patch('logging.Logger.error')
+    def test_logging(self, mock_error, mock_warning):
+        """Test logging functionality"""
+        crawler = WebCrawler(
+            start_urls=self.config.start_urls,
+            max_pages=self.config.max_pages,
+            max_depth=self.config.max_depth,
+            max_workers=self.config.max_workers,
+            timeout=self.config.timeout
+        )
+
+        with patch('requests.get') as mock_get:
+            # Trigger warning
+            mock_get.side_effect = requests.RequestException("Test error")
+            crawler.crawl()
+
+            # Verify logging calls
+            mock_warning.assert_called()
+            self.assertIn("Request failed", str(mock_warning.call_args))
+
+
+class TestCrawlState(unittest.TestCase):
+    """Test cases for the persistent, resumable crawl state"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "state.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_state_round_trip(self):
+        """Test that finished URLs leave the frontier and results are stored"""
+        state = CrawlState(self.state_file)
+        self.assertTrue(state.is_empty())
+        state.add_urls([("http://a.com/", 0), ("http://a.com/x", 1), ("http://a.com/y", 1)])
+        state.save_result("http://a.com/", {'id': 0, 'url': "http://a.com/", 'title': "A"})
+        state.complete_url("http://a.com/")
+        state.close()
+
+        pending, visited, stored = CrawlState(self.state_file).load()
+        self.assertEqual(pending, [("http://a.com/x", 1), ("http://a.com/y", 1)])
+        self.assertEqual(visited, {"http://a.com/"})
+        self.assertEqual(stored["http://a.com/"]['title'], "A")
+
+    def test_store_page_is_one_transaction(self):
+        """Test that a page's result, links and completion are committed together"""
+        state = CrawlState(self.state_file, commit_every=3, commit_interval=1000)
+        state.add_urls([("http://a.com/", 0)])
+        state.checkpoint()
+        state.store_page("http://a.com/", {'id': 0, 'url': "http://a.com/", 'title': "A"},
+                         [("http://a.com/x", 1), ("http://a.com/y", 1)])
+        reader = CrawlState(self.state_file)
+        self.assertEqual(reader.load()[1], {"http://a.com/"})
+
+        state.store_page("http://a.com/x", {'id': 1, 'url': "http://a.com/x", 'title': "X"}, [])
+        state.save_result("http://a.com/z", {'id': 2, 'url': "http://a.com/z", 'title': "Z"})
+        pending, visited, stored = reader.load()
+        self.assertEqual(pending, [("http://a.com/y", 1)])
+        self.assertEqual(visited, {"http://a.com/", "http://a.com/x"})
+        self.assertEqual(set(stored), {"http://a.com/", "http://a.com/x"})
+        state.close()
+        reader.close()
+
+    def test_resume_does_not_refetch(self):
+        """Test that a resumed crawl continues without fetching completed pages again"""
+        SiteHandler.hits.clear()
+        start_url = self.base_url + "/"
+        first = WebCrawler([start_url], 3, 5, 2, 1, politeness_delay=0, state_file=self.state_file)
+        first_results = dict(first.crawl())
+        self.assertGreaterEqual(len(first_results), 3)
+        first.state.close()
+
+        resumed = WebCrawler([start_url], 20, 5, 2, 1, politeness_delay=0, state_file=self.state_file, resume=True)
+        self.assertEqual(resumed.total_pages_crawled, len(first_results))
+        results = resumed.crawl()
+        resumed.state.close()
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[start_url]['title'], first_results[start_url]['title'])
+        self.assertTrue(all(count == 1 for count in SiteHandler.hits.values()), SiteHandler.hits)
+
+    def test_resume_appends_to_sinks(self):
+        """Test that a resumed crawl keeps the records the interrupted run wrote"""
+        jsonl_file = os.path.join(self.directory.name, "out.jsonl")
+        csv_file = os.path.join(self.directory.name, "out.csv")
+        start_url = self.base_url + "/"
+        first = WebCrawler([start_url], 3, 5, 2, 1, politeness_delay=0, state_file=self.state_file,
+                           sinks=[make_sink(jsonl_file), make_sink(csv_file)])
+        first.crawl()
+        first.state.close()
+
+        resumed = WebCrawler([start_url], 20, 5, 2, 1, politeness_delay=0, state_file=self.state_file, resume=True,
+                             sinks=[make_sink(jsonl_file), make_sink(csv_file)])
+        resumed.crawl()
+        resumed.state.close()
+
+        with open(jsonl_file, encoding='utf-8') as file:
+            urls = [json.loads(line)['url'] for line in file]
+        self.assertEqual(len(urls), 6)
+        self.assertEqual(len(set(urls)), 6)
+        with open(csv_file, encoding='utf-8', newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], CsvSink.COLUMNS)
+        self.assertEqual(len(rows), 7)
+
+
+class TestHttpCache(unittest.TestCase):
+    """Test cases for the conditional GET cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.directory.name, "cache.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lru_eviction(self):
+        """Test validators, conditional headers and LRU eviction past the size cap"""
+        cache = HttpCache(self.cache_file, max_bytes=600)
+        for i in range(3):
+            cache.store(f"http://a.com/{i}", {'ETag': f'"{i}"'}, "hash", {'url': f"http://a.com/{i}", 'title': "x" * 100},
+                        ["http://a.com/"])
+            time.sleep(0.01)
+        cache.lookup("http://a.com/0")
+        cache.store("http://a.com/3", {'Last-Modified': "Mon, 01 Jan 2024 00:00:00 GMT"}, "hash",
+                    {'url': "http://a.com/3", 'title': "x" * 100}, [])
+
+        self.assertIsNone(cache.lookup("http://a.com/1"))
+        self.assertEqual(HttpCache.conditional_headers(cache.lookup("http://a.com/0")), {'If-None-Match': '"0"'})
+        self.assertEqual(HttpCache.conditional_headers(cache.lookup("http://a.com/3")),
+                         {'If-Modified-Since': "Mon, 01 Jan 2024 00:00:00 GMT"})
+        self.assertLessEqual(cache.total_size, 600)
+        cache.close()
+
+    def test_recrawl_uses_not_modified(self):
+        """Test that a re-crawl reuses stored page info and links on 304 responses"""
+        crawler_classes = [WebCrawler, AsyncWebCrawler] if AIOHTTP_AVAILABLE else [WebCrawler]
+        for crawler_class in crawler_classes:
+            if os.path.exists(self.cache_file):
+                os.remove(self.cache_file)
+            first = crawler_class([self.base_url], 20, 5, 2, 1, politeness_delay=0, cache_file=self.cache_file)
+            first_results = first.crawl()
+            self.assertEqual((first.cache.hits, first.cache.misses), (0, 6))
+            first.cache.close()
+
+            SiteHandler.not_modified = 0
+            second = crawler_class([self.base_url], 20, 5, 2, 1, politeness_delay=0, cache_file=self.cache_file)
+            results = second.crawl()
+            second.cache.close()
+
+            self.assertEqual((second.cache.hits, second.cache.misses), (6, 0))
+            self.assertEqual(SiteHandler.not_modified, 6)
+            self.assertEqual(set(results), set(first_results))
+            for url, data in results.items():
+                self.assertEqual(data['title'], first_results[url]['title'])
+                self.assertEqual(data['links_count'], first_results[url]['links_count'])
+
+
+class TestResultSinks(unittest.TestCase):
+    """Test cases for streaming result sinks and iter_results"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_make_sink(self):
+        """Test that the sink format follows the option or the file extension"""
+        self.assertIsInstance(make_sink("out.jsonl"), JsonLinesSink)
+        self.assertIsInstance(make_sink("out.csv"), CsvSink)
+        self.assertIsInstance(make_sink("out.db"), SqliteSink)
+        self.assertIsInstance(make_sink("out.txt", "csv"), CsvSink)
+        with self.assertRaises(ValueError):
+            make_sink("out.txt")
+
+    def test_sinks_receive_every_page(self):
+        """Test that every built-in sink gets each page-info record"""
+        paths = [os.path.join(self.directory.name, name) for name in ("out.jsonl", "out.csv", "out.db")]
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0,
+                             sinks=[make_sink(path) for path in paths], keep_results=False)
+        crawler.crawl()
+        self.assertEqual(crawler.crawl_results, {})
+
+        with open(paths[0], encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(len(records), 6)
+        self.assertIn("Home", [record['title'] for record in records])
+
+        with open(paths[1], encoding='utf-8', newline='') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual({row['url'] for row in rows}, {record['url'] for record in records})
+
+        connection = sqlite3.connect(paths[2])
+        self.assertEqual(connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0], 6)
+        connection.close()
+
+    def test_failing_sink(self):
+        """Test that a failing sink stops the crawl, raises from crawl() and never blocks a worker"""
+        class FailingSink(ResultSink):
+            def write_batch(self, records):
+                raise OSError("disk full")
+
+        writer = SinkWriter(FailingSink(), batch_size=1, flush_interval=0.01, queue_size=2)
+        writer.start()
+        self.assertTrue(writer.write({'url': "http://example.com/"}))
+        writer.join(timeout=5)
+        for _ in range(5):
+            self.assertFalse(writer.write({'url': "http://example.com/"}))
+        writer.close()
+        self.assertIsInstance(writer.error, OSError)
+
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0.2, sinks=[FailingSink()])
+        with self.assertRaises(OSError):
+            crawler.crawl()
+        self.assertTrue(crawler.stop_requested)
+
+    def test_iter_results(self):
+        """Test that records are yielded while the crawl runs and early exit stops it"""
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0)
+        titles = [record['title'] for record in crawler.iter_results()]
+        self.assertEqual(sorted(titles), ["A", "B", "C", "D", "E", "Home"])
+
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0.2)
+        for record in crawler.iter_results():
+            break
+        self.assertTrue(crawler.stop_requested)
+        self.assertLess(crawler.total_pages_crawled, 6)
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for the inverted title and heading index"""
+
+    def setUp(self):
+        self.index = SearchIndex()
+        pages = [("Python News", ["Release notes"], ["Snakes"]),
+                 ("Weather today", ["Sunny Python Valley"], []),
+                 ("python tips", [], ["Debugging tricks"]),
+                 ("Cooking", ["Pasta"], ["Python-free recipes"])]
+        for page_id, (title, h1, h2) in enumerate(pages):
+            self.index.add({'id': page_id, 'url': f"http://example.com/{page_id}", 'title': title,
+                            'headings': {'h1': h1, 'h2': h2}})
+
+    def test_title_header_and_combined_queries(self):
+        """Test that substring queries match the linear scan, case-insensitively"""
+        self.assertEqual([match[0] for match in self.index.search(title="PYTHON")], [0, 2])
+        self.assertEqual([match[0] for match in self.index.search(header="python")], [1, 3])
+        self.assertEqual([match[0] for match in self.index.search(title="py", header="")], [0, 2])
+        self.assertEqual([match[0] for match in self.index.search(title="cook", header="free rec")], [3])
+        self.assertEqual(self.index.search(title="python", header="pasta"), [])
+        self.assertEqual(self.index.search(), [])
+        self.assertEqual(self.index.search(title="tips")[0], (2, "http://example.com/2", "python tips"))
+
+    def test_whole_words(self):
+        """Test that whole-word queries use the token index"""
+        self.assertEqual([match[0] for match in self.index.search(title="new", whole_words=True)], [])
+        self.assertEqual([match[0] for match in self.index.search(title="news python", whole_words=True)], [0])
+
+    def test_ids_out_of_order(self):
+        """Test that matches are ordered by id when pages were added out of id order"""
+        self.assertTrue(self.index.in_order)
+        self.index.add({'id': None, 'url': "http://example.com/none", 'title': "Python without id"})
+        self.index.add({'id': -1, 'url': "http://example.com/first", 'title': "Python first"})
+        self.assertFalse(self.index.in_order)
+        self.assertEqual([match[0] for match in self.index.search(title="python")], [-1, 0, 2, None])
+
+    def test_whole_words_intersect_postings(self):
+        """Test that whole-word queries intersect the word posting lists and stop once none are left"""
+        self.assertEqual(SearchIndex._intersect([[0, 2, 5, 7], [1, 2, 3, 7, 9], [2, 7, 8]]), [2, 7])
+        self.assertEqual(SearchIndex._intersect([[0, 1], [], [0, 1, 2]]), [])
+        self.assertEqual([match[0] for match in self.index.search(header="python sunny", whole_words=True)], [1])
+        self.assertEqual([match[0] for match in self.index.search(title="python", header="python",
+                                                                  whole_words=True)], [])
+        self.assertEqual([match[0] for match in self.index.search(title="!!", whole_words=True)], [0, 1, 2, 3])
+
+    def test_page_added_again_replaces_its_entry(self):
+        """Test that adding a page with a known URL replaces its document instead of adding a second one"""
+        self.index.add({'id': 1, 'url': "http://example.com/1", 'title': "Rainy today",
+                        'headings': {'h1': ["Sunny Python Valley"], 'h2': []}})
+        self.assertEqual(len(self.index), 4)
+        self.assertTrue(self.index.in_order)
+        self.assertEqual(self.index.search(title="weather"), [])
+        self.assertEqual(self.index.search(title="today"), [(1, "http://example.com/1", "Rainy today")])
+        self.assertEqual([match[0] for match in self.index.search(title="rainy", whole_words=True)], [1])
+        self.assertEqual([match[0] for match in self.index.search(header="python")], [1, 3])
+        self.index.add({'id': 0, 'url': "http://example.com/0", 'title': "Rainy news"})
+        self.assertEqual([match[0] for match in self.index.search(title="rainy", whole_words=True)], [0, 1])
+        self.assertEqual(self.index.search(header="snakes"), [])
+
+    def test_save_and_load(self):
+        """Test that a saved index answers the same queries after loading"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "out.jsonl.index.json")
+            self.index.save(path)
+            loaded = SearchIndex.load(path)
+        self.assertEqual(len(loaded), 4)
+        self.assertEqual(loaded.search(title="python"), self.index.search(title="python"))
+        self.assertEqual(loaded.search(header="snake"), self.index.search(header="snake"))
+        self.assertEqual(loaded.search(title="news python", whole_words=True), [(0, "http://example.com/0", "Python News")])
+        self.assertTrue(loaded.in_order)
+
+    def test_index_is_opt_in(self):
+        """Test that the index is only built when asked for and results are kept"""
+        self.assertIsNone(WebCrawler(["http://example.com"], 10, 3, 2, 5).search_index)
+        self.assertIsNotNone(WebCrawler(["http://example.com"], 10, 3, 2, 5, search_index=True).search_index)
+        self.assertIsNone(WebCrawler(["http://example.com"], 10, 3, 2, 5, search_index=True,
+                                     keep_results=False).search_index)
+        config = CrawlerConfig(["http://example.com"], 10, 3, 2, 5, "", "", search_index=True)
+        self.assertIsNone(build_crawler(config).search_index)
+        config.wanted_title = "python"
+        self.assertIsNotNone(build_crawler(config).search_index)
+
+    def test_search_specific_with_index(self):
+        """Test that search_specific answers from the index when given one"""
+        with patch('builtins.print') as mock_print:
+            matches = search_specific(100, 4, "python", "", index=self.index)
+        self.assertEqual([match[0] for match in matches], [0, 2])
+        self.assertEqual(mock_print.call_count, 2)
+
+    def test_crawler_builds_and_saves_index(self):
+        """Test that the crawler indexes pages as they are stored and saves the index"""
+        server, base_url = start_site_server()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "index.json")
+                crawler = WebCrawler([base_url], 20, 5, 2, 1, politeness_delay=0, search_index=True, index_file=path)
+                crawler.crawl()
+                self.assertEqual(len(crawler.search_index), 6)
+                self.assertEqual([match[1] for match in crawler.search_index.search(header="page a")],
+                                 [base_url + "/a"])
+                self.assertEqual(len(SearchIndex.load(path)), 6)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestShardedSearch(unittest.TestCase):
+    """Test cases for the sharded batch search over crawl results"""
+
+    def setUp(self):
+        titles = ["Python News", "Weather", "python tips", "Cooking", "Sport", "Pythonic code", "Music"]
+        self.results = {}
+        # Insertion order differs from id order on purpose
+        for page_id in [3, 0, 6, 1, 5, 2, 4]:
+            url = f"http://example.com/{page_id}"
+            self.results[url] = {'id': page_id, 'url': url, 'title': titles[page_id],
+                                 'headings': {'h1': [f"Heading {page_id}"], 'h2': ["Python" if page_id % 2 else "Other"]}}
+
+    def test_matches_in_id_order(self):
+        """Test that matches from every shard are merged in id order"""
+        for num_shards in (1, 3, 7, 20):
+            search = ShardedSearch(self.results, num_shards)
+            self.assertEqual(len(search), 7)
+            self.assertEqual([match[0] for match in search.search("python")], [0, 2, 5])
+            self.assertEqual([match[0] for match in search.search("", "python")], [1, 3, 5])
+            self.assertEqual([match[0] for match in search.search("PYTHON", "python")], [5])
+            self.assertEqual(search.search(), [])
+
+    def test_query_does_not_span_texts(self):
+        """Test that a query cannot match across two titles or two headings"""
+        search = ShardedSearch(self.results, 2)
+        self.assertEqual(search.search("newsweather"), [])
+        self.assertEqual(search.search("", "0python"), [])
+        self.assertEqual([match[0] for match in search.search("", "heading 4")], [4])
+
+    def test_process_pool_matches_in_process(self):
+        """Test that the process pool returns the same matches as the in-process search"""
+        search = ShardedSearch(self.results, 3, workers=2)
+        try:
+            self.assertEqual(len(search.pools), 2)
+            self.assertEqual(search.search("o"), ShardedSearch(self.results, 1).search("o"))
+            # The first process holds shards 0 and 1 (ids 0 to 5) and the second only shard 2 (id 6)
+            owned = [pool.submit(_match_loaded_shards, "", "heading").result() for pool in search.pools]
+            self.assertEqual([[match[0] for match in part] for part in owned], [[0, 1, 2, 3, 4, 5], [6]])
+        finally:
+            search.close()
+
+    def test_search_specific_with_shards(self):
+        """Test that search_specific accepts a ShardedSearch"""
+        with patch('builtins.print'):
+            matches = search_specific(100, 4, "python", "", index=ShardedSearch(self.results, 4))
+        self.assertEqual([match[2] for match in matches], ["Python News", "python tips", "Pythonic code"])
+
+
+class TestResultStore(unittest.TestCase):
+    """Test cases for the columnar crawl results store"""
+
+    def setUp(self):
+        self.pages = {
+            "http://example.com": {'id': 0, 'url': "http://example.com", 'title': "Home",
+                                   'headings': {'h1': ["Home"], 'h2': []}, 'text_length': 120, 'links_count': 2},
+            "http://example.com/a": {'id': 1, 'url': "http://example.com/a", 'title': None,
+                                     'headings': {'h1': [], 'h2': ["Home"]}, 'text_length': 0, 'links_count': 0},
+            "http://other.com/b": {'url': "http://other.com/b", 'error': "404 Client Error"},
+            "http://other.com/c": {'id': 3, 'url': "http://other.com/c", 'title': "C", 'simhash': 12345},
+        }
+
+    def test_records_read_back_equal(self):
+        """Test that every record reads back equal to the stored dict"""
+        store = ResultStore(self.pages)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store, self.pages)
+        self.assertEqual(list(store), list(self.pages))
+        for url, page_info in self.pages.items():
+            record = store[url]
+            self.assertIsInstance(record, PageRecord)
+            self.assertEqual(record, page_info)
+            self.assertEqual(list(record), list(page_info))
+        self.assertEqual(store["http://other.com/b"].get('id'), None)
+        self.assertIn('error', store["http://other.com/b"])
+        self.assertEqual(store["http://example.com"].get('headings', {}).get('h1', []), ["Home"])
+        self.assertEqual(json.loads(json.dumps(dict(store["http://other.com/c"]))), self.pages["http://other.com/c"])
+
+    def test_interned_hosts_and_strings(self):
+        """Test that hosts get ids and repeated heading strings are shared"""
+        store = ResultStore(self.pages)
+        self.assertEqual(store.hosts, ["example.com", "other.com"])
+        self.assertEqual(store.host_of("http://other.com/c"), "other.com")
+        self.assertIs(store.headings[0][0][0], store.headings[1][1][0])
+
+    def test_overwrite_and_delete(self):
+        """Test that a stored URL can be replaced and removed"""
+        store = ResultStore(self.pages)
+        store["http://example.com"] = {'id': 9, 'url': "http://example.com", 'title': "New"}
+        self.assertEqual(dict(store["http://example.com"]), {'id': 9, 'url': "http://example.com", 'title': "New"})
+        del store["http://other.com/b"]
+        self.assertEqual(len(store), 3)
+        self.assertNotIn("http://other.com/b", store)
+
+    def test_crawler_compact_results(self):
+        """Test that a crawl with compact_results returns the same pages"""
+        server, base_url = start_site_server()
+        try:
+            crawler = WebCrawler([base_url], 20, 5, 2, 1, politeness_delay=0, compact_results=True)
+            results = crawler.crawl()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIsInstance(results, ResultStore)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[base_url]['title'], "Home")
+        self.assertEqual(results[base_url + "/a"]['headings'], {'h1': [], 'h2': ["Page A"]})
+        self.assertTrue(all(isinstance(page_info['id'], int) for page_info in results.values()))
+
+
+class TestLinkGraph(unittest.TestCase):
+    """Test cases for link graph capture, export and ranking"""
+
+    def setUp(self):
+        self.graph = LinkGraph()
+        self.graph.add_page("http://x/a", ["http://x/b", "http://x/c"])
+        self.graph.add_page("http://x/b", ["http://x/c"])
+        self.graph.add_page("http://x/c", ["http://x/a"])
+        self.graph.add_page("http://x/d", ["http://x/c", "http://x/e"])
+
+    def test_csr_layout(self):
+        """Test that pages become CSR rows keyed by URL ids"""
+        self.assertEqual(self.graph.urls, ["http://x/a", "http://x/b", "http://x/c", "http://x/d", "http://x/e"])
+        self.assertEqual(list(self.graph.sources), [0, 1, 2, 3])
+        self.assertEqual(list(self.graph.offsets), [0, 2, 3, 4, 6])
+        self.assertEqual(list(self.graph.targets), [1, 2, 2, 0, 2, 4])
+        self.assertEqual(list(self.graph.iter_edges()), [(0, 1), (0, 2), (1, 2), (2, 0), (3, 2), (3, 4)])
+        self.assertEqual((self.graph.node_count, self.graph.edge_count), (5, 6))
+
+    def test_in_degree_and_pagerank(self):
+        """Test in-degree and PageRank with and without numpy"""
+        backends = [False, True] if NUMPY_AVAILABLE else [False]
+        ranks = []
+        for use_numpy in backends:
+            with patch('MyWebCrowler.NUMPY_AVAILABLE', use_numpy):
+                self.assertEqual(list(self.graph.in_degree()), [1, 1, 3, 0, 1])
+                rank = list(self.graph.pagerank())
+            self.assertAlmostEqual(sum(rank), 1.0, places=6)
+            self.assertEqual(self.graph.top(rank, 1)[0][0], "http://x/c")
+            ranks.append(rank)
+        for rank in ranks[1:]:
+            for expected, value in zip(ranks[0], rank):
+                self.assertAlmostEqual(expected, value, places=9)
+
+    def test_export_and_load(self):
+        """Test the edge-list export and the binary round trip"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "graph.tsv")
+            self.graph.export(path)
+            with open(path, encoding='utf-8') as file:
+                lines = file.read().splitlines()
+            self.assertEqual(len(lines), 6)
+            self.assertEqual(lines[0], "http://x/a\thttp://x/b")
+
+            path = os.path.join(directory, "graph.bin")
+            self.graph.export(path)
+            loaded = LinkGraph.load_binary(path)
+            with self.assertRaises(ValueError):
+                LinkGraph.load_binary(os.path.join(directory, "graph.tsv"))
+        self.assertEqual(loaded.urls, self.graph.urls)
+        self.assertEqual(list(loaded.iter_edges()), list(self.graph.iter_edges()))
+        self.assertEqual(loaded.url_ids["http://x/e"], 4)
+
+    def test_crawler_records_graph(self):
+        """Test that a crawl records links to visited and failed pages too"""
+        server, base_url = start_site_server()
+        try:
+            crawler = WebCrawler([base_url], 20, 5, 2, 1, politeness_delay=0, record_link_graph=True)
+            crawler.crawl()
+        finally:
+            server.shutdown()
+            server.server_close()
+        graph = crawler.link_graph
+        self.assertEqual(len(graph.sources), 6)
+        self.assertEqual(graph.node_count, 7)
+        edges = {(graph.urls[source], graph.urls[target]) for source, target in graph.iter_edges()}
+        self.assertIn((base_url + "/a", base_url + "/"), edges)
+        self.assertIn((base_url + "/b", base_url + "/missing"), edges)
+        self.assertEqual(len(edges), 7)
+
+
+class TestRobotsAndSitemaps(unittest.TestCase):
+    """Test cases for the robots.txt cache and sitemap ingestion"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @patch('requests.get')
+    def test_robots_ttl(self, mock_get):
+        """Test that robots.txt is fetched once per host until the TTL expires"""
+        mock_get.return_value = Mock(status_code=200, text="User-agent: *\nDisallow: /private\n")
+        robots = RobotsCache(5)
+        self.assertFalse(robots.can_fetch("http://example.com/private/page"))
+        self.assertTrue(robots.can_fetch("http://example.com/public"))
+        self.assertEqual(mock_get.call_count, 1)
+
+        robots = RobotsCache(5, ttl=0)
+        robots.can_fetch("http://example.com/a")
+        robots.can_fetch("http://example.com/b")
+        self.assertEqual(mock_get.call_count, 3)
+
+        mock_get.return_value = Mock(status_code=403, text="")
+        self.assertFalse(RobotsCache(5).can_fetch("http://example.com/public"))
+        mock_get.return_value = Mock(status_code=404, text="")
+        self.assertTrue(RobotsCache(5).can_fetch("http://example.com/public"))
+
+    @patch('requests.get')
+    def test_unreachable_robots_disallows_until_retry(self, mock_get):
+        """Test that a 5xx or failed robots.txt fetch disallows the host until it is tried again"""
+        robots = RobotsCache(5, ttl=0, retry_interval=60)
+        mock_get.side_effect = requests.Timeout()
+        self.assertFalse(robots.can_fetch("http://example.com/public"))
+        mock_get.side_effect = None
+        mock_get.return_value = Mock(status_code=503, text="")
+        self.assertFalse(robots.can_fetch("http://b.com/public"))
+        self.assertFalse(robots.can_fetch("http://b.com/other"))
+        self.assertEqual(mock_get.call_count, 2)
+
+        # Once robots.txt was read, an outage keeps the last rules instead
+        robots = RobotsCache(5, ttl=0, retry_interval=60)
+        mock_get.return_value = Mock(status_code=200, text="User-agent: *\nDisallow: /private\n")
+        self.assertTrue(robots.can_fetch("http://example.com/public"))
+        mock_get.return_value = Mock(status_code=500, text="")
+        self.assertTrue(robots.can_fetch("http://example.com/public"))
+        self.assertFalse(robots.can_fetch("http://example.com/private/x"))
+        self.assertEqual(mock_get.call_count, 4)
+
+    def test_enqueue_checks_robots(self):
+        """Test that disallowed links never reach the frontier"""
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0, respect_robots=True)
+        accepted = crawler.enqueue_links([self.base_url + "/private/x", self.base_url + "/a"], 1)
+        self.assertEqual(accepted, [self.base_url + "/a"])
+        self.assertEqual(crawler.robots_blocked, 1)
+
+    def test_parse_lastmod(self):
+        """Test W3C datetime parsing of lastmod"""
+        self.assertEqual(parse_lastmod("2025-06-01T10:00:00Z"), 1748772000.0)
+        self.assertEqual(parse_lastmod("1970-01-02"), 86400.0)
+        self.assertEqual(parse_lastmod(None), 0.0)
+        self.assertEqual(parse_lastmod("yesterday"), 0.0)
+
+    def test_iter_sitemap(self):
+        """Test that sitemap indexes and url sets are streamed as entries"""
+        entries = list(iter_sitemap(self.base_url + "/sitemap_index.xml", 1))
+        self.assertEqual(entries, [('sitemap', self.base_url + "/sitemap-news.xml", 0.0)])
+        entries = list(iter_sitemap(self.base_url + "/sitemap-news.xml", 1))
+        self.assertEqual([entry[1] for entry in entries][:3],
+                         [self.base_url + "/news/old", self.base_url + "/news/undated", self.base_url + "/news/fresh"])
+        self.assertEqual(list(iter_sitemap(self.base_url + "/missing.xml", 1)), [])
+
+    def test_sitemap_urls_prioritised_by_lastmod(self):
+        """Test that sitemap URLs are queued freshest first, without disallowed or foreign URLs"""
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0, respect_robots=True, use_sitemaps=True)
+        crawler.ingest_sitemaps()
+        order = [crawler.url_queue.get_nowait()[0] for _ in range(crawler.url_queue.qsize())]
+        self.assertEqual(order, [self.base_url, self.base_url + "/news/fresh", self.base_url + "/news/old",
+                                 self.base_url + "/news/undated"])
+        self.assertEqual(crawler.sitemap_urls_queued, 3)
+
+    def test_crawl_with_sitemaps(self):
+        """Test that a crawl reaches sitemap pages and skips disallowed ones"""
+        crawler = WebCrawler([self.base_url], 20, 5, 2, 1, politeness_delay=0, respect_robots=True, use_sitemaps=True)
+        results = crawler.crawl()
+        self.assertIn(self.base_url + "/news/fresh", results)
+        self.assertNotIn(self.base_url + "/private/secret", results)
+        self.assertEqual(len(results), 9)
+
+
+class DownloadHandler(BaseHTTPRequestHandler):
+    """Serves pages that streaming downloads should keep or drop"""
+    pages = {
+        "/": ("text/html", '<html><head><title>Index</title></head><body><a href="/file.bin">F</a>'
+                           '<a href="/big">B</a><a href="/declared">D</a><a href="/page">P</a></body></html>', True),
+        "/file.bin": ("application/octet-stream", "x" * 100000, True),
+        "/big": ("text/html; charset=utf-8", "<html><body>" + "<p>text</p>" * 30000 + "</body></html>", False),
+        "/declared": ("text/html", "<html><body>" + "y" * 200000 + "</body></html>", True),
+        "/page": ("text/html; charset=utf-8", "<html><head><title>Čeština</title></head><body><h1>Žluťoučký</h1></body></html>", True),
+    }
+
+    def do_GET(self):
+        content_type, body, send_length = self.pages[self.path]
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if send_length:
+            self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestStreamingDownloads(unittest.TestCase):
+    """Test cases for streaming, size-capped downloads"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server(DownloadHandler)
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_site_server(cls.server)
+
+    def check_crawl(self, crawler):
+        results = crawler.crawl()
+        self.assertEqual(sorted(results), [self.base_url, self.base_url + "/page"])
+        self.assertEqual(results[self.base_url + "/page"]['title'], "Čeština")
+        self.assertEqual(results[self.base_url + "/page"]['headings']['h1'], ["Žluťoučký"])
+        stats = crawler.download_stats
+        self.assertEqual(stats.pages, 2)
+        self.assertEqual(stats.aborts, {'content-type': 1, 'too large': 2})
+        self.assertGreaterEqual(stats.bytes_saved, 300000)
+        self.assertLess(stats.bytes_read, 300000)
+
+    def test_stream_parser(self):
+        """Test that the stream parser is fed while non-HTML and oversized pages are dropped"""
+        for parser in ('stream', 'html.parser'):
+            crawler = WebCrawler([self.base_url], 20, 3, 2, 1, parser=parser, politeness_delay=0,
+                                 stream_downloads=True, max_page_bytes=100000)
+            self.check_crawl(crawler)
+
+    @unittest.skipUnless(AIOHTTP_AVAILABLE, "aiohttp is not installed")
+    def test_async_engine(self):
+        """Test that the async engine applies the same checks"""
+        crawler = AsyncWebCrawler([self.base_url], 20, 3, 2, 1, politeness_delay=0,
+                                  stream_downloads=True, max_page_bytes=100000)
+        self.check_crawl(crawler)
+
+    def test_content_hash_matches_text(self):
+        """Test that a streamed page hashes the same as its decoded text"""
+        with tempfile.TemporaryDirectory() as directory:
+            crawler = WebCrawler([self.base_url + "/page"], 5, 1, 1, 1, politeness_delay=0, stream_downloads=True,
+                                 cache_file=os.path.join(directory, "cache.db"))
+            crawler.crawl()
+            body = DownloadHandler.pages["/page"][1]
+            self.assertEqual(crawler.cache.lookup(self.base_url + "/page")['content_hash'], crawler.content_hash(body))
+            crawler.cache.close()
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for the metrics registry, endpoint and crawl instrumentation"""
+
+    def test_histogram_quantiles(self):
+        """Test that quantiles report the upper bound of the matching bucket"""
+        histogram = Histogram()
+        for value in [0.0004] * 50 + [0.02] * 49 + [40]:
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.quantile(0.5), 0.0005)
+        self.assertEqual(histogram.quantile(0.99), 0.025)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+        self.assertEqual(Histogram().quantile(0.5), 0.0)
+
+    def test_render_prometheus_text(self):
+        """Test the Prometheus text format of counters, histograms and gauges"""
+        registry = MetricsRegistry(max_hosts=1)
+        registry.inc('pages')
+        registry.inc('pages')
+        registry.inc_host('host_pages', 'a.com')
+        registry.inc_host('host_pages', 'b.com')
+        registry.inc('errors', label='kind', value='Bad "quote"')
+        registry.observe('parse', 0.003)
+        registry.gauge('queue_depth', lambda: 7)
+        text = registry.render()
+        self.assertIn("# TYPE crawler_pages_total counter\ncrawler_pages_total 2\n", text)
+        self.assertIn('crawler_host_pages_total{host="a.com"} 1', text)
+        self.assertIn('crawler_host_pages_total{host="other"} 1', text)
+        self.assertIn('crawler_errors_total{kind="Bad \\"quote\\""} 1', text)
+        self.assertIn('crawler_stage_seconds_bucket{stage="parse",le="0.0025"} 0', text)
+        self.assertIn('crawler_stage_seconds_bucket{stage="parse",le="0.005"} 1', text)
+        self.assertIn('crawler_stage_seconds_bucket{stage="parse",le="+Inf"} 1', text)
+        self.assertIn('crawler_stage_seconds_count{stage="parse"} 1', text)
+        self.assertIn("crawler_queue_depth 7", text)
+        self.assertEqual(registry.total('host_pages'), 2)
+
+    def test_metrics_server(self):
+        """Test that the endpoint serves the registry on /metrics only"""
+        registry = MetricsRegistry()
+        registry.inc('pages', 3)
+        server = MetricsServer(registry, 0)
+        server.start()
+        try:
+            response = requests.get(f"http://127.0.0.1:{server.port}/metrics", timeout=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("crawler_pages_total 3", response.text)
+            self.assertEqual(requests.get(f"http://127.0.0.1:{server.port}/", timeout=5).status_code, 404)
+        finally:
+            server.stop()
+
+    def test_crawl_is_instrumented(self):
+        """Test that a crawl records stages, counters and the summary line"""
+        server, base_url = start_site_server()
+        try:
+            crawler = WebCrawler([base_url], 20, 5, 2, 1, politeness_delay=0, metrics_port=0, metrics_interval=0.05)
+            with self.assertLogs('MyWebCrowler', level='INFO') as logs:
+                crawler.crawl()
+        finally:
+            server.shutdown()
+            server.server_close()
+        metrics = crawler.metrics
+        self.assertEqual(metrics.total('pages'), 6)
+        self.assertEqual(metrics.counters[('responses', 'status', 404)], 1)
+        self.assertEqual(metrics.counters[('host_pages', 'host', base_url[len("http://"):])], 6)
+        self.assertGreater(metrics.total('bytes'), 0)
+        for stage in ('queue_wait', 'ttfb', 'download', 'parse', 'lock_page_count', 'lock_results'):
+            self.assertIn(stage, metrics.histograms)
+        self.assertEqual(metrics.histograms['ttfb'].count, 7)
+        self.assertIsNone(crawler.metrics_server)
+        self.assertTrue(any("Metrics at http://127.0.0.1:" in line for line in logs.output))
+        self.assertTrue(any("Metrics: " in line and "pages (" in line for line in logs.output))
+
+
+class ThrottleHandler(BaseHTTPRequestHandler):
+    """Answers 429 while more than two requests are in flight, like a rate-limited server"""
+    lock = threading.Lock()
+    in_flight = 0
+    throttled = 0
+
+    def do_GET(self):
+        with ThrottleHandler.lock:
+            ThrottleHandler.in_flight += 1
+            busy = ThrottleHandler.in_flight > 2
+            if busy:
+                ThrottleHandler.throttled += 1
+        try:
+            time.sleep(0.05)
+            if busy:
+                self.send_response(429)
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            number = int(self.path.strip('/') or 0)
+            links = "".join(f'<a href="/{(number * 3 + j) % 40}">L</a>' for j in range(1, 4))
+            data = f"<html><head><title>Page {number}</title></head><body>{links}</body></html>".encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with ThrottleHandler.lock:
+                ThrottleHandler.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    """Test cases for AIMD fetch concurrency"""
+
+    def run_window(self, limiter, host="a.com", latency=0.01, status=200):
+        # Fills every free slot, then completes all of them
+        acquired = 0
+        while limiter.try_acquire(host):
+            acquired += 1
+        for _ in range(acquired):
+            limiter.release(host, latency, status)
+        return acquired
+
+    def test_slow_start_then_additive_increase(self):
+        """Test that the limit doubles until a 429, halves once, then grows by one per window"""
+        limiter = AdaptiveConcurrency(16, host_ceiling=16)
+        self.assertEqual([self.run_window(limiter) for _ in range(5)], [1, 2, 4, 8, 16])
+        self.assertEqual(limiter.limit, 16)
+
+        for _ in range(4):
+            self.assertTrue(limiter.try_acquire("a.com"))
+        self.assertEqual(limiter.release("a.com", 0.01, 429), (16, 8, '429'))
+        # The other three were in flight at the old limit and do not halve it again
+        for _ in range(3):
+            self.assertIsNone(limiter.release("a.com", None))
+        self.assertEqual(limiter.limit, 8)
+        self.assertEqual(limiter.decreases, 1)
+        self.assertEqual(limiter.host_limit("a.com"), 8)
+
+        self.run_window(limiter)
+        self.assertEqual(limiter.limit, 9)
+        self.assertEqual(limiter.peak, 16)
+
+    def test_host_limit_and_unused_limit(self):
+        """Test that one host cannot take every slot and that an unused limit does not grow"""
+        limiter = AdaptiveConcurrency(8, floor=4, host_ceiling=2)
+        self.assertEqual(self.run_window(limiter, "a.com"), 2)
+        self.assertEqual(limiter.limit, 4)
+        self.assertTrue(limiter.try_acquire("b.com"))
+
+    def test_latency_rise_shrinks_limit(self):
+        """Test that a window much slower than the best one takes 10% off the limit"""
+        limiter = AdaptiveConcurrency(64, host_ceiling=64)
+        for _ in range(6):
+            self.run_window(limiter, latency=0.01)
+        self.assertEqual(limiter.limit, 64)
+        self.run_window(limiter, latency=0.1)
+        self.assertEqual(limiter.limit, 57)
+        self.assertEqual(limiter.decreases, 1)
+
+    def test_retry_after(self):
+        """Test Retry-After seconds, dates, garbage and the cap"""
+        self.assertEqual(retry_after({'Retry-After': '3'}), 3.0)
+        self.assertEqual(retry_after({'Retry-After': '100000'}), 300)
+        self.assertEqual(retry_after({'Retry-After': 'soon'}), 0.0)
+        self.assertEqual(retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}), 0.0)
+        self.assertEqual(retry_after(None), 0.0)
+
+    def test_crawl_backs_off_on_429(self):
+        """Test that a crawl lowers its concurrency against a throttling server and reports it"""
+        server, base_url = start_site_server(ThrottleHandler)
+        crawlers = [WebCrawler([base_url + "/0"], 30, 10, 8, 2, politeness_delay=0, adaptive_concurrency=True)]
+        if AIOHTTP_AVAILABLE:
+            crawlers.append(AsyncWebCrawler([base_url + "/0"], 30, 10, 8, 2, politeness_delay=0,
+                                            adaptive_concurrency=True, max_connections=8))
+        try:
+            for crawler in crawlers:
+                with self.assertLogs('MyWebCrowler', level='INFO') as logs:
+                    results = crawler.crawl()
+                self.assertGreater(len(results), 10)
+                self.assertGreaterEqual(crawler.concurrency.decreases, 1)
+                self.assertLessEqual(crawler.concurrency.limit, 4)
+                self.assertGreaterEqual(crawler.metrics.total('host_throttled'), 1)
+                self.assertIn("crawler_concurrency_limit ", crawler.metrics.render())
+                self.assertTrue(any("Concurrency " in line and "after 429" in line for line in logs.output))
+        finally:
+            stop_site_server(server)
+
+
+STORY = " ".join(f"word{number * 7919 % 1000} sentence{number % 13}" for number in range(600))
+
+
+class DuplicateHandler(BaseHTTPRequestHandler):
+    """Serves a story, its print version with other links, and an unrelated page"""
+    pages = {
+        "/": '<html><head><title>Front</title></head><body><a href="/story">S</a><a href="/story/print">P</a>'
+             '<a href="/other">O</a></body></html>',
+        "/story": f'<html><head><title>Story</title></head><body><p>{STORY}</p><a href="/more">M</a></body></html>',
+        "/story/print": f'<html><head><title>Story (print)</title></head><body><p>{STORY}</p><p>Printed from the site</p>'
+                        f'<a href="/hidden">H</a></body></html>',
+        "/other": '<html><head><title>Other</title></head><body><p>Something else entirely, about the weather '
+                  'and the trains and nothing like the story.</p></body></html>',
+        "/more": '<html><head><title>More</title></head><body></body></html>',
+        "/hidden": '<html><head><title>Hidden</title></head><body></body></html>',
+    }
+
+    def do_GET(self):
+        data = self.pages[self.path].encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestNearDuplicates(unittest.TestCase):
+    """Test cases for SimHash near-duplicate detection"""
+
+    def test_simhash_distance(self):
+        """Test that a small edit changes few bits and another text changes about half"""
+        edited = STORY.replace("word0 sentence0", "changed", 1) + " printed"
+        other = " ".join(f"other{number * 31 % 997}" for number in range(600))
+        self.assertLessEqual(bin(simhash(STORY) ^ simhash(edited)).count('1'), 3)
+        self.assertGreater(bin(simhash(STORY) ^ simhash(other)).count('1'), 16)
+        self.assertEqual(simhash(STORY.upper()), simhash(STORY))
+        self.assertEqual(simhash(""), 0)
+
+    def test_index_bands(self):
+        """Test that the index finds fingerprints up to max_distance bits away, in every band"""
+        index = SimHashIndex(3)
+        self.assertEqual(index.add(0x0123456789abcdef, 1), 1)
+        self.assertEqual(index.add(0x0123456789abcdef ^ (1 << 63 | 1 << 20 | 1), 2), 1)
+        self.assertEqual(index.add(0x0123456789abcdef ^ 0xf, 3), 3)
+        self.assertIsNone(index.find(0xfedcba9876543210))
+        self.assertEqual(len(index), 2)
+
+    def test_parsers_agree(self):
+        """Test that every parser backend adds the fingerprint only when asked"""
+        html = DuplicateHandler.pages["/story"]
+        expected = simhash(f"Story {STORY} M")
+        for parser in PARSERS:
+            if parser == 'lxml' and not LXML_AVAILABLE:
+                continue
+            self.assertNotIn('simhash', parse_page(html, "http://x/", parser)[0])
+            fingerprint = parse_page(html, "http://x/", parser, fingerprint=True)[0]['simhash']
+            self.assertEqual(len(fingerprint), 16)
+            self.assertLessEqual(bin(int(fingerprint, 16) ^ expected).count('1'), 3)
+
+    def test_crawl_skips_duplicate_links(self):
+        """Test that the print version is clustered with the story and its links are not followed"""
+        server, base_url = start_site_server(DuplicateHandler)
+        try:
+            crawler = WebCrawler([base_url], 20, 5, 1, 1, politeness_delay=0, near_duplicates=True)
+            results = crawler.crawl()
+        finally:
+            stop_site_server(server)
+        self.assertIn(base_url + "/more", results)
+        self.assertNotIn(base_url + "/hidden", results)
+        story, printed = results[base_url + "/story"], results[base_url + "/story/print"]
+        self.assertEqual(story['duplicate_cluster'], story['id'])
+        self.assertEqual(printed['duplicate_cluster'], story['id'])
+        self.assertNotEqual(results[base_url + "/other"]['duplicate_cluster'], story['id'])
+        self.assertEqual(results[base_url + "/more"]['duplicate_cluster'], results[base_url + "/more"]['id'])
+        self.assertEqual(crawler.metrics.total('near_duplicates'), 1)
+
+
+class ChangingHandler(BaseHTTPRequestHandler):
+    """Serves a front page that changes and links a new story on every fetch, and a page that never changes"""
+    hits = Counter()
+
+    def do_GET(self):
+        ChangingHandler.hits[self.path] += 1
+        if self.path == "/":
+            count = ChangingHandler.hits["/"]
+            body = (f'<html><head><title>Front {count}</title></head><body><a href="/static">S</a>'
+                    f'<a href="/news/{count}">N</a></body></html>')
+        else:
+            body = '<html><head><title>Static</title></head><body>Same</body></html>'
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestContinuousCrawl(unittest.TestCase):
+    """Test cases for revisit scheduling in continuous mode"""
+
+    def test_change_rate_and_due_order(self):
+        """Test that pages that keep changing come due sooner and stalest first"""
+        scheduler = RevisitScheduler(min_interval=10, max_interval=1000, initial_interval=100)
+        for url in ("http://x/front", "http://x/static"):
+            scheduler.record(url, 0, 0, "a", now=0)
+        self.assertEqual(scheduler.pages["http://x/front"][7], 100 * math.log(2))
+        for now, digest in ((100, "b"), (200, "c"), (300, "d")):
+            self.assertTrue(scheduler.record("http://x/front", 0, 0, digest, now=now))
+            self.assertFalse(scheduler.record("http://x/static", 0, 1, "a", now=now))
+        # Three changes in three revisits, 100 s apart: rate = ln(3.5 / 0.5) * 3 / 300
+        self.assertAlmostEqual(scheduler.pages["http://x/front"][7], 300 + math.log(2) / (math.log(7) / 100))
+        self.assertEqual(scheduler.pages["http://x/static"][7], 1300)
+        self.assertEqual((scheduler.fetched, scheduler.changed), (6, 3))
+
+        self.assertEqual(scheduler.pop_due(10, now=309), [])
+        due = scheduler.pop_due(10, now=2000)
+        self.assertEqual([url for url, _, _ in due], ["http://x/front", "http://x/static"])
+        self.assertGreater(due[0][2], due[1][2])
+        self.assertTrue(scheduler.take("http://x/front"))
+        self.assertFalse(scheduler.take("http://x/front"))
+
+    def test_revisits_not_queued_come_due_again(self):
+        """Test that a due page that was turned away or never taken is offered again after min_interval"""
+        scheduler = RevisitScheduler(min_interval=10, max_interval=1000, initial_interval=100)
+        scheduler.record("http://x/rejected", 0, 0, "a", now=0)
+        scheduler.record("http://x/evicted", 0, 1, "a", now=0)
+        self.assertEqual(len(scheduler.pop_due(10, now=200)), 2)
+        scheduler.reschedule("http://x/rejected", now=200)
+        self.assertNotIn("http://x/rejected", scheduler.scheduled)
+        self.assertEqual(scheduler.pop_due(10, now=209), [])
+        due = scheduler.pop_due(10, now=210)
+        self.assertEqual(sorted(url for url, _, _ in due), ["http://x/evicted", "http://x/rejected"])
+
+    def test_full_frontier_does_not_lose_revisits(self):
+        """Test that feed_revisits reschedules a due page the frontier rejected"""
+        crawler = WebCrawler(["http://x/"], 5, 5, 2, 1, politeness_delay=0, continuous=True,
+                             revisit_rate=50, min_revisit_interval=0.2, frontier_capacity=1)
+        crawler.revisits.record("http://x/page", 1, 0, "a", now=0)
+        crawler.start_revisits()
+        time.sleep(0.1)
+        crawler.stop_revisits()
+        self.assertNotIn("http://x/page", crawler.url_queue.queued)
+        self.assertNotIn("http://x/page", crawler.revisits.scheduled)
+        self.assertGreater(crawler.revisits.pages["http://x/page"][7], time.time())
+        crawler.revisits.close()
+
+    def test_continuous_crawl(self):
+        """Test that a changing page is revisited more often, ids stay and the schedule survives a restart"""
+        server, base_url = start_site_server(ChangingHandler)
+        ChangingHandler.hits.clear()
+        with tempfile.TemporaryDirectory() as directory:
+            options = dict(politeness_delay=0, continuous=True, revisit_file=os.path.join(directory, "revisits.db"),
+                           revisit_rate=50, min_revisit_interval=0.2, initial_revisit_interval=0.2,
+                           max_revisit_interval=3)
+            try:
+                crawler = WebCrawler([base_url], 5, 5, 2, 1, search_index=True, **options)
+                crawl_thread = threading.Thread(target=crawler.crawl)
+                crawl_thread.start()
+                time.sleep(4)
+                crawler.stop_requested = True
+                crawl_thread.join()
+            finally:
+                stop_site_server(server)
+
+            self.assertEqual(crawler.total_pages_crawled, 5)
+            self.assertEqual(len(crawler.crawl_results), 5)
+            self.assertEqual(crawler.crawl_results[base_url]['id'], 0)
+            self.assertGreaterEqual(ChangingHandler.hits["/"], 2 * ChangingHandler.hits["/static"])
+            self.assertGreaterEqual(ChangingHandler.hits["/static"], 2)
+            self.assertGreater(crawler.revisits.changed, 0)
+            # Revisits replace the page's index entry
+            self.assertEqual(len(crawler.search_index), 5)
+            self.assertEqual(crawler.search_index.search(title="front"),
+                             [(0, base_url, crawler.crawl_results[base_url]['title'])])
+            front, static = crawler.revisits.pages[base_url], crawler.revisits.pages[base_url + "/static"]
+            self.assertGreater(crawler.revisits.rate(front), crawler.revisits.rate(static))
+            crawler.revisits.close()
+
+            restarted = WebCrawler([base_url], 5, 5, 2, 1, **options)
+            self.assertEqual(len(restarted.revisits), 5)
+            self.assertEqual(restarted.total_pages_crawled, 5)
+            self.assertIn(base_url + "/", restarted.visited_urls)
+            self.assertEqual(restarted.revisits.pages[base_url][:7], front[:7])
+            restarted.revisits.close()
+
+
+CZECH_PAGE = ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1250">'
+              '<title>Čeština</title></head><body><h1>Žluťoučký kůň</h1><p>úpěl ďábelské ódy</p></body></html>')
+
+
+class CharsetHandler(BaseHTTPRequestHandler):
+    """Serves pages whose charset is only given by a <meta> tag or only by the headers"""
+    pages = {
+        "/": ("text/html", CZECH_PAGE.encode('cp1250')),
+        "/header": ("text/html; charset=ISO-8859-2", '<html><head><title>Čeština</title></head></html>'.encode('iso-8859-2')),
+    }
+
+    def do_GET(self):
+        content_type, data = self.pages[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCharsets(unittest.TestCase):
+    """Test cases for parsing raw bytes with a sniffed charset"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server(CharsetHandler)
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_site_server(cls.server)
+
+    def test_sniff_order(self):
+        """Test that a BOM beats the header, the header beats <meta>, and UTF-8 is the default"""
+        body = CZECH_PAGE.encode('cp1250')
+        self.assertEqual(sniff_charset({}, body), 'cp1250')
+        self.assertEqual(sniff_charset({'Content-Type': 'text/html; charset="ISO-8859-2"'}, body), 'iso8859-2')
+        self.assertEqual(sniff_charset({'Content-Type': 'text/html; charset=bogus'}, body), 'cp1250')
+        self.assertEqual(sniff_charset({'Content-Type': 'text/html; charset=latin-1'}, b'\xef\xbb\xbf<p>'), 'utf-8')
+        self.assertEqual(sniff_charset(None, b'<meta charset="utf-16">'), 'utf-8')
+        self.assertEqual(sniff_charset(None, b'<html></html>'), 'utf-8')
+        self.assertEqual(sniff_charset(None, b' ' * 1024 + b'<meta charset="koi8-r">'), 'utf-8')
+
+    def test_bytes_match_text(self):
+        """Test that every parser gives the same result for the bytes as for the decoded text"""
+        body = CZECH_PAGE.encode('cp1250')
+        for parser in PARSERS:
+            if parser == 'lxml' and not LXML_AVAILABLE:
+                continue
+            for fingerprint in (False, True):
+                expected = parse_page(CZECH_PAGE, "http://x/", parser, fingerprint)
+                self.assertEqual(parse_page(body, "http://x/", parser, fingerprint), expected)
+                self.assertEqual(parse_page(body, "http://x/", parser, fingerprint, 'cp1250'), expected)
+            self.assertEqual(expected[0]['title'], "Čeština")
+
+    def test_crawl_decodes_pages(self):
+        """Test that the crawler decodes pages by <meta> and by header, streamed or not"""
+        for parser, stream in (('html.parser', False), ('html.parser', True), ('stream', True)):
+            crawler = WebCrawler([self.base_url, self.base_url + "/header"], 5, 1, 1, 1, parser=parser,
+                                 politeness_delay=0, stream_downloads=stream)
+            results = crawler.crawl()
+            self.assertEqual(results[self.base_url]['headings']['h1'], ["Žluťoučký kůň"])
+            self.assertEqual(results[self.base_url + "/header"]['title'], "Čeština")
+
+    @unittest.skipUnless(AIOHTTP_AVAILABLE, "aiohttp is not installed")
+    def test_async_engine(self):
+        """Test that the async engine parses the same bytes"""
+        crawler = AsyncWebCrawler([self.base_url, self.base_url + "/header"], 5, 1, 1, 1, politeness_delay=0)
+        results = crawler.crawl()
+        self.assertEqual(results[self.base_url]['headings']['h1'], ["Žluťoučký kůň"])
+        self.assertEqual(results[self.base_url + "/header"]['title'], "Čeština")
+
+
+class FanoutHandler(BaseHTTPRequestHandler):
+    """Serves a tree of pages, each linking to ten children; endless unless pages is set"""
+    pages = None
+
+    def do_GET(self):
+        number = int(self.path.strip('/') or 0)
+        if self.pages is not None and number >= self.pages:
+            self.send_error(404)
+            return
+        links = "".join(f'<a href="/{number * 10 + child}">{child}</a>' for child in range(1, 11))
+        data = f"<html><head><title>Page {number}</title></head><body>{links}</body></html>".encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWorkerAccounting(unittest.TestCase):
+    """Test cases for the page budget, batched results and the striped visited set"""
+
+    def test_budget_reservations(self):
+        """Test that reserved and used slots together never exceed the limit"""
+        budget = PageBudget(2)
+        self.assertTrue(budget.reserve(0))
+        self.assertTrue(budget.reserve(0))
+        self.assertFalse(budget.reserve(0))
+        budget.count()
+        budget.release()
+        self.assertFalse(budget.reserve(0))
+        budget.release()
+        self.assertTrue(budget.take())
+        self.assertFalse(budget.take())
+        self.assertTrue(budget.exhausted())
+        self.assertFalse(budget.reserve(5))
+        self.assertEqual([budget.next_id(), budget.next_id()], [0, 1])
+        self.assertTrue(PageBudget().reserve(0))
+
+    def test_striped_seen_set(self):
+        """Test that concurrent check-and-add lets exactly one thread claim each URL"""
+        seen = StripedSeenSet('hashed', 1000, stripes=8)
+        claimed = Counter()
+        urls = [f"http://example.com/{number}" for number in range(500)]
+
+        def claim():
+            for url in urls:
+                if seen.add_new(url):
+                    claimed[url] += 1
+
+        threads = [threading.Thread(target=claim) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(seen), 500)
+        self.assertEqual(set(claimed.values()), {1})
+        self.assertIn(urls[0], seen)
+        self.assertNotIn("http://example.com/other", seen)
+
+    def test_crawl_stops_at_max_pages(self):
+        """Test that many workers store exactly max_pages pages with distinct ids"""
+        server, base_url = start_site_server(FanoutHandler)
+        try:
+            crawler = WebCrawler([base_url], 25, 5, 16, 1, politeness_delay=0)
+            results = crawler.crawl()
+        finally:
+            stop_site_server(server)
+        self.assertEqual(len(results), 25)
+        self.assertEqual(crawler.total_pages_crawled, 25)
+        self.assertEqual(sorted(page_info['id'] for page_info in results.values()), list(range(25)))
+        self.assertEqual(crawler.budget.reserved, 0)
+
+    def test_crawl_ends_when_frontier_drains(self):
+        """Test that workers stop together once a site smaller than max_pages is crawled"""
+        class SmallSiteHandler(FanoutHandler):
+            pages = 20
+
+        server, base_url = start_site_server(SmallSiteHandler)
+        try:
+            crawler = WebCrawler([base_url], 21, 5, 8, 2, politeness_delay=0)
+            start = time.monotonic()
+            results = crawler.crawl()
+            elapsed = time.monotonic() - start
+        finally:
+            stop_site_server(server)
+        self.assertEqual(len(results), 20)
+        self.assertLess(elapsed, 4)
+        self.assertEqual(crawler.budget.reserved, 0)
+
+
+class TestDnsCache(unittest.TestCase):
+    """Test cases for the DNS cache, its prefetching and the getaddrinfo hook"""
+
+    def setUp(self):
+        self.calls = Counter()
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def fake_resolver(self, host, port, family=0, type=0, proto=0, flags=0):
+        with self.lock:
+            self.calls[host] += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if host.endswith(".invalid"):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', 0))]
+
+    def test_ttl_and_negative_cache(self):
+        """Test that answers are reused until they expire and failures are cached too"""
+        cache = DnsCache(ttl=0.2, negative_ttl=60)
+        cache.resolver = self.fake_resolver
+        self.assertEqual(cache.lookup("Example.com")[0][4], ('10.0.0.1', 0))
+        cache.lookup("example.com")
+        self.assertEqual(self.calls["example.com"], 1)
+        time.sleep(0.25)
+        cache.lookup("example.com")
+        self.assertEqual(self.calls["example.com"], 2)
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                cache.lookup("missing.invalid")
+        self.assertEqual(self.calls["missing.invalid"], 1)
+        self.assertEqual((cache.hits, cache.negative_hits, cache.misses, cache.failures), (1, 1, 3, 1))
+
+    def test_concurrency_and_sharing(self):
+        """Test that prefetches stay within the limit and concurrent lookups share one resolution"""
+        cache = DnsCache(max_concurrency=2)
+        cache.resolver = self.fake_resolver
+        for number in range(6):
+            cache.prefetch(f"host{number}.com")
+        cache.prefetch("10.0.0.2")
+        threads = [threading.Thread(target=cache.lookup, args=("host0.com",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cache.lookup("host5.com")
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(cache.prefetches, 6)
+        self.assertEqual(self.calls["host0.com"], 1)
+        self.assertNotIn("10.0.0.2", self.calls)
+
+    def test_getaddrinfo_hook(self):
+        """Test that the hook adds the port, passes other lookups through and is removed again"""
+        original = socket.getaddrinfo
+        cache = DnsCache()
+        cache.install()
+        try:
+            cache.resolver = self.fake_resolver
+            self.assertEqual(socket.getaddrinfo("example.com", 8080, 0, socket.SOCK_STREAM)[0][4], ('10.0.0.1', 8080))
+            self.assertEqual(socket.getaddrinfo("127.0.0.1", 80)[0][4][0], "127.0.0.1")
+            with self.assertRaises(socket.gaierror):
+                socket.getaddrinfo("example.com", 80, socket.AF_INET6)
+        finally:
+            cache.uninstall()
+        self.assertIs(socket.getaddrinfo, original)
+
+    def test_shared_hook(self):
+        """Test that two caches share one hook and can be uninstalled in any order"""
+        original = socket.getaddrinfo
+        first, second = DnsCache(), DnsCache()
+        second.resolver = self.fake_resolver
+        first.install()
+        second.install()
+        try:
+            first.uninstall()
+            self.assertIsNot(socket.getaddrinfo, original)
+            self.assertEqual(socket.getaddrinfo("example.com", 80)[0][4], ('10.0.0.1', 80))
+            self.assertEqual(len(second), 1)
+        finally:
+            second.uninstall()
+        self.assertIs(socket.getaddrinfo, original)
+        self.assertIsNone(DnsCache.system_getaddrinfo)
+
+        second.close()
+        self.assertIsNone(second.pool)
+        second.entries.clear()
+        self.assertEqual(second.lookup("example.com")[0][4], ('10.0.0.1', 0))
+        second.close()
+
+    def check_crawl(self, crawler_class, **options):
+        server, base_url = start_site_server()
+        base_url = base_url.replace("127.0.0.1", "localhost")
+        original = socket.getaddrinfo
+        try:
+            crawler = crawler_class([base_url], 20, 5, 2, 1, politeness_delay=0, dns_cache=True, **options)
+            results = crawler.crawl()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(len(results), 6)
+        self.assertEqual(crawler.dns.resolutions, 1)
+        self.assertEqual(crawler.dns.prefetches, 1)
+        self.assertGreaterEqual(crawler.dns.hits, 6)
+        self.assertEqual(crawler.metrics.histograms['resolve'].count, 1)
+        self.assertIs(socket.getaddrinfo, original)
+        self.assertIsNone(crawler.dns.pool)
+
+    def test_crawl_resolves_once(self):
+        """Test that a crawl resolves its host once, ahead of the first fetch"""
+        self.check_crawl(WebCrawler)
+
+    @unittest.skipUnless(AIOHTTP_AVAILABLE, "aiohttp is not installed")
+    def test_async_engine(self):
+        """Test that the async engine resolves through the same cache"""
+        self.check_crawl(AsyncWebCrawler)
+
+
+class MultiHostHandler(BaseHTTPRequestHandler):
+    """Serves /0 to /9 on every port in ports; each page links to the next page on the next port"""
+    ports = []
+
+    def do_GET(self):
+        number = int(self.path.strip('/') or 0)
+        ports = MultiHostHandler.ports
+        next_port = ports[(ports.index(self.server.server_address[1]) + 1) % len(ports)]
+        data = (f'<html><head><title>Page {number}</title></head><body>'
+                f'<a href="http://127.0.0.1:{next_port}/{(number + 1) % 10}">Next host</a>'
+                f'<a href="/{(number * 3 + 1) % 10}">Same host</a></body></html>').encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_cluster_node(start_url, nodes, index, results):
+    crawler = WebCrawler([start_url], 100, 20, 4, 2, politeness_delay=0, cluster_nodes=nodes, node_index=index)
+    crawled = crawler.crawl()
+    results.put((index, {url: page_info['id'] for url, page_info in crawled.items()}, crawler.cluster.sent))
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class TestCluster(unittest.TestCase):
+    """Test cases for crawling with several cluster nodes"""
+
+    def test_hash_ring(self):
+        """Test that hosts spread over the nodes and a new node only takes hosts over"""
+        hosts = [f"host{number}.example" for number in range(2000)]
+        ring = HashRing(["a:1", "b:2", "c:3", "d:4"])
+        owners = [ring.owner(host) for host in hosts]
+        for node in range(4):
+            self.assertGreater(owners.count(node), 300)
+        self.assertEqual(ring.owner("HOST1.example"), ring.owner("host1.example"))
+
+        grown = HashRing(["a:1", "b:2", "c:3", "d:4", "e:5"])
+        moved = [host for host, owner in zip(hosts, owners) if grown.owner(host) != owner]
+        self.assertTrue(all(grown.owner(host) == 4 for host in moved))
+        self.assertLess(len(moved), 700)
+
+    def test_processes_merge_results(self):
+        """Test that three node processes split four hosts and node 0 returns every page once"""
+        servers = [start_site_server(MultiHostHandler)[0] for _ in range(4)]
+        MultiHostHandler.ports = [server.server_address[1] for server in servers]
+        nodes = [f"127.0.0.1:{free_port()}" for _ in range(3)]
+        start_url = f"http://127.0.0.1:{MultiHostHandler.ports[0]}/0"
+
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [context.Process(target=run_cluster_node, args=(start_url, nodes, index, results))
+                     for index in range(3)]
+        try:
+            for process in processes:
+                process.start()
+            shards = {}
+            for _ in processes:
+                index, crawled, sent = results.get(timeout=120)
+                shards[index] = (crawled, sent)
+            for process in processes:
+                process.join(30)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for server in servers:
+                stop_site_server(server)
+
+        expected = {f"http://127.0.0.1:{port}/{number}" for port in MultiHostHandler.ports for number in range(10)}
+        merged = shards[0][0]
+        self.assertEqual(set(merged), expected)
+        self.assertEqual(sorted(merged.values()), list(range(40)))
+        ring = HashRing(nodes)
+        for index in (1, 2):
+            self.assertTrue(all(ring.owner(urlsplit(url).netloc) == index for url in shards[index][0]))
+        self.assertGreater(sum(sent for _, sent in shards.values()), 0)
+
+
+@unittest.skipUnless(AIOHTTP_AVAILABLE, "aiohttp is not installed")
+class TestAsyncWebCrawler(unittest.TestCase):
+    """Test cases for the asyncio crawl engine"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = start_site_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_same_results_as_threaded_engine(self):
+        """Test that both engines return the same crawl_results shape"""
+        start_url = self.base_url + "/"
+        threaded = WebCrawler([start_url], 20, 5, 2, 1).crawl()
+        crawler = AsyncWebCrawler([start_url], 20, 5, 2, 1, max_connections=8, max_connections_per_host=4)
+        async_results = crawler.crawl()
+
+        self.assertEqual(set(async_results), set(threaded))
+        self.assertEqual(len(async_results), 6)
+        self.assertEqual(crawler.total_pages_crawled, 6)
+        for url, data in async_results.items():
+            self.assertEqual(set(data), set(threaded[url]))
+            self.assertEqual(data['title'], threaded[url]['title'])
+        self.assertEqual(sorted(data['id'] for data in async_results.values()), list(range(6)))
+
+    def test_max_pages_and_depth(self):
+        """Test that max_pages is exact and max_depth is respected"""
+        results = AsyncWebCrawler([self.base_url + "/"], 3, 5, 2, 1, max_connections=50).crawl()
+        self.assertEqual(len(results), 3)
+
+        results = AsyncWebCrawler([self.base_url + "/"], 20, 1, 2, 1).crawl()
+        self.assertEqual(set(results), {self.base_url + path for path in ("/", "/a", "/b")})
+
+    def test_parser_pool(self):
+        """Test that parsing in a process pool gives the same results in both engines"""
+        start_url = self.base_url + "/"
+        inline = AsyncWebCrawler([start_url], 20, 5, 2, 1).crawl()
+
+        for crawler_class in (WebCrawler, AsyncWebCrawler):
+            crawler = crawler_class([start_url], 20, 5, 2, 1, politeness_delay=0, parser_workers=2)
+            results = crawler.crawl()
+
+            self.assertIsNone(crawler.parser_pool)
+            self.assertEqual(set(results), set(inline))
+            for url, data in results.items():
+                self.assertEqual(data['title'], inline[url]['title'])
+                self.assertEqual(data['headings'], inline[url]['headings'])
+
+    def test_blocking_calls_run_off_the_loop(self):
+        """Test that SQLite calls and parsing never run on the event loop and only fetched URLs are completed"""
+        calls = []
+        completed = []
+
+        def recorder(function):
+            def record(*args, **kwargs):
+                calls.append((function.__name__, threading.current_thread() is threading.main_thread()))
+                return function(*args, **kwargs)
+            return record
+
+        def complete_url(state, url):
+            completed.append(url)
+            return original_complete_url(state, url)
+
+        original_complete_url = CrawlState.complete_url
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.object(CrawlState, 'complete_url', recorder(complete_url)), \
+                patch.object(CrawlState, 'store_page', recorder(CrawlState.store_page)), \
+                patch.object(HttpCache, 'lookup', recorder(HttpCache.lookup)), \
+                patch.object(HttpCache, 'store', recorder(HttpCache.store)), \
+                patch.object(WebCrawler, 'run_parser', recorder(WebCrawler.run_parser)):
+            crawler = AsyncWebCrawler([self.base_url + "/"], 3, 5, 2, 1, politeness_delay=0,
+                                      state_file=os.path.join(directory, "state.db"),
+                                      cache_file=os.path.join(directory, "cache.db"))
+            results = crawler.crawl()
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual({name for name, _ in calls},
+                         {'complete_url', 'store_page', 'lookup', 'store', 'run_parser'})
+        self.assertEqual([name for name, on_loop in calls if on_loop], [])
+        self.assertEqual(sorted(completed), sorted(results))
+        self.assertIsNone(crawler.db_executor)
+
+    def test_build_crawler_engine(self):
+        """Test that the engine option selects the crawler class"""
+        config = CrawlerConfig(start_urls=[self.base_url], max_pages=5, max_depth=2, max_workers=2, timeout=1,
+                               wanted_title="", wanted_header="", engine="async", max_connections=500)
+        crawler = build_crawler(config)
+        self.assertIsInstance(crawler, AsyncWebCrawler)
+        self.assertEqual(crawler.max_connections, 500)
+
+        config.engine = "threads"
+        self.assertNotIsInstance(build_crawler(config), AsyncWebCrawler)
+
+
+if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file